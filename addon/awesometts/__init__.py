@@ -41,10 +41,17 @@ import aqt
 
 from . import conversion as to, gui, paths, service
 from .bundle import Bundle
+from .cache import Cache
 from .config import Config
+from .failures import Failures
+from .metrics import Metrics
+from .placement import Placement
 from .player import Player
+from .reactor import Reactor
+from .responses import Responses
 from .router import Router
 from .text import Sanitizer
+from .transcoder import Transcoder
 from .updates import Updates
 
 
@@ -75,11 +82,16 @@ config = Config(
               table='general',
               normalize=to.normalized_ascii),
     cols=[
+        ('audio_loudness', 'integer', False, to.lax_bool, int),
+        ('audio_trim', 'integer', False, to.lax_bool, int),
         ('automaticAnswers', 'integer', True, to.lax_bool, int),
         ('automatic_answers_errors', 'integer', True, to.lax_bool, int),
         ('automaticQuestions', 'integer', True, to.lax_bool, int),
         ('automatic_questions_errors', 'integer', True, to.lax_bool, int),
         ('cache_days', 'integer', 70, int, int),
+        ('cache_max_files', 'integer', 0, int, int),
+        ('cache_max_mb', 'integer', 1024, int, int),
+        ('cache_policy', 'text', 'lru', str, str),
         ('delay_answers_onthefly', 'integer', 0, int, int),
         ('delay_answers_stored_ours', 'integer', 0, int, int),
         ('delay_answers_stored_theirs', 'integer', 0, int, int),
@@ -113,8 +125,14 @@ config = Config(
          to.nullable_key, to.nullable_int),
         ('launch_templater', 'integer', Qt.ControlModifier | Qt.Key_T,
          to.nullable_key, to.nullable_int),
+        ('net_reactor', 'integer', False, to.lax_bool, int),
         ('otf_only_revealed_cloze', 'integer', False, to.lax_bool, int),
         ('otf_remove_hints', 'integer', False, to.lax_bool, int),
+        ('pool_internet', 'integer', 2, int, int),
+        ('pool_local', 'integer', 1, int, int),
+        ('pool_total', 'integer', 4, int, int),
+        ('prefetch_budget', 'integer', 30, int, int),
+        ('prefetch_depth', 'integer', 2, int, int),
         ('presets', 'text', {}, to.deserialized_dict, to.compact_json),
         ('spec_note_count', 'text', '', unicode, unicode),
         ('spec_note_count_wrap', 'integer', True, to.lax_bool, int),
@@ -139,8 +157,6 @@ config = Config(
         ('templater_field', 'text', 'Front', unicode, unicode),
         ('templater_hide', 'text', 'normal', str, str),
         ('templater_target', 'text', 'front', str, str),
-        ('throttle_sleep', 'integer', 30, int, int),
-        ('throttle_threshold', 'integer', 10, int, int),
         ('TTS_KEY_A', 'integer', Qt.Key_F4, to.nullable_key, to.nullable_int),
         ('TTS_KEY_Q', 'integer', Qt.Key_F3, to.nullable_key, to.nullable_int),
         ('updates_enabled', 'integer', True, to.lax_bool, int),
@@ -152,6 +168,39 @@ config = Config(
     ],
 )
 
+cache = Cache(
+    db=Bundle(path=paths.CACHE_INDEX,
+              table='files',
+              aliases='aliases'),
+    directory=paths.CACHE,
+    logger=logger,
+)
+
+failures = Failures(
+    db=Bundle(path=paths.CACHE_INDEX,
+              table='failures'),
+    logger=logger,
+)
+
+metrics = Metrics(
+    db=Bundle(path=paths.CACHE_INDEX,
+              table='metrics'),
+    logger=logger,
+)
+
+placement = Placement(logger=logger)
+
+connections = Reactor(logger=logger,
+                      enabled=lambda: config['net_reactor'])
+
+responses = Responses(
+    db=Bundle(path=paths.CACHE_INDEX,
+              table='responses'),
+    logger=logger,
+)
+
+transcoder = Transcoder(logger=logger)
+
 player = Player(
     anki=Bundle(
         mw=aqt.mw,
@@ -214,12 +263,19 @@ router = Router(
                     lame_flags=lambda: config['lame_flags'],
                     normalize=to.normalized_ascii,
                     logger=logger,
-                    ecosystem=Bundle(web=WEB, agent=AGENT)),
+                    ecosystem=Bundle(web=WEB, agent=AGENT),
+                    connections=connections,
+                    responses=responses,
+                    transcoder=transcoder),
     ),
-    cache_dir=paths.CACHE,
+    cache=cache,
+    failures=failures,
+    metrics=metrics,
+    placement=placement,
     temp_dir=join(paths.TEMP, '_awesometts_scratch_' + str(int(time()))),
     logger=logger,
     config=config,
+    transcoder=transcoder,
 )
 
 updates = Updates(
@@ -244,6 +300,7 @@ STRIP_TEMPLATE_POSTHTML = [
 ]
 
 addon = Bundle(
+    cache=cache,
     config=config,
     downloader=Bundle(
         base=aqt.addons.GetAddons,
@@ -258,10 +315,14 @@ addon = Bundle(
         ),
         fail=lambda message: aqt.utils.showCritical(message, aqt.mw),
     ),
+    failures=failures,
     logger=logger,
+    metrics=metrics,
     paths=Bundle(cache=paths.CACHE,
                  is_link=paths.ADDON_IS_LINKED),
+    placement=placement,
     player=player,
+    responses=responses,
     router=router,
     strip=Bundle(
         # n.b. cloze substitution logic happens first in both modes because:
@@ -357,6 +418,7 @@ addon = Bundle(
             univ=Sanitizer(rules=['sounds_univ', 'filenames'], logger=logger),
         ),
     ),
+    transcoder=transcoder,
     updates=updates,
     version=VERSION,
     web=WEB,
@@ -436,42 +498,44 @@ def browser_menus():
 
 
 def cache_control():
-    """Registers a hook to handle cache control on session exits."""
+    """
+    Registers hooks to reconcile the cache index with the cache
+    directory on session starts and to flush it on session exits, and
+    keeps the cache's eviction budget in step with the configuration.
 
-    def on_unload_profile():
-        """
-        Finds MP3s in the cache directory older than the user's
-        configured cache limit and attempts to remove them.
-        """
+    Eviction itself happens incrementally in the background whenever
+    the cache goes over budget; only a zero-day limit (i.e. clear
+    everything) is still handled as one pass at exit.
+    """
 
-        from os import listdir, unlink
+    def on_budget_change(new_config):
+        """Passes the user's cache limits on to the cache."""
 
-        cache = paths.CACHE
+        cache.budget(max_bytes=new_config['cache_max_mb'] * 1048576,
+                     max_files=new_config['cache_max_files'],
+                     max_age=new_config['cache_days'] * 86400,
+                     policy=new_config['cache_policy'])
 
-        try:
-            filenames = listdir(cache)
-        except:  # allow silent failure, pylint:disable=bare-except
-            return
-        if not filenames:
-            return
-
-        prospects = (join(cache, filename) for filename in filenames)
+    def on_unload_profile():
+        """
+        Persists batched hit times to the cache index and statistics to
+        the metrics table, clearing the cache (and the cached responses
+        that services scraped) entirely if the user has asked for that.
+        """
 
-        if config['cache_days']:
-            from os.path import getmtime
+        cache.flush()
+        metrics.flush()
 
-            limit = time() - 86400 * config['cache_days']
-            targets = (prospect for prospect in prospects
-                       if getmtime(prospect) < limit)
-        else:
-            targets = prospects
+        if not config['cache_days']:
+            cache.clear()
+            responses.clear()
 
-        for target in targets:
-            try:
-                unlink(target)
-            except:  # skip broken files, pylint:disable=bare-except
-                pass
+    on_budget_change(config)
+    config.bind(['cache_days', 'cache_max_files', 'cache_max_mb',
+                 'cache_policy'], on_budget_change)
 
+    anki.hooks.addHook('profileLoaded',
+                       lambda: cache.reconcile(background=True))
     anki.hooks.addHook('unloadProfile', on_unload_profile)
 
 
@@ -590,7 +654,8 @@ def reviewer_hooks():
 
     anki.hooks.addHook(
         'showQuestion',
-        lambda: reviewer.card_handler('question', aqt.mw.reviewer.card),
+        lambda: (reviewer.card_handler('question', aqt.mw.reviewer.card),
+                 reviewer.prefetch_handler()),
     )
 
     anki.hooks.addHook(
@@ -598,6 +663,8 @@ def reviewer_hooks():
         lambda: reviewer.card_handler('answer', aqt.mw.reviewer.card),
     )
 
+    anki.hooks.addHook('reviewCleanup', reviewer.prefetch_cancel)
+
     # shortcut-triggered playback
 
     reviewer_filter = gui.Filter(
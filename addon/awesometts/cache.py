@@ -0,0 +1,560 @@
+# -*- coding: utf-8 -*-
+
+# AwesomeTTS text-to-speech add-on for Anki
+#
+# Copyright (C) 2014-2016  Anki AwesomeTTS Development Team
+# Copyright (C) 2014-2016  Dave Shifflett
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Persistent index of cached media files
+"""
+
+__all__ = ['Cache']
+
+from heapq import nsmallest
+import os
+import os.path
+import re
+import sqlite3
+from threading import Lock, Thread
+from time import sleep, time
+
+
+RE_FILENAME = re.compile(r'^(\w+?)-([0-9a-f]{8})-([0-9a-f]{8})-'
+                         r'([0-9a-f]{8})-([0-9a-f]{8})-([0-9a-f]{8})\.mp3$')
+RE_PARTIAL = re.compile(r'\.[0-9a-z]{8}\.part$')  # see Service.path_partial
+
+PARTIAL_SECS = 3600   # age at which a partial download is considered dead
+
+EVICT_BATCH = 50      # most files removed per background eviction step
+EVICT_PAUSE = 0.25    # seconds to yield between background eviction steps
+
+LOCK_SECS = 10  # most to wait when another connection is writing the file
+
+
+class Cache(object):
+    """
+    Keeps an index of the media files in the cache directory, keyed by
+    the SHA-1 cache key embedded in each filename, so that statistics
+    and cleanup do not need to list the directory, and a cache hit is
+    answered from memory without touching the file system.
+
+    The index is persisted in an SQLite3 table, but held in memory once
+    loaded. New and removed files are written through immediately, while
+    last-hit times are batched and only written out by flush().
+
+    Files that are added to or removed from the cache directory behind
+    the index's back are picked up by reconcile(), which can be run in
+    the background, and individually whenever hit() sees a file that the
+    index does not know about. Files that are deleted are otherwise
+    only noticed by callers that fail to open them (see remove()).
+
+    Once a budget() has been set, files are evicted in small batches on
+    a background thread whenever the cache goes over budget, using the
+    last-hit times (LRU) or hit counts (LFU) that the index records.
+
+    When the way cache paths are derived changes, resolve() maps new
+    paths onto files still stored under their old ones, remembering
+    each such alias (tagged with the version of the scheme it was made
+    for) in a second table.
+    """
+
+    __slots__ = [
+        '_aliases',     # dict of keys mapping to (target key, version)
+        '_budget',      # dict w/ bytes, files, age, and policy limits
+        '_bytes',       # running total of the indexed file sizes
+        '_connection',  # open SQLite3 connection, shared w/ background thread
+        '_db',          # bundle with path to database, table names
+        '_dirty',       # set of keys whose last-hit times need persisting
+        '_entries',     # in-memory lookup of keys to entry dicts
+        '_evicting',    # True while the background eviction thread runs
+        '_lock',        # guards the entries and the connection
+        '_logger',      # logger-like interface with debug(), info(), etc.
+        'directory',    # path to the directory holding the media files
+    ]
+
+    def __init__(self, db, directory, logger):
+        """
+        The database specification should be a bundle, with:
+
+            - path: full path to the index database
+            - table: table name for the files
+            - aliases: table name for the aliases
+
+        The directory is the one where Router writes its media files.
+        """
+
+        self._budget = dict(bytes=0, files=0, age=0, policy='lru')
+        self._db = db
+        self._dirty = set()
+        self._evicting = False
+        self._lock = Lock()
+        self._logger = logger
+        self.directory = directory
+
+        # n.b. the file is shared with the failures, metrics, and responses
+        # tables, each on its own connection, so every one of them waits
+        # out the others' locks (for up to LOCK_SECS) rather than failing
+        self._connection = sqlite3.connect(self._db.path,
+                                           check_same_thread=False,
+                                           timeout=LOCK_SECS)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS %s (key text PRIMARY KEY, '
+            'filename text, service text, size integer, created real, '
+            'hit real, hits integer)' % self._db.table
+        )
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS %s (key text PRIMARY KEY, '
+            'target text, version integer)' % self._db.aliases
+        )
+        if 'hits' not in [row[1] for row in self._connection.execute(
+                'PRAGMA table_info(%s)' % self._db.table)]:
+            self._logger.info("Adding hit counts to the cache index")
+            self._connection.execute('ALTER TABLE %s ADD COLUMN hits integer '
+                                     'DEFAULT 0' % self._db.table)
+        self._connection.commit()
+
+        self._entries = {
+            row[0]: dict(filename=row[1], service=row[2], size=row[3],
+                         created=row[4], hit=row[5], hits=row[6] or 0)
+            for row in self._connection.execute(
+                'SELECT key, filename, service, size, created, hit, hits '
+                'FROM %s' % self._db.table
+            )
+        }
+        self._bytes = sum(entry['size'] for entry in self._entries.values())
+
+        self._aliases = {
+            row[0]: (row[1], row[2])
+            for row in self._connection.execute(
+                'SELECT key, target, version FROM %s' % self._db.aliases
+            )
+        }
+
+        self._logger.debug("Loaded %d entries from the cache index",
+                           len(self._entries))
+
+    def hit(self, path):
+        """
+        Returns True if the given cache path is present, updating its
+        last-hit time.
+
+        The index is trusted for paths that it has, so a hit costs no
+        stat call. A file that has since been deleted behind our back is
+        dropped by reconcile(), or by remove() once a caller fails to
+        open it. If the path is not in the index, the file system is
+        checked as a fallback, adopting the file into the index if it
+        does exist.
+        """
+
+        key = self._key(path)
+        if not key:
+            return os.path.exists(path)
+
+        with self._lock:
+            if key in self._entries:
+                entry = self._entries[key]
+                entry['hit'] = time()
+                entry['hits'] += 1
+                self._dirty.add(key)
+                return True
+
+        if os.path.exists(path):
+            self._logger.debug("Adopting %s into the cache index", path)
+            self.add(path)
+            return True
+
+        return False
+
+    def resolve(self, path, legacy, version):
+        """
+        Returns the path that a request for the given cache path should
+        use, which is the path itself unless the file is missing but is
+        stored under the path that legacy() returns, in which case that
+        path is returned and remembered as an alias for the given one.
+
+        Aliases are only honored if they were made for the given version
+        of the path scheme; others are dropped as they are found.
+
+        Only the index is consulted, not the file system, so a lookup
+        costs no stat calls. Files that were added behind the index's
+        back are not found here until reconcile() has picked them up.
+        """
+
+        key = self._key(path)
+        if not key:
+            return path
+
+        with self._lock:
+            if key in self._entries:
+                return path
+
+            alias = self._aliases.get(key)
+            if alias:
+                target = self._entries.get(alias[0])
+                if target and alias[1] == version:
+                    return os.path.join(self.directory, target['filename'])
+
+                del self._aliases[key]
+                self._connection.execute('DELETE FROM %s WHERE key=?' %
+                                         self._db.aliases, (key,))
+                self._connection.commit()
+
+        legacy_path = legacy()
+        legacy_key = self._key(legacy_path)
+        if not legacy_key or legacy_key == key:
+            return path
+
+        with self._lock:
+            if legacy_key not in self._entries:
+                return path
+
+            self._logger.debug("Aliasing %s to %s", path, legacy_path)
+            self._aliases[key] = legacy_key, version
+            self._connection.execute(
+                'INSERT OR REPLACE INTO %s VALUES (?, ?, ?)' %
+                self._db.aliases, (key, legacy_key, version),
+            )
+            self._connection.commit()
+
+        return legacy_path
+
+    def add(self, path):
+        """Indexes a freshly-written media file at the given path."""
+
+        key = self._key(path)
+        if not key:
+            return
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+
+        filename = os.path.basename(path)
+        entry = dict(filename=filename,
+                     service=RE_FILENAME.match(filename).group(1),
+                     size=stat.st_size, created=stat.st_mtime, hit=time(),
+                     hits=0)
+
+        with self._lock:
+            self._forget(key)
+            self._entries[key] = entry
+            self._bytes += entry['size']
+            self._write([(key, entry)], [])
+
+        self._evict_soon()
+
+    def remove(self, path):
+        """Unlinks the file at the given path and drops it from the index."""
+
+        key = self._key(path)
+
+        try:
+            os.unlink(path)
+        except OSError:
+            if os.path.exists(path):
+                raise
+
+        if key:
+            with self._lock:
+                self._forget(key)
+                self._write([], [key])
+
+    def stats(self):
+        """Returns a tuple with the number of files and total bytes."""
+
+        with self._lock:
+            return len(self._entries), self._bytes
+
+    def paths(self, where=None):
+        """
+        Returns the paths for all indexed files, optionally filtered by
+        the given callable, which receives each entry dict.
+        """
+
+        with self._lock:
+            return [os.path.join(self.directory, entry['filename'])
+                    for entry in self._entries.values()
+                    if not where or where(entry)]
+
+    def clear(self, where=None):
+        """
+        Removes the indexed files (optionally only those matching the
+        given callable, see paths()), returning a tuple with the count
+        of successes and failures.
+        """
+
+        count_error = count_success = 0
+
+        for path in self.paths(where):
+            try:
+                self.remove(path)
+                count_success += 1
+            except StandardError:
+                count_error += 1
+
+        return count_success, count_error
+
+    def flush(self):
+        """Persists any batched last-hit times to the database."""
+
+        with self._lock:
+            if not self._dirty:
+                return
+
+            self._connection.executemany(
+                'UPDATE %s SET hit=?, hits=? WHERE key=?' % self._db.table,
+                [(self._entries[key]['hit'], self._entries[key]['hits'], key)
+                 for key in self._dirty if key in self._entries],
+            )
+            self._connection.commit()
+
+            self._logger.debug("Flushed %d hit time(s) to the cache index",
+                               len(self._dirty))
+            self._dirty = set()
+
+    def reconcile(self, background=False):
+        """
+        Compares the index against the cache directory, indexing files
+        that were added behind our back and forgetting files that have
+        since disappeared. Partial files left over from downloads that
+        never finished (e.g. Anki crashed) are deleted.
+
+        If background is True, the work is done in a daemon thread.
+        """
+
+        if background:
+            thread = Thread(target=self.reconcile)
+            thread.daemon = True
+            thread.start()
+            return
+
+        try:
+            filenames = os.listdir(self.directory)
+        except OSError:
+            filenames = []
+
+        found = {}
+        for filename in filenames:
+            match = RE_FILENAME.match(filename)
+            if match:
+                found[''.join(match.groups()[1:])] = filename
+            elif RE_PARTIAL.search(filename):
+                self._remove_partial(os.path.join(self.directory, filename))
+
+        with self._lock:
+            missing = [key for key in self._entries if key not in found]
+            unknown = [(key, filename) for key, filename in found.items()
+                       if key not in self._entries]
+
+        additions = []
+        for key, filename in unknown:
+            try:
+                stat = os.stat(os.path.join(self.directory, filename))
+            except OSError:
+                continue
+            additions.append((key, dict(
+                filename=filename,
+                service=RE_FILENAME.match(filename).group(1),
+                size=stat.st_size,
+                created=stat.st_mtime,
+                hit=stat.st_mtime,
+                hits=0,
+            )))
+
+        if not (missing or additions):
+            return
+
+        with self._lock:
+            for key in missing:
+                self._forget(key)
+            for key, entry in additions:
+                if key not in self._entries:
+                    self._entries[key] = entry
+                    self._bytes += entry['size']
+            self._write(additions, missing)
+
+        self._logger.info("Reconciled cache index (%d added, %d forgotten)",
+                          len(additions), len(missing))
+
+        self._evict_soon()
+
+    def budget(self, max_bytes=0, max_files=0, max_age=0, policy='lru'):
+        """
+        Sets the limits that the cache should be held to, where a zero
+        means unlimited:
+
+            - max_bytes: total size of all files
+            - max_files: total number of files
+            - max_age: seconds since a file was last hit
+
+        The policy decides which files go first when the cache is over
+        its size or count budget, either 'lru' (least recently hit) or
+        'lfu' (least frequently hit, then least recently hit).
+
+        If the cache is already over the new budget, a background
+        eviction is started.
+        """
+
+        assert policy in ['lru', 'lfu'], "policy must be 'lru' or 'lfu'"
+
+        with self._lock:
+            self._budget = dict(bytes=max_bytes, files=max_files,
+                                age=max_age, policy=policy)
+
+        self._evict_soon(check_age=True)
+
+    def evict(self, limit=EVICT_BATCH):
+        """
+        Removes up to the given number of files that are expired or that
+        put the cache over budget, returning how many were removed. If
+        the return value equals the limit, more files may need to go.
+        """
+
+        with self._lock:
+            budget = dict(self._budget)
+            items = self._entries.items()
+            over_bytes = budget['bytes'] and self._bytes - budget['bytes']
+            over_files = budget['files'] and \
+                len(self._entries) - budget['files']
+
+        victims = []
+
+        if budget['age']:
+            limit_hit = time() - budget['age']
+            victims = [key for key, entry in items
+                       if entry['hit'] < limit_hit][:limit]
+
+        if len(victims) < limit and (over_bytes > 0 or over_files > 0):
+            already = set(victims)
+            ranking = (
+                (lambda item: (item[1]['hits'], item[1]['hit']))
+                if budget['policy'] == 'lfu'
+                else (lambda item: item[1]['hit'])
+            )
+
+            for key, entry in nsmallest(limit, items, key=ranking):
+                if len(victims) >= limit or \
+                   (over_bytes <= 0 and over_files <= 0):
+                    break
+                if key not in already:
+                    victims.append(key)
+                    over_bytes -= entry['size']
+                    over_files -= 1
+
+        lookup = dict(items)
+        for key in victims:
+            try:
+                self.remove(os.path.join(self.directory,
+                                         lookup[key]['filename']))
+            except StandardError:
+                with self._lock:  # skip broken files, but stop retrying them
+                    self._forget(key)
+                    self._write([], [key])
+
+        if victims:
+            self._logger.debug("Evicted %d file(s) from the cache",
+                               len(victims))
+
+        return len(victims)
+
+    def _evict_soon(self, check_age=False):
+        """
+        Starts the background eviction thread if the cache is over its
+        size or count budget (or if check_age is set and there is an age
+        limit), unless it is already running.
+        """
+
+        with self._lock:
+            if self._evicting:
+                return
+
+            budget = self._budget
+            if not ((budget['bytes'] and self._bytes > budget['bytes']) or
+                    (budget['files'] and
+                     len(self._entries) > budget['files']) or
+                    (check_age and budget['age'])):
+                return
+
+            self._evicting = True
+
+        def run():
+            """Evicts in small batches, yielding in between."""
+
+            try:
+                while self.evict() == EVICT_BATCH:
+                    sleep(EVICT_PAUSE)
+            finally:
+                with self._lock:
+                    self._evicting = False
+
+        thread = Thread(target=run)
+        thread.daemon = True
+        thread.start()
+
+    def _remove_partial(self, path):
+        """Deletes the partial file at path if it has been abandoned."""
+
+        try:
+            if time() - os.path.getmtime(path) > PARTIAL_SECS:
+                os.unlink(path)
+                self._logger.debug("Deleted abandoned partial file %s", path)
+        except OSError:
+            pass
+
+    def _forget(self, key):
+        """
+        Drops the given key from the in-memory index, keeping the byte
+        total up to date. Must be called while holding the lock.
+        """
+
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._bytes -= entry['size']
+        self._dirty.discard(key)
+
+    def _write(self, upserts, deletes):
+        """
+        Persists the given (key, entry) tuples and removes the given
+        keys. Must be called while holding the lock.
+        """
+
+        if upserts:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO %s VALUES (?, ?, ?, ?, ?, ?, ?)' %
+                self._db.table,
+                [(key, entry['filename'], entry['service'], entry['size'],
+                  entry['created'], entry['hit'], entry['hits'])
+                 for key, entry in upserts],
+            )
+        if deletes:
+            self._connection.executemany(
+                'DELETE FROM %s WHERE key=?' % self._db.table,
+                [(key,) for key in deletes],
+            )
+        self._connection.commit()
+
+    @staticmethod
+    def _key(path):
+        """
+        Returns the 40-character SHA-1 cache key from the given path's
+        filename, or None if the filename is not one of ours.
+        """
+
+        match = RE_FILENAME.match(os.path.basename(path))
+        return ''.join(match.groups()[1:]) if match else None
+
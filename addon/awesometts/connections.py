@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+
+# AwesomeTTS text-to-speech add-on for Anki
+#
+# Copyright (C) 2014-2016  Anki AwesomeTTS Development Team
+# Copyright (C) 2014-2016  Dave Shifflett
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Persistent HTTP(S) connections shared by the services
+"""
+
+__all__ = ['Connections']
+
+from base64 import b64encode
+from httplib import HTTPConnection, HTTPSConnection, HTTPException
+import socket
+from StringIO import StringIO
+from threading import Condition
+from time import time
+from urllib import getproxies, proxy_bypass, unquote
+from urllib2 import HTTPError, URLError
+from urlparse import urljoin, urlsplit
+
+
+IDLE_SECS = 15  # default time an unused connection is kept open for
+PER_HOST = 4    # default most connections open to one host at once
+WAIT_SECS = 60  # most time to wait for another thread to free a connection
+
+MAX_REDIRECTS = 10  # same as urllib2's HTTPRedirectHandler
+IDEMPOTENT = ['DELETE', 'GET', 'HEAD', 'OPTIONS', 'PUT']  # safe to resend
+REDIRECTS = [301, 302, 303, 307]
+
+
+class Connections(object):
+    """
+    Keeps HTTP and HTTPS connections open (i.e. keep-alive) for reuse by
+    all services and worker threads, so that a service that fetches
+    several pieces of split text or several pages from the same host
+    does not make a new TCP (and TLS) handshake for every one of them.
+
+    At most per_host connections to a given host (or through a given
+    proxy) are open at once; a thread needing another one waits until
+    one is released. Connections that have sat unused for longer than
+    idle_secs are closed instead of reused, as servers usually drop
+    them by then, and a request on a reused connection that turns out
+    to have been dropped is retried on a new connection, as long as it
+    is safe to send again (i.e. its method is idempotent, or the
+    connection failed before the whole request could be sent).
+
+    To behave like urllib2.urlopen(), proxies are found from the
+    environment (e.g. HTTP_PROXY, NO_PROXY, or the system settings on
+    Windows and Mac OS X), redirects are followed, and error statuses
+    are raised as urllib2.HTTPError.
+    """
+
+    __slots__ = [
+        '_condition',  # lock for the fields below; notified on release
+        '_idle',       # dict of keys to lists of (released, connection)
+        '_idle_secs',  # seconds that an unused connection is kept for
+        '_logger',     # logger-like interface with debug(), info(), etc.
+        '_open',       # dict of keys to counts of connections open, in use
+        '_per_host',   # most connections open per key at once
+    ]
+
+    def __init__(self, logger, per_host=PER_HOST, idle_secs=IDLE_SECS):
+        """
+        Initialize the empty pool. Keys are (scheme, host, proxy)
+        tuples, so connections through a proxy are pooled separately.
+        """
+
+        self._condition = Condition()
+        self._idle = {}
+        self._idle_secs = idle_secs
+        self._logger = logger
+        self._open = {}
+        self._per_host = per_host
+
+    def request(self, url, headers=None, data=None, method=None,
+                timeout=None):
+        """
+        Makes a request for the given URL, returning a response with
+        getcode(), info(), read(), and close(). The method defaults to
+        POST if data is given, or GET otherwise.
+
+        The response must be read to its end or closed by the caller;
+        only then is its connection available to other requests.
+        """
+
+        method = method or ('POST' if data is not None else 'GET')
+        headers = dict(headers or {})
+        if data is not None:
+            headers.setdefault('Content-Type',
+                               'application/x-www-form-urlencoded')
+
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self._send(url, headers, data, method, timeout)
+            code = response.getcode()
+            location = response.info().getheader('location') or \
+                response.info().getheader('uri')
+
+            if code in REDIRECTS and location and \
+                    not (code == 307 and method == 'POST'):
+                response.read()  # so that the connection can be reused
+                response.close()
+                url = urljoin(url, location)
+                if code != 307:
+                    method = 'GET'
+                    data = None
+                    headers.pop('Content-Type', None)
+                continue
+
+            if code >= 300:
+                body = response.read()
+                response.close()
+                raise HTTPError(url, code, response.reason, response.info(),
+                                StringIO(body))
+
+            return response
+
+        response.close()
+        raise HTTPError(url, code, "Too many redirects", response.info(),
+                        StringIO(''))
+
+    def _send(self, url, headers, data, method, timeout):
+        """
+        Sends a single request on a pooled connection, retrying it on a
+        new connection if a reused connection turns out to be dead.
+
+        A request that was sent in full (e.g. a POST whose dead
+        connection only showed when the response did not come) is only
+        retried if its method is idempotent, since the server might
+        have acted on it already.
+        """
+
+        scheme, host, path, query, _ = urlsplit(url)
+        if scheme not in ['http', 'https']:
+            raise URLError("unknown url type: %s" % scheme)
+        if not host:
+            raise URLError("no host given")
+
+        selector = (path or '/') + ('?' + query if query else '')
+        headers = dict(headers)
+        proxy, proxy_auth = self._proxy(scheme, host)
+
+        if proxy and scheme == 'http':
+            selector = '%s://%s%s' % (scheme, host, selector)
+            if proxy_auth:
+                headers['Proxy-Authorization'] = proxy_auth
+
+        key = (scheme, host, proxy)
+
+        while True:
+            connection, reused = self._acquire(key, proxy_auth)
+            connection.timeout = timeout
+            if connection.sock:
+                connection.sock.settimeout(timeout)
+
+            sent = False
+            try:
+                connection.request(method, selector, data, headers)
+                sent = True
+                response = connection.getresponse()
+
+            except (HTTPException, socket.error) as error:
+                self._release(key, connection, False)
+                if reused and not isinstance(error, socket.timeout) and \
+                        (method in IDEMPOTENT or not sent):
+                    self._logger.debug("Reused connection to %s was "
+                                       "dropped (%s); retrying", host, error)
+                    continue
+                if isinstance(error, socket.error):
+                    raise URLError(error)
+                raise
+
+            return _Response(self, key, connection, response, url)
+
+    def _acquire(self, key, proxy_auth):
+        """
+        Returns a connection for the given key and whether it is being
+        reused, waiting for one to be released if the key is at its
+        limit. Raises a socket.timeout if none becomes available.
+        """
+
+        with self._condition:
+            deadline = time() + WAIT_SECS
+
+            while True:
+                idle = self._idle.get(key)
+                now = time()
+
+                while idle and now - idle[0][0] > self._idle_secs:
+                    idle.pop(0)[1].close()  # least recently used are first
+                    self._open[key] -= 1
+
+                if idle:
+                    return idle.pop()[1], True  # most recently used
+
+                if self._open.get(key, 0) < self._per_host:
+                    self._open[key] = self._open.get(key, 0) + 1
+                    break
+
+                if now >= deadline:
+                    raise socket.timeout("No connection to %s became "
+                                         "available" % key[1])
+                self._condition.wait(deadline - now)
+
+        scheme, host, proxy = key
+        self._logger.debug("Opening connection to %s%s", host,
+                           " via %s" % proxy if proxy else "")
+
+        if scheme == 'https':
+            connection = HTTPSConnection(proxy or host)
+            if proxy:
+                connection.set_tunnel(
+                    host,
+                    headers={'Proxy-Authorization': proxy_auth}
+                    if proxy_auth else None,
+                )
+        else:
+            connection = HTTPConnection(proxy or host)
+
+        return connection, False
+
+    def _release(self, key, connection, reusable):
+        """
+        Returns the connection to the idle list for its key if it can
+        be reused, or closes it otherwise, waking any waiting thread.
+        """
+
+        with self._condition:
+            if reusable:
+                self._idle.setdefault(key, []).append((time(), connection))
+            else:
+                connection.close()
+                self._open[key] -= 1
+            self._condition.notify()
+
+    @staticmethod
+    def _proxy(scheme, host):
+        """
+        Returns the proxy's host and a Proxy-Authorization value (or
+        None) to use for the given scheme and host, or Nones if the
+        environment does not call for a proxy.
+        """
+
+        proxy = getproxies().get(scheme)
+        if not proxy or proxy_bypass(host.split(':')[0]):
+            return None, None
+
+        if '://' not in proxy:
+            proxy = 'http://' + proxy
+        netloc = urlsplit(proxy)[1]
+
+        if '@' not in netloc:
+            return netloc, None
+
+        userinfo, netloc = netloc.rsplit('@', 1)
+        return netloc, 'Basic ' + b64encode(unquote(userinfo))
+
+
+class _Response(object):
+    """
+    Wraps a response from one of the pooled connections, giving the
+    connection back to the pool once the response is read to its end
+    or closed.
+    """
+
+    __slots__ = [
+        '_connection',   # the connection, until given back to the pool
+        '_connections',  # Connections instance that the connection is from
+        '_key',          # key of the connection within the pool
+        '_response',     # the httplib.HTTPResponse being wrapped
+        'headers',       # the response headers, like urllib2's responses
+        'reason',        # the status message given by the server
+        'url',           # URL that was requested (after any redirects)
+    ]
+
+    def __init__(self, connections, key, connection, response, url):
+        """Wraps the response from the given pooled connection."""
+
+        self._connection = connection
+        self._connections = connections
+        self._key = key
+        self._response = response
+        self.headers = response.msg
+        self.reason = response.reason
+        self.url = url
+
+    def getcode(self):
+        """Returns the HTTP status code of the response."""
+
+        return self._response.status
+
+    def geturl(self):
+        """Returns the URL that was requested."""
+
+        return self.url
+
+    def info(self):
+        """Returns the response headers, as a mimetools.Message."""
+
+        return self._response.msg
+
+    def read(self, amount=None):
+        """
+        Reads the given number of bytes, or the whole remaining body if
+        no amount is given.
+        """
+
+        payload = self._response.read(amount) if amount \
+            else self._response.read()
+
+        if self._response.isclosed():  # i.e. body has been read to its end
+            self._give_back()
+        return payload
+
+    def close(self):
+        """
+        Finishes up with the response; if its body was not yet read to
+        the end, its connection cannot be reused.
+        """
+
+        self._give_back()
+
+    def _give_back(self):
+        """Releases the connection back to the pool, at most once."""
+
+        connection, self._connection = self._connection, None
+        if connection:
+            reusable = self._response.isclosed() and \
+                not self._response.will_close
+            self._response.close()
+            self._connections._release(  # pylint:disable=W0212
+                self._key, connection, reusable,
+            )
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+# AwesomeTTS text-to-speech add-on for Anki
+#
+# Copyright (C) 2014-2016  Anki AwesomeTTS Development Team
+# Copyright (C) 2014-2016  Dave Shifflett
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Persistent record of recently failed service calls
+"""
+
+__all__ = ['Failures']
+
+import codecs
+from heapq import heapify, heappop, heappush
+import os.path
+import sqlite3
+from time import localtime, strftime, time
+
+from .cache import LOCK_SECS
+
+
+class Failures(object):
+    """
+    Remembers which cache paths recently failed to generate, so that
+    known-bad input (e.g. a word that a dictionary service does not
+    have) is not sent to the service again until its entry expires.
+
+    Entries are persisted in an SQLite3 table so that they survive
+    between sessions, but held in memory once loaded. Each entry
+    carries its own expiry time, and a heap ordered by expiry lets
+    expired entries be dropped without scanning everything.
+
+    All access is expected to happen from the main thread.
+    """
+
+    __slots__ = [
+        '_connection',  # open SQLite3 connection
+        '_db',          # bundle with path to database, table name
+        '_entries',     # in-memory lookup of filenames to entry dicts
+        '_heap',        # list of (expires, filename), kept as a heap
+        '_logger',      # logger-like interface with debug(), info(), etc.
+    ]
+
+    def __init__(self, db, logger):
+        """
+        The database specification should be a bundle, with:
+
+            - path: full path to the database
+            - table: table name
+        """
+
+        self._db = db
+        self._logger = logger
+
+        # n.b. the file is shared with the cache index (see Cache)
+        self._connection = sqlite3.connect(self._db.path, timeout=LOCK_SECS)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS %s (filename text PRIMARY KEY, '
+            'service text, text text, message text, created real, '
+            'expires real)' % self._db.table
+        )
+        self._connection.execute('DELETE FROM %s WHERE expires <= ?' %
+                                 self._db.table, (time(),))
+        self._connection.commit()
+
+        self._entries = {
+            row[0]: dict(service=row[1], text=row[2], message=row[3],
+                         created=row[4], expires=row[5], exception=None)
+            for row in self._connection.execute(
+                'SELECT filename, service, text, message, created, expires '
+                'FROM %s' % self._db.table
+            )
+        }
+        self._heap = [(entry['expires'], filename)
+                      for filename, entry in self._entries.items()]
+        heapify(self._heap)
+
+        self._logger.debug("Loaded %d remembered failure(s)",
+                           len(self._entries))
+
+    def get(self, path):
+        """
+        Returns an exception for the given cache path if it failed
+        recently, or None otherwise.
+
+        Failures remembered from a previous session are returned as a
+        RuntimeError carrying the original message.
+        """
+
+        self._purge()
+
+        entry = self._entries.get(os.path.basename(path))
+        if not entry:
+            return None
+
+        if not entry['exception']:
+            entry['exception'] = RuntimeError(entry['message'])
+        return entry['exception']
+
+    def add(self, path, svc_id, text, exception, ttl):
+        """
+        Remembers that generating the given cache path for the service
+        and text raised the given exception, for ttl seconds.
+        """
+
+        filename = os.path.basename(path)
+        now = time()
+        entry = self._entries[filename] = dict(
+            service=svc_id,
+            text=text,
+            message=(exception.message
+                     if isinstance(getattr(exception, 'message', None),
+                                   basestring)
+                     else None) or format(exception),
+            created=now,
+            expires=now + ttl,
+            exception=exception,
+        )
+        heappush(self._heap, (entry['expires'], filename))
+
+        self._connection.execute(
+            'INSERT OR REPLACE INTO %s VALUES (?, ?, ?, ?, ?, ?)' %
+            self._db.table,
+            (filename, entry['service'], entry['text'], entry['message'],
+             entry['created'], entry['expires']),
+        )
+        self._connection.commit()
+
+    def count(self):
+        """Returns the number of failures that have not yet expired."""
+
+        self._purge()
+        return len(self._entries)
+
+    def services(self):
+        """
+        Returns a dict of service IDs to the number of unexpired
+        failures for that service.
+        """
+
+        self._purge()
+
+        counts = {}
+        for entry in self._entries.values():
+            counts[entry['service']] = counts.get(entry['service'], 0) + 1
+        return counts
+
+    def forget(self, svc_ids=None):
+        """
+        Forgets the failures for the given list of service IDs, or all
+        of them if no list is given, returning how many were dropped.
+
+        Stale heap items are left behind and skipped over later.
+        """
+
+        filenames = [filename
+                     for filename, entry in self._entries.items()
+                     if svc_ids is None or entry['service'] in svc_ids]
+
+        for filename in filenames:
+            del self._entries[filename]
+        if not self._entries:
+            self._heap = []
+
+        self._delete(filenames)
+        return len(filenames)
+
+    def export(self, path):
+        """
+        Writes the unexpired failures to the given path as UTF-8 text
+        with tab-separated columns, returning the number written.
+        """
+
+        self._purge()
+
+        def clean(value):
+            """Keeps values from breaking the row and column layout."""
+            return u' '.join(unicode(value or u'').split())
+
+        entries = sorted(self._entries.values(),
+                         key=lambda entry: (entry['service'],
+                                            entry['created']))
+
+        with codecs.open(path, 'w', 'utf-8') as output:
+            output.write(u'service\ttext\tmessage\tfailed\texpires\n')
+            for entry in entries:
+                output.write(u'\t'.join([
+                    clean(entry['service']),
+                    clean(entry['text']),
+                    clean(entry['message']),
+                    strftime('%Y-%m-%d %H:%M', localtime(entry['created'])),
+                    strftime('%Y-%m-%d %H:%M', localtime(entry['expires'])),
+                ]) + u'\n')
+
+        return len(entries)
+
+    def _purge(self):
+        """
+        Drops entries whose expiry time has passed, popping them off the
+        top of the heap; entries that have since been replaced or
+        forgotten have stale heap items, which are just discarded.
+        """
+
+        now = time()
+        expired = []
+
+        while self._heap and self._heap[0][0] <= now:
+            expires, filename = heappop(self._heap)
+            entry = self._entries.get(filename)
+            if entry and entry['expires'] == expires:
+                del self._entries[filename]
+                expired.append(filename)
+
+        if expired:
+            self._logger.debug("Expired %d remembered failure(s)",
+                               len(expired))
+            self._delete(expired)
+
+    def _delete(self, filenames):
+        """Removes the given filenames from the database."""
+
+        if not filenames:
+            return
+
+        self._connection.executemany(
+            'DELETE FROM %s WHERE filename=?' % self._db.table,
+            [(filename,) for filename in filenames],
+        )
+        self._connection.commit()
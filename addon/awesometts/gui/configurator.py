@@ -24,8 +24,6 @@
 __all__ = ['Configurator']
 
 from locale import format as locale
-import os
-import os.path
 from sys import platform
 
 from PyQt4 import QtCore, QtGui
@@ -44,22 +42,27 @@ class Configurator(Dialog):
     """Provides a dialog for configuring the add-on."""
 
     _PROPERTY_KEYS = [
+        'audio_loudness', 'audio_trim',
         'automatic_answers', 'automatic_answers_errors', 'automatic_questions',
-        'automatic_questions_errors', 'cache_days', 'delay_answers_onthefly',
+        'automatic_questions_errors', 'cache_days', 'cache_max_files',
+        'cache_max_mb', 'cache_policy', 'delay_answers_onthefly',
         'delay_answers_stored_ours', 'delay_answers_stored_theirs',
         'delay_questions_onthefly', 'delay_questions_stored_ours',
         'delay_questions_stored_theirs', 'ellip_note_newlines',
         'ellip_template_newlines', 'filenames', 'filenames_human',
         'lame_flags', 'launch_browser_generator', 'launch_browser_stripper',
         'launch_configurator', 'launch_editor_generator', 'launch_templater',
-        'otf_only_revealed_cloze', 'otf_remove_hints', 'spec_note_strip',
+        'net_reactor', 'otf_only_revealed_cloze', 'otf_remove_hints',
+        'pool_internet', 'pool_local', 'pool_total', 'prefetch_budget',
+        'prefetch_depth',
+        'spec_note_strip',
         'spec_note_ellipsize', 'spec_template_ellipsize', 'spec_note_count',
         'spec_note_count_wrap', 'spec_template_count',
         'spec_template_count_wrap', 'spec_template_strip', 'strip_note_braces',
         'strip_note_brackets', 'strip_note_parens', 'strip_template_braces',
         'strip_template_brackets', 'strip_template_parens', 'sub_note_cloze',
-        'sub_template_cloze', 'sul_note', 'sul_template', 'throttle_sleep',
-        'throttle_threshold', 'tts_key_a', 'tts_key_q', 'updates_enabled',
+        'sub_template_cloze', 'sul_note', 'sul_template', 'tts_key_a',
+        'tts_key_q', 'updates_enabled',
     ]
 
     _PROPERTY_WIDGETS = (Checkbox, QtGui.QComboBox, QtGui.QLineEdit,
@@ -123,6 +126,7 @@ class Configurator(Dialog):
             'automatic_answers', 'tts_key_a',
             'delay_answers_', "Answers / Backs of Cards",
         ))
+        vert.addWidget(self._ui_tabs_playback_prefetch())
         vert.addSpacing(self._SPACING)
         vert.addWidget(Label('Anki controls if and how to play [sound] '
                              'tags. See "Help" for more information.'))
@@ -183,6 +187,39 @@ class Configurator(Dialog):
         group.setLayout(layout)
         return group
 
+    def _ui_tabs_playback_prefetch(self):
+        """Returns the "Prefetching" input group."""
+
+        depth = QtGui.QSpinBox()
+        depth.setObjectName('prefetch_depth')
+        depth.setRange(0, 10)
+        depth.setSuffix(" cards")
+
+        budget = QtGui.QSpinBox()
+        budget.setObjectName('prefetch_budget')
+        budget.setRange(0, 600)
+        budget.setSingleStep(10)
+        budget.setSuffix(" downloads")
+
+        hor = QtGui.QHBoxLayout()
+        hor.addWidget(Label("Look ahead"))
+        hor.addWidget(depth)
+        hor.addWidget(Label("using at most"))
+        hor.addWidget(budget)
+        hor.addWidget(Label("per minute"))
+        hor.addStretch()
+
+        vert = QtGui.QVBoxLayout()
+        vert.addWidget(Note("While reviewing, AwesomeTTS can prepare the "
+                            "automatically-played <tts> tags of upcoming "
+                            "cards in the background. Use zero cards to turn "
+                            "this off, or zero downloads for no limit."))
+        vert.addLayout(hor)
+
+        group = QtGui.QGroupBox("Prefetching")
+        group.setLayout(vert)
+        return group
+
     def _ui_tabs_text(self):
         """Returns the "Text" tab."""
 
@@ -345,7 +382,8 @@ class Configurator(Dialog):
         vert = QtGui.QVBoxLayout()
         vert.addWidget(self._ui_tabs_mp3gen_filenames())
         vert.addWidget(self._ui_tabs_mp3gen_lame())
-        vert.addWidget(self._ui_tabs_mp3gen_throttle())
+        vert.addWidget(self._ui_tabs_mp3gen_polish())
+        vert.addWidget(self._ui_tabs_mp3gen_pool())
         vert.addStretch()
 
         tab = QtGui.QWidget()
@@ -407,37 +445,25 @@ class Configurator(Dialog):
         group.setLayout(vert)
         return group
 
-    def _ui_tabs_mp3gen_throttle(self):
-        """Returns the "Download Throttling" input group."""
-
-        threshold = QtGui.QSpinBox()
-        threshold.setObjectName('throttle_threshold')
-        threshold.setRange(5, 1000)
-        threshold.setSingleStep(5)
-        threshold.setSuffix(" operations")
-
-        sleep = QtGui.QSpinBox()
-        sleep.setObjectName('throttle_sleep')
-        sleep.setRange(15, 10800)
-        sleep.setSingleStep(15)
-        sleep.setSuffix(" seconds")
+    def _ui_tabs_mp3gen_polish(self):
+        """Returns the "Trimming and Leveling" input group."""
 
         hor = QtGui.QHBoxLayout()
-        hor.addWidget(Label("After "))
-        hor.addWidget(threshold)
-        hor.addWidget(Label(" sleep for "))
-        hor.addWidget(sleep)
+        hor.addWidget(Checkbox("trim silence from the start and end",
+                               'audio_trim'))
+        hor.addWidget(Checkbox("even out loudness", 'audio_loudness'))
         hor.addStretch()
 
-        rtr = self._addon.router
         vert = QtGui.QVBoxLayout()
-        vert.addWidget(Note("Tweak how often AwesomeTTS takes a break when "
-                            "mass downloading files from online services."))
+        vert.addWidget(Note("Clean up MP3s from every service as they are "
+                            "generated, using lame to decode and re-encode "
+                            "them."))
         vert.addLayout(hor)
-        vert.addWidget(Note("Affects %s." %
-                            ', '.join(rtr.by_trait(rtr.Trait.INTERNET))))
+        vert.addWidget(Note("Changing these makes new MP3s for text that "
+                            "was already generated, as it is next played or "
+                            "recorded."))
 
-        group = QtGui.QGroupBox("Download Throttling during Batch Processing")
+        group = QtGui.QGroupBox("Trimming and Leveling")
         group.setLayout(vert)
         return group
 
@@ -482,6 +508,48 @@ class Configurator(Dialog):
         tab.setLayout(vert)
         return tab
 
+    def _ui_tabs_mp3gen_pool(self):
+        """Returns the "Simultaneous Requests" input group."""
+
+        total = QtGui.QSpinBox()
+        total.setObjectName('pool_total')
+        total.setRange(1, 16)
+        total.setSuffix(" at once")
+
+        internet = QtGui.QSpinBox()
+        internet.setObjectName('pool_internet')
+        internet.setRange(1, 16)
+
+        local = QtGui.QSpinBox()
+        local.setObjectName('pool_local')
+        local.setRange(1, 16)
+
+        hor = QtGui.QHBoxLayout()
+        hor.addWidget(Label("Run up to"))
+        hor.addWidget(total)
+        hor.addWidget(Label("with at most"))
+        hor.addWidget(internet)
+        hor.addWidget(Label("per online and"))
+        hor.addWidget(local)
+        hor.addWidget(Label("per local service"))
+        hor.addStretch()
+
+        vert = QtGui.QVBoxLayout()
+        vert.addWidget(Note("Limit how many files AwesomeTTS generates at "
+                            "the same time. Requests beyond these limits "
+                            "wait their turn. Offline voices that get "
+                            "converted to MP3 (e.g. eSpeak) run on up to "
+                            "one file per CPU core even if these limits are "
+                            "lower, and converting to MP3 happens on at "
+                            "most one file per core regardless."))
+        vert.addLayout(hor)
+        vert.addWidget(Checkbox("run all web requests on a single network "
+                                "thread (experimental)", 'net_reactor'))
+
+        group = QtGui.QGroupBox("Simultaneous Requests")
+        group.setLayout(vert)
+        return group
+
     def _ui_tabs_advanced(self):
         """Returns the "Advanced" tab."""
 
@@ -489,6 +557,7 @@ class Configurator(Dialog):
         layout.addWidget(self._ui_tabs_advanced_presets())
         layout.addWidget(self._ui_tabs_advanced_update())
         layout.addWidget(self._ui_tabs_advanced_cache())
+        layout.addWidget(self._ui_tabs_advanced_metrics())
         layout.addStretch()
 
         tab = QtGui.QWidget()
@@ -552,16 +621,50 @@ class Configurator(Dialog):
         days.setSuffix(" days")
 
         hor = QtGui.QHBoxLayout()
-        hor.addWidget(Label("Delete files older than"))
+        hor.addWidget(Label("Delete files not played in"))
         hor.addWidget(days)
-        hor.addWidget(Label("at exit (zero clears everything)"))
+        hor.addWidget(Label("(zero clears everything at exit)"))
         hor.addStretch()
 
+        megabytes = QtGui.QSpinBox()
+        megabytes.setObjectName('cache_max_mb')
+        megabytes.setRange(0, 99999)
+        megabytes.setSingleStep(64)
+        megabytes.setSuffix(" MB")
+
+        files = QtGui.QSpinBox()
+        files.setObjectName('cache_max_files')
+        files.setRange(0, 999999)
+        files.setSingleStep(1000)
+        files.setSuffix(" files")
+
+        policy = QtGui.QComboBox()
+        policy.setObjectName('cache_policy')
+        policy.addItem("least recently played", 'lru')
+        policy.addItem("least often played", 'lfu')
+
+        limits = QtGui.QHBoxLayout()
+        limits.addWidget(Label("Keep at most"))
+        limits.addWidget(megabytes)
+        limits.addWidget(Label("and"))
+        limits.addWidget(files)
+        limits.addWidget(Label("(zero for no limit)"))
+        limits.addStretch()
+
+        evicts = QtGui.QHBoxLayout()
+        evicts.addWidget(Label("When over the limit, delete the"))
+        evicts.addWidget(policy)
+        evicts.addWidget(Label("files first"))
+        evicts.addStretch()
+
         layout = QtGui.QVBoxLayout()
         layout.addWidget(Note("AwesomeTTS caches generated audio files and "
-                              "remembers failures during each session to "
-                              "speed up repeated playback."))
+                              "remembers failures (for an hour, or a month "
+                              "for dictionary services) to speed up "
+                              "repeated playback."))
         layout.addLayout(hor)
+        layout.addLayout(limits)
+        layout.addLayout(evicts)
 
         abutton = QtGui.QPushButton("Delete Files")
         abutton.setObjectName('on_cache')
@@ -571,15 +674,45 @@ class Configurator(Dialog):
         fbutton.setObjectName('on_forget')
         fbutton.clicked.connect(lambda: self._on_forget_failures(fbutton))
 
+        ebutton = QtGui.QPushButton("Export Failures...")
+        ebutton.setObjectName('on_export_failures')
+        ebutton.clicked.connect(lambda: self._on_export_failures(ebutton))
+
         hor = QtGui.QHBoxLayout()
         hor.addWidget(abutton)
         hor.addWidget(fbutton)
+        hor.addWidget(ebutton)
         layout.addLayout(hor)
 
         group = QtGui.QGroupBox("Caching")
         group.setLayout(layout)
         return group
 
+    def _ui_tabs_advanced_metrics(self):
+        """Returns the "Statistics" group."""
+
+        sbutton = QtGui.QPushButton("Show Statistics...")
+        sbutton.clicked.connect(self._on_metrics_show)
+
+        rbutton = QtGui.QPushButton("Reset Statistics")
+        rbutton.setObjectName('on_metrics_reset')
+        rbutton.clicked.connect(lambda: self._on_metrics_reset(rbutton))
+
+        hor = QtGui.QHBoxLayout()
+        hor.addWidget(sbutton)
+        hor.addWidget(rbutton)
+        hor.addStretch()
+
+        layout = QtGui.QVBoxLayout()
+        layout.addWidget(Note("AwesomeTTS keeps track of cache hits, "
+                              "latency, downloads, and errors for each "
+                              "service, for this session and all time."))
+        layout.addLayout(hor)
+
+        group = QtGui.QGroupBox("Statistics")
+        group.setLayout(layout)
+        return group
+
     # Factories ##############################################################
 
     def _factory_shortcut(self, object_name):
@@ -624,27 +757,22 @@ class Configurator(Dialog):
                 widget.setModel(value)
 
         widget = self.findChild(QtGui.QPushButton, 'on_cache')
-        widget.atts_list = (
-            [filename for filename in os.listdir(self._addon.paths.cache)]
-            if os.path.isdir(self._addon.paths.cache) else []
-        )
-        if widget.atts_list:
+        count, size = self._addon.cache.stats()
+        if count:
             widget.setEnabled(True)
-            widget.setText("Delete Files (%s)" %
-                           locale("%d", len(widget.atts_list), grouping=True))
+            widget.setText("Delete Files (%s, %s MB)" % (
+                locale("%d", count, grouping=True),
+                locale("%.1f", size / 1048576.0, grouping=True),
+            ))
         else:
             widget.setEnabled(False)
             widget.setText("Delete Files")
 
-        widget = self.findChild(QtGui.QPushButton, 'on_forget')
-        fail_count = self._addon.router.get_failure_count()
-        if fail_count:
-            widget.setEnabled(True)
-            widget.setText("Forget Failures (%s)" %
-                           locale("%d", fail_count, grouping=True))
-        else:
-            widget.setEnabled(False)
-            widget.setText("Forget Failures")
+        self._update_failure_buttons()
+
+        widget = self.findChild(QtGui.QPushButton, 'on_metrics_reset')
+        widget.setEnabled(True)
+        widget.setText("Reset Statistics")
 
         super(Configurator, self).show(*args, **kwargs)
 
@@ -793,17 +921,11 @@ class Configurator(Dialog):
         )
 
     def _on_cache_clear(self, button):
-        """Attempts clear known files from cache."""
+        """Attempts clear known files and web responses from cache."""
 
         button.setEnabled(False)
-        count_error = count_success = 0
-
-        for filename in button.atts_list:
-            try:
-                os.unlink(os.path.join(self._addon.paths.cache, filename))
-                count_success += 1
-            except:  # capture all exceptions, pylint:disable=W0702
-                count_error += 1
+        count_success, count_error = self._addon.cache.clear()
+        self._addon.responses.clear()
 
         if count_error:
             if count_success:
@@ -815,8 +937,101 @@ class Configurator(Dialog):
             button.setText("emptied cache")
 
     def _on_forget_failures(self, button):
-        """Tells the router to forget all cached failures."""
+        """
+        Offers a menu to forget the remembered failures for all services
+        or just one of them.
+        """
+
+        counts = self._addon.failures.services()
+        if not counts:
+            return
+
+        menu = QtGui.QMenu(self)
+        menu.addAction(
+            "All services (%s)" % locale("%d", sum(counts.values()),
+                                         grouping=True),
+            lambda: self._addon.router.forget_failures(),
+        )
+        menu.addSeparator()
+        for svc_id, count in sorted(counts.items()):
+            menu.addAction(
+                "%s (%s)" % (svc_id, locale("%d", count, grouping=True)),
+                lambda svc_id=svc_id:
+                self._addon.router.forget_failures([svc_id]),
+            )
+
+        menu.exec_(button.mapToGlobal(QtCore.QPoint(0, button.height())))
+        self._update_failure_buttons()
+
+    def _on_export_failures(self, button):
+        """Saves the remembered failures to a file of the user's choice."""
+
+        path = QtGui.QFileDialog.getSaveFileName(
+            self,
+            "Export Failures",
+            "awesometts-failures.txt",
+            "Text files (*.txt)",
+        )
+        if not path:
+            return
+
+        try:
+            count = self._addon.failures.export(path)
+        except IOError as io_error:
+            self._alerts("Unable to export failures.\n\n%s" %
+                         (io_error.strerror or io_error), self)
+        else:
+            button.setText("exported %s" % locale("%d", count,
+                                                  grouping=True))
+
+    def _on_metrics_show(self):
+        """Displays the statistics dump in a read-only text box."""
+
+        metrics = self._addon.metrics
 
+        text = QtGui.QPlainTextEdit()
+        text.setReadOnly(True)
+        text.setLineWrapMode(QtGui.QPlainTextEdit.NoWrap)
+        text.setFont(QtGui.QFont('Courier'))
+        text.setPlainText("\n\n".join([
+            "THIS SESSION", metrics.dump(),
+            "ALL TIME", metrics.dump(lifetime=True),
+        ]))
+
+        buttons = QtGui.QDialogButtonBox(QtGui.QDialogButtonBox.Close)
+
+        layout = QtGui.QVBoxLayout()
+        layout.addWidget(text)
+        layout.addWidget(buttons)
+
+        dialog = QtGui.QDialog(self)
+        dialog.setWindowTitle("AwesomeTTS: Statistics")
+        dialog.setLayout(layout)
+        dialog.resize(600, 400)
+        buttons.rejected.connect(dialog.reject)
+        dialog.exec_()
+
+    def _on_metrics_reset(self, button):
+        """Forgets all statistics kept for the services."""
+
+        self._addon.metrics.reset()
         button.setEnabled(False)
-        self._addon.router.forget_failures()
-        button.setText("forgot failures")
+        button.setText("statistics reset")
+
+    def _update_failure_buttons(self):
+        """Refreshes the failure count shown on the failure buttons."""
+
+        fail_count = self._addon.router.get_failure_count()
+
+        widget = self.findChild(QtGui.QPushButton, 'on_forget')
+        if fail_count:
+            widget.setEnabled(True)
+            widget.setText("Forget Failures (%s)" %
+                           locale("%d", fail_count, grouping=True))
+        else:
+            widget.setEnabled(False)
+            widget.setText("Forget Failures")
+
+        widget = self.findChild(QtGui.QPushButton, 'on_export_failures')
+        widget.setEnabled(bool(fail_count))
+        widget.setText("Export Failures...")
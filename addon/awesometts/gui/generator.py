@@ -287,53 +287,103 @@ class BrowserGenerator(ServiceDialog):
                 'fail': 0,  # calls which resulted in an exception
             },
             'exceptions': {},
-            'throttling': {
-                'calls': {},  # unthrottled download calls made per service
-                'sleep': self._addon.config['throttle_sleep'],
-                'threshold': self._addon.config['throttle_threshold'],
-            },
         }
 
         self._browser.mw.checkpoint("AwesomeTTS Batch Update")
         self._process['progress'].show()
         self._browser.model.beginReset()
 
-        self._accept_next()
+        if svc_id.startswith('group:'):
+            self._accept_next()
+        else:
+            self._accept_batch()
 
     def _accept_abort(self):
         """
         Flags that the user has requested that processing stops.
         """
 
-        self._process['aborted'] = True
+        proc = self._process
+        proc['aborted'] = True
+
+        if 'batch' in proc:
+            proc['batch'].cancel()
+
+    def _accept_batch(self):
+        """
+        Hand every note in the queue to the router at once, letting it
+        answer cached and duplicate phrases without extra service calls
+        and run the remaining ones concurrently.
+        """
+
+        proc = self._process
+        source = proc['fields']['source']
+        svc_id = proc['service']['id']
+        want_human = (self._addon.config['filenames_human'] or u'{{text}}' if
+                      self._addon.config['filenames'] == 'human' else False)
+
+        requests = [
+            dict(
+                svc_id=svc_id,
+                text=self._addon.strip.from_note(note[source]),
+                options=proc['service']['options'],
+                want_human=want_human,
+                note=note,
+            )
+            for note in proc['queue']
+        ]
+        proc['queue'] = []
+
+        def okay(request, path):
+            """Count the success and update the note."""
+
+            note = request['note']
+            media = self._browser.mw.col.media
+            self._addon.placement.media(path, media)
+            try:
+                filename = media.addFile(path)
+            except EnvironmentError as error:
+                self._addon.router.forget_missing(path)
+                fail(request, error)
+                return
+            dest = proc['fields']['dest']
+            note[dest] = self._accept_next_output(note[dest], filename)
+            proc['counts']['done'] += 1
+            proc['counts']['okay'] += 1
+            note.flush()
+            self._accept_update(request['text'])
+
+        def fail(request, exception):
+            """Count the failure and the unique message."""
+
+            proc['counts']['done'] += 1
+            self._accept_fail(exception)
+            self._accept_update(request['text'])
+
+        proc['batch'] = self._addon.router.batch(
+            requests,
+            callbacks=dict(
+                okay=okay, fail=fail,
+
+                # closing out via a single-shot QTimer lets the router finish
+                # unwinding from whichever callback completed the batch
+                then=lambda: QtCore.QTimer.singleShot(0, self._accept_done),
+            ),
+        )
 
     def _accept_next(self):
         """
-        Pop the next note off the queue, if not throttled, and process.
+        Pop the next note off the queue and process.
         """
 
         self._accept_update()
 
         proc = self._process
-        throttling = proc['throttling']
 
         if proc['aborted'] or not proc['queue']:
             self._accept_done()
             return
 
-        if throttling['calls'] and \
-           max(throttling['calls'].values()) >= throttling['threshold']:
-            # at least one service needs a break
-
-            timer = QtCore.QTimer()
-            throttling['timer'] = timer
-            throttling['countdown'] = throttling['sleep']
-
-            timer.timeout.connect(self._accept_throttled)
-            timer.setInterval(1000)
-            timer.start()
-            return
-
         note = proc['queue'].pop(0)
         phrase = note[proc['fields']['source']]
         phrase = self._addon.strip.from_note(phrase)
@@ -347,7 +397,14 @@ class BrowserGenerator(ServiceDialog):
         def okay(path):
             """Count the success and update the note."""
 
-            filename = self._browser.mw.col.media.addFile(path)
+            media = self._browser.mw.col.media
+            self._addon.placement.media(path, media)
+            try:
+                filename = media.addFile(path)
+            except EnvironmentError as error:
+                self._addon.router.forget_missing(path)
+                fail(error)
+                return
             dest = proc['fields']['dest']
             note[dest] = self._accept_next_output(note[dest], filename)
             proc['counts']['okay'] += 1
@@ -356,27 +413,10 @@ class BrowserGenerator(ServiceDialog):
         def fail(exception):
             """Count the failure and the unique message."""
 
-            proc['counts']['fail'] += 1
-
-            message = exception.message
-            if isinstance(message, basestring):
-                message = self._RE_WHITESPACE.sub(' ', message).strip()
-
-            try:
-                proc['exceptions'][message] += 1
-            except KeyError:
-                proc['exceptions'][message] = 1
-
-        def miss(svc_id, count):
-            """Count the cache miss."""
-
-            try:
-                throttling['calls'][svc_id] += count
-            except KeyError:
-                throttling['calls'][svc_id] = count
+            self._accept_fail(exception)
 
         callbacks = dict(
-            done=done, okay=okay, fail=fail, miss=miss,
+            done=done, okay=okay, fail=fail,
 
             # The call to _accept_next() is done via a single-shot QTimer for
             # a few reasons: keep the UI responsive, avoid a "maximum
@@ -428,40 +468,36 @@ class BrowserGenerator(ServiceDialog):
             else:
                 return filename
 
-    def _accept_throttled(self):
+    def _accept_fail(self, exception):
         """
-        Called for every "timeout" of the timer during a throttling.
+        Count the failure and the unique message.
         """
 
         proc = self._process
+        proc['counts']['fail'] += 1
 
-        if proc['aborted']:
-            proc['throttling']['timer'].stop()
-            self._accept_done()
-            return
+        message = exception.message
+        if isinstance(message, basestring):
+            message = self._RE_WHITESPACE.sub(' ', message).strip()
 
-        proc['throttling']['countdown'] -= 1
-        self._accept_update()
-
-        if proc['throttling']['countdown'] <= 0:
-            proc['throttling']['timer'].stop()
-            del proc['throttling']['countdown']
-            del proc['throttling']['timer']
-            proc['throttling']['calls'] = {}
-            self._accept_next()
+        try:
+            proc['exceptions'][message] += 1
+        except KeyError:
+            proc['exceptions'][message] = 1
 
     def _accept_update(self, detail=None):
         """
-        Update the progress bar and message.
+        Update the progress bar and message, along with how much of the
+        converting to MP3 is running and waiting.
         """
 
         proc = self._process
+        transcoder = self._addon.transcoder.stats()
 
         proc['progress'].update(
             label="finished %d of %d%s\n"
                   "%d successful, %d failed\n"
-                  "\n"
-                  "%s" % (
+                  "converting %d to MP3 (%d waiting), %.1f per second" % (
                       proc['counts']['done'],
                       proc['counts']['elig'],
 
@@ -472,17 +508,9 @@ class BrowserGenerator(ServiceDialog):
                       proc['counts']['okay'],
                       proc['counts']['fail'],
 
-                      "sleeping for %d second%s" % (
-                          proc['throttling']['countdown'],
-                          "s"
-                          if proc['throttling']['countdown'] != 1
-                          else ""
-                      )
-                      if (
-                          proc['throttling'] and
-                          'countdown' in proc['throttling']
-                      )
-                      else " "
+                      transcoder['running'],
+                      transcoder['queued'],
+                      transcoder['rate'],
                   ),
             value=proc['counts']['done'],
             detail=detail,
@@ -776,6 +804,7 @@ class EditorGenerator(ServiceDialog):
             okay=lambda path: (
                 self._addon.config.update(now),
                 super(EditorGenerator, self).accept(),
+                self._addon.placement.media(path, self._editor.mw.col.media),
                 self._editor.addMedia(path),
             ),
             fail=lambda exception: (
@@ -30,9 +30,10 @@ alert windows. It also may have more visual components in the future.
 __all__ = ['Reviewer']
 
 import re
+from time import time
 
 from BeautifulSoup import BeautifulSoup
-from PyQt4.QtCore import Qt
+from PyQt4.QtCore import Qt, QTimer
 
 from .common import key_event_combo
 
@@ -44,6 +45,9 @@ X_FOR_THIS_TAG_MSG = 'The "%s" %s specified by this tag does not exist:\n' \
                      "re-installed Anki/AwesomeTTS, you can recreate it in " \
                      "Tools > AwesomeTTS > Advanced."
 
+PREFETCH_DELAY = 1000  # msecs to wait after a card is shown to prefetch
+PREFETCH_WINDOW = 60   # secs of downloads counted against prefetch budget
+
 
 # n.b. Previously, before playing handlers, these event handlers checked to
 # make sure that 'not sound.hasSound()'. I am guessing that this was done
@@ -94,12 +98,14 @@ class Reviewer(object):
         '_addon',
         '_alerts',
         '_mw',
+        '_prefetch',  # dict w/ seen card IDs and recent download counts
     ]
 
     def __init__(self, addon, alerts, mw):
         self._addon = addon
         self._alerts = alerts
         self._mw = mw
+        self._prefetch = dict(seen=set(), downloads=[])
 
     def card_handler(self, state, card):
         """
@@ -160,6 +166,111 @@ class Reviewer(object):
 
         return handled
 
+    def prefetch_handler(self):
+        """
+        Shortly after a card is shown, looks ahead at the next few cards
+        in the review queue and runs the on-the-fly tags of the sides
+        that are set to play automatically as background work, so that
+        their audio is already cached by the time they are shown.
+
+        Nothing is prefetched while the downloads made for prefetching
+        in the last minute are over the user's budget.
+        """
+
+        state = self._prefetch
+        QTimer.singleShot(
+            PREFETCH_DELAY,
+            lambda: state is self._prefetch and self._prefetch_run(),
+        )
+
+    def prefetch_cancel(self):
+        """
+        Forgets which cards have been prefetched and calls off any
+        prefetching that has not started yet (e.g. as review ends).
+        """
+
+        self._prefetch = dict(seen=set(), downloads=[])
+        self._addon.router.cancel_background()
+
+    def _prefetch_run(self):
+        """Helper method for prefetch_handler()."""
+
+        config = self._addon.config
+        depth = config['prefetch_depth']
+        sides = [side for side, key in [('front', 'automatic_questions'),
+                                        ('back', 'automatic_answers')]
+                 if config[key]]
+        if not (depth and sides):
+            return
+
+        state = self._prefetch
+        cutoff = time() - PREFETCH_WINDOW
+        state['downloads'] = [(when, count)
+                              for when, count in state['downloads']
+                              if when > cutoff]
+        if config['prefetch_budget'] and \
+           sum(count for when, count in state['downloads']) >= \
+           config['prefetch_budget']:
+            self._addon.logger.debug("Prefetch budget spent; skipping")
+            return
+
+        def miss(svc_id, count):  # pylint:disable=unused-argument
+            """Counts downloads against the prefetch budget."""
+            if count:
+                state['downloads'].append((time(), count))
+
+        for card_id in self._prefetch_card_ids(depth):
+            if card_id in state['seen']:
+                continue
+            state['seen'].add(card_id)
+
+            try:
+                card = self._mw.col.getCard(card_id)
+                htmls = [(side, card.q() if side == 'front'
+                          else self._get_answer(card))
+                         for side in sides]
+            except Exception as exception:  # catch all, pylint:disable=W0703
+                self._addon.logger.debug("Cannot prefetch card %s: %s",
+                                         card_id, exception)
+                continue
+
+            self._addon.logger.debug("Prefetching card %s", card_id)
+            for side, html in htmls:
+                self._play_html(side, html, lambda path: None, None,
+                                show_errors=False, background=True,
+                                miss=miss)
+
+    def _prefetch_card_ids(self, depth):
+        """
+        Peeks at the scheduler's learning, review, and new card queues,
+        returning up to depth card IDs that are likely to come up next.
+        The scheduler takes review and new cards off the end of their
+        queues and learning cards by due time, and interleaves them, so
+        the IDs are taken from each queue in turn.
+        """
+
+        # the scheduler has no public API for this, pylint:disable=W0212
+        try:
+            sched = self._mw.col.sched
+            current = self._mw.reviewer.card.id
+            queues = [
+                [item[1] for item in sorted(sched._lrnQueue)],
+                list(reversed(sched._revQueue)),
+                list(reversed(sched._newQueue)),
+            ]
+        except (AttributeError, TypeError, IndexError):
+            return []
+
+        card_ids = []
+        while len(card_ids) < depth and any(queues):
+            for queue in queues:
+                if queue:
+                    card_id = queue.pop(0)
+                    if card_id != current and card_id not in card_ids:
+                        card_ids.append(card_id)
+
+        return card_ids[:depth]
+
     def _get_answer(self, card):
         """
         Attempts to strip out the question side of the card in the blob
@@ -189,11 +300,15 @@ class Reviewer(object):
 
         return answer_html
 
-    def _play_html(self, side, html, playback, parent, show_errors=True):
+    def _play_html(self, side, html, playback, parent, show_errors=True,
+                   background=False, miss=None):
         """
         Read in the passed HTML, attempt to discover <tts> tags in it,
         and pass them to the router for processing.
 
+        The background flag and any miss callback are passed on to the
+        router (e.g. for prefetching).
+
         Additionally, old-style [GTTS], [TTS], and [ATTS] tags are
         detected and played back, e.g.
 
@@ -228,14 +343,14 @@ class Reviewer(object):
 
         for tag in BeautifulTTS(html)('tts'):
             self._play_html_tag(tag, from_template, playback, parent,
-                                show_errors)
+                                show_errors, background, miss)
 
         for legacy in self.RE_LEGACY_TAGS.findall(html):
             self._play_html_legacy(legacy, from_template, playback, parent,
-                                   show_errors)
+                                   show_errors, background, miss)
 
     def _play_html_tag(self, tag, from_template, playback, parent,
-                       show_errors=True):
+                       show_errors=True, background=False, miss=None):
         """Helper method for _play_html()."""
 
         text = from_template(unicode(tag))
@@ -260,11 +375,11 @@ class Reviewer(object):
                     text=text,
                     group=group,
                     presets=config['presets'],
+                    background=background,
                     callbacks=dict(
+                        self._miss_callbacks(miss),
                         okay=playback,
                         fail=lambda exception: (
-                            isinstance(exception,
-                                       self._addon.router.BusyError) or
                             not show_errors or
                             self._alerts(
                                 "Unable to play this group tag:\n%s\n\n%s" % (
@@ -305,11 +420,11 @@ class Reviewer(object):
             svc_id=svc_id,
             text=text,
             options=attr,
+            background=background,
             callbacks=dict(
+                self._miss_callbacks(miss),
                 okay=playback,
                 fail=lambda exception: (
-                    # we can safely ignore "service busy" errors in review
-                    isinstance(exception, self._addon.router.BusyError) or
                     not show_errors or
                     self._alerts(
                         ("Unable to play this tag:\n%s\n\n%s\n\n"
@@ -331,7 +446,7 @@ class Reviewer(object):
         )
 
     def _play_html_legacy(self, legacy, from_template, playback, parent,
-                          show_errors=True):
+                          show_errors=True, background=False, miss=None):
         """Helper method for _play_html()."""
 
         components = legacy[1].split(':')
@@ -375,10 +490,11 @@ class Reviewer(object):
             svc_id=svc_id,
             text=text,
             options={'voice': voice},
+            background=background,
             callbacks=dict(
+                self._miss_callbacks(miss),
                 okay=playback,
                 fail=lambda exception: (
-                    isinstance(exception, self._addon.router.BusyError) or
                     not show_errors or
                     self._play_html_legacy_bad(legacy, exception.message,
                                                parent)
@@ -386,6 +502,12 @@ class Reviewer(object):
             ),
         )
 
+    @staticmethod
+    def _miss_callbacks(miss):
+        """Returns the start of a callbacks dict, w/ miss if passed."""
+
+        return dict(miss=miss) if miss else {}
+
     def _play_html_legacy_bad(self, legacy, message, parent):
         """Reassembles the legacy given tag and displays an alert."""
 
@@ -405,7 +527,6 @@ class Reviewer(object):
             callbacks=dict(
                 okay=self._addon.player.menu_click,
                 fail=lambda exception: (
-                    isinstance(exception, self._addon.router.BusyError) or
                     self._alerts(exception.message, parent)
                 ),
             ),
@@ -421,7 +542,6 @@ class Reviewer(object):
             callbacks=dict(
                 okay=self._addon.player.menu_click,
                 fail=lambda exception: (
-                    isinstance(exception, self._addon.router.BusyError) or
                     self._alerts(exception.message, parent)
                 ),
             ),
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+
+# AwesomeTTS text-to-speech add-on for Anki
+#
+# Copyright (C) 2014-2016  Anki AwesomeTTS Development Team
+# Copyright (C) 2014-2016  Dave Shifflett
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Per-service statistics on cache lookups and service runs
+"""
+
+__all__ = ['Metrics']
+
+import sqlite3
+from time import time
+
+from .cache import LOCK_SECS
+
+
+BUCKETS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]  # histogram bounds, in secs
+FLUSH_SECS = 300  # most time recorded values go without being persisted
+
+COUNTERS = [  # values that are just added up
+    'hits',       # requests answered from the cache
+    'misses',     # requests that were not in the cache
+    'runs',       # service runs (a miss joining a run underway is not one)
+    'netops',     # network operations made by service runs
+    'net_bytes',  # bytes received from the network by service runs
+]
+
+TIMERS = [  # values that are also bucketed into a histogram
+    'latency',         # seconds from starting a run to its completion
+    'net_secs',        # seconds a run spent waiting on the network
+    'transcode_secs',  # seconds a run spent running the LAME transcoder
+]
+
+ERROR_PREFIX = 'error:'  # metric names for error counts, by exception class
+
+
+class Metrics(object):
+    """
+    Keeps statistics for each service, both for the current session
+    and across all sessions, so that slow or unreliable services can
+    be spotted.
+
+    Every value is kept as a count of observations and their total. For
+    timers, a count for each of the BUCKETS (plus one for anything
+    slower) is kept as well, from which rough percentiles are found.
+    Errors are counted by their exception class name.
+
+    The all-time values are persisted in an SQLite3 table. Recording a
+    value only marks it as dirty; flush() writes dirty values out, and
+    is also called on its own if it has not happened for a while.
+
+    All access is expected to happen from the main thread.
+    """
+
+    __slots__ = [
+        '_connection',  # open SQLite3 connection
+        '_db',          # bundle with path to database, table name
+        '_dirty',       # set of (svc_id, metric) all-time keys to persist
+        '_flushed',     # time of the last flush()
+        '_lifetime',    # dict of svc_ids to metric names to all-time values
+        '_logger',      # logger-like interface with debug(), info(), etc.
+        '_session',     # dict of svc_ids to metric names to session values
+    ]
+
+    def __init__(self, db, logger):
+        """
+        The database specification should be a bundle, with:
+
+            - path: full path to the database
+            - table: table name
+        """
+
+        self._db = db
+        self._dirty = set()
+        self._flushed = time()
+        self._logger = logger
+        self._session = {}
+
+        # n.b. the file is shared with the cache index (see Cache)
+        self._connection = sqlite3.connect(self._db.path, timeout=LOCK_SECS)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS %s (service text, metric text, '
+            'count integer, total real, buckets text, '
+            'PRIMARY KEY (service, metric))' % self._db.table
+        )
+        self._connection.commit()
+
+        self._lifetime = {}
+        for svc_id, metric, count, total, buckets in self._connection.execute(
+                'SELECT service, metric, count, total, buckets FROM %s' %
+                self._db.table
+        ):
+            value = [count, total]
+            if buckets:
+                value.extend(int(bucket) for bucket in buckets.split(','))
+            self._lifetime.setdefault(svc_id, {})[metric] = value
+
+        self._logger.debug("Loaded all-time statistics for %d service(s)",
+                           len(self._lifetime))
+
+    def lookup(self, svc_id, hit):
+        """Records a cache hit (or miss, if hit is False) for a service."""
+
+        self._add(svc_id, 'hits' if hit else 'misses', 1)
+
+    def run(self, svc_id, latency, stats, exception=None):
+        """
+        Records a completed service run, taking how long it took from
+        start to finish, the service's STATS values for the run (see
+        Service.stats()), and the exception it raised, if any.
+        """
+
+        self._add(svc_id, 'runs', 1)
+        self._add(svc_id, 'latency', latency)
+
+        for metric in ['netops', 'net_bytes', 'net_secs', 'transcode_secs']:
+            if stats.get(metric):
+                self._add(svc_id, metric, stats[metric])
+
+        if exception:
+            self._add(svc_id, ERROR_PREFIX + type(exception).__name__, 1)
+
+        if time() - self._flushed > FLUSH_SECS:
+            self.flush()
+
+    def report(self, lifetime=False):
+        """
+        Returns a dict of service IDs to a summary of their statistics
+        for this session (or all time, if lifetime is True), with:
+
+            - hits, misses, runs, netops, net_bytes (int): totals
+            - hit_ratio (float or None): share of lookups that were hits
+            - errors (dict): exception class names to counts
+            - latency, net_secs, transcode_secs (dict): timer summaries
+
+        Each timer summary has count, total, mean, p50, and p95 (which
+        are BUCKETS bounds, or infinity if slower than all of them), and
+        histogram, a list of (bound, count) tuples.
+        """
+
+        source = self._lifetime if lifetime else self._session
+        report = {}
+
+        for svc_id, values in source.items():
+            summary = {metric: int(values[metric][1]) if metric in values
+                       else 0
+                       for metric in COUNTERS}
+
+            lookups = summary['hits'] + summary['misses']
+            summary['hit_ratio'] = (float(summary['hits']) / lookups
+                                    if lookups else None)
+
+            summary['errors'] = {
+                metric[len(ERROR_PREFIX):]: value[0]
+                for metric, value in values.items()
+                if metric.startswith(ERROR_PREFIX)
+            }
+
+            for metric in TIMERS:
+                summary[metric] = self._summarize(values.get(metric))
+
+            report[svc_id] = summary
+
+        return report
+
+    def dump(self, lifetime=False):
+        """
+        Returns the report() for this session (or all time) as plain
+        text, one block per service, sorted by service ID.
+        """
+
+        def secs(value):
+            """Formats a number of seconds (or a bucket bound)."""
+            return ">%gs" % BUCKETS[-1] if value == float('inf') \
+                else "%.2fs" % value
+
+        report = self.report(lifetime)
+        if not report:
+            return "No statistics have been recorded yet."
+
+        lines = []
+        for svc_id, summary in sorted(report.items()):
+            lines.append(svc_id)
+            lines.append(
+                "  cache: %d hit(s), %d miss(es)%s" % (
+                    summary['hits'], summary['misses'],
+                    ", %.0f%% hit ratio" % (summary['hit_ratio'] * 100)
+                    if summary['hit_ratio'] is not None else "",
+                )
+            )
+            lines.append(
+                "  runs: %d, with %d network operation(s) for %.1f KB" % (
+                    summary['runs'], summary['netops'],
+                    summary['net_bytes'] / 1024.0,
+                )
+            )
+
+            for metric, label in [('latency', "end-to-end"),
+                                  ('net_secs', "network"),
+                                  ('transcode_secs', "transcoding")]:
+                timer = summary[metric]
+                if timer['count']:
+                    lines.append(
+                        "  %s: mean %s, p50 <= %s, p95 <= %s (%d)" % (
+                            label, secs(timer['mean']), secs(timer['p50']),
+                            secs(timer['p95']), timer['count'],
+                        )
+                    )
+
+            if summary['errors']:
+                lines.append("  errors: " + ", ".join(
+                    "%s x%d" % (name, count)
+                    for name, count in sorted(summary['errors'].items())
+                ))
+
+        return "\n".join(lines)
+
+    def reset(self):
+        """Forgets all statistics, for this session and all time."""
+
+        self._session = {}
+        self._lifetime = {}
+        self._dirty = set()
+
+        self._connection.execute('DELETE FROM %s' % self._db.table)
+        self._connection.commit()
+
+    def flush(self):
+        """Persists any changed all-time values to the database."""
+
+        self._flushed = time()
+        if not self._dirty:
+            return
+
+        rows = []
+        for svc_id, metric in self._dirty:
+            value = self._lifetime[svc_id][metric]
+            rows.append((
+                svc_id, metric, value[0], value[1],
+                ','.join(str(bucket) for bucket in value[2:]) or None,
+            ))
+
+        self._connection.executemany(
+            'INSERT OR REPLACE INTO %s VALUES (?, ?, ?, ?, ?)' %
+            self._db.table,
+            rows,
+        )
+        self._connection.commit()
+
+        self._logger.debug("Flushed %d statistic(s)", len(rows))
+        self._dirty = set()
+
+    def _add(self, svc_id, metric, amount):
+        """
+        Adds an observation of the given amount to both the session and
+        all-time values of a metric, bucketing it if it is a timer.
+        """
+
+        timer = metric in TIMERS
+        if timer:
+            bucket = next((index for index, bound in enumerate(BUCKETS)
+                           if amount <= bound), len(BUCKETS))
+
+        for source in [self._session, self._lifetime]:
+            values = source.setdefault(svc_id, {})
+            value = values.get(metric)
+            if not value:
+                value = values[metric] = [0, 0] + \
+                    ([0] * (len(BUCKETS) + 1) if timer else [])
+
+            value[0] += 1
+            value[1] += amount
+            if timer:
+                value[2 + bucket] += 1
+
+        self._dirty.add((svc_id, metric))
+
+    @staticmethod
+    def _summarize(value):
+        """Returns a timer summary (see report()) for a timer's value."""
+
+        if not value or not value[0]:
+            return dict(count=0, total=0, mean=None, p50=None, p95=None,
+                        histogram=[])
+
+        count, total, buckets = value[0], value[1], value[2:]
+        bounds = BUCKETS + [float('inf')]
+
+        def percentile(share):
+            """Returns the bound of the bucket holding the percentile."""
+            needed = share * count
+            seen = 0
+            for bound, bucket in zip(bounds, buckets):
+                seen += bucket
+                if seen >= needed:
+                    return bound
+            return bounds[-1]
+
+        return dict(
+            count=count,
+            total=total,
+            mean=total / count,
+            p50=percentile(0.5),
+            p95=percentile(0.95),
+            histogram=zip(bounds, buckets),
+        )
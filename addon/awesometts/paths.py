@@ -27,6 +27,7 @@ __all__ = [
     'ADDON',
     'ADDON_IS_LINKED',
     'CACHE',
+    'CACHE_INDEX',
     'CONFIG',
     'LOG',
     'TEMP',
@@ -51,6 +52,8 @@ CACHE = os.path.join(ADDON, '.cache')
 if not os.path.isdir(CACHE):
     os.mkdir(CACHE)
 
+CACHE_INDEX = os.path.join(ADDON, 'cache.db')
+
 CONFIG = os.path.join(ADDON, 'config.db')
 
 LOG = os.path.join(ADDON, 'addon.log')
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+# AwesomeTTS text-to-speech add-on for Anki
+#
+# Copyright (C) 2014-2016  Anki AwesomeTTS Development Team
+# Copyright (C) 2014-2016  Dave Shifflett
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Placement of cached media files into other directories
+"""
+
+__all__ = ['Placement']
+
+import errno
+import os
+import os.path
+from shutil import copyfile
+import sys
+from unicodedata import normalize as unicode_normalize
+
+
+FICLONE = 0x40049409  # Linux ioctl for cloning (reflinking) a file
+MEMO_LIMIT = 10000    # most placements remembered before starting over
+
+UNSUPPORTED = [  # errors that mean a strategy will never work in this session
+    getattr(errno, name)
+    for name in ['EINVAL', 'ENOSYS', 'ENOTSUP', 'ENOTTY', 'EOPNOTSUPP']
+    if hasattr(errno, name)
+]
+
+
+class Placement(object):
+    """
+    Puts copies of cached media files where they are needed (e.g. the
+    scratch directory for human-readable filenames, or the collection's
+    media directory) without duplicating the file's data when it can be
+    avoided.
+
+    Each placement tries, in order, a reflink (copy-on-write clone, on
+    Linux file systems that support it), a hard link, and finally a
+    regular copy (e.g. across devices or on Windows). A reflink that is
+    not supported at all is not tried again. Placements are remembered
+    so that repeating one is just an existence check.
+    """
+
+    __slots__ = [
+        '_logger',   # logger-like interface with debug(), info(), etc.
+        '_methods',  # list of (name, callable) placement strategies to try
+        '_placed',   # dict of destination paths to their source paths
+    ]
+
+    def __init__(self, logger):
+        """
+        Determine which placement strategies this platform offers.
+        """
+
+        self._logger = logger
+        self._placed = {}
+
+        self._methods = []
+        if sys.platform.startswith('linux'):
+            self._methods.append(('reflink', self._reflink))
+        if hasattr(os, 'link'):
+            self._methods.append(('link', os.link))
+        self._methods.append(('copy', copyfile))
+
+    def place(self, source, destination, replace=True):
+        """
+        Makes the file at destination have the same contents as the one
+        at source, returning True if successful.
+
+        If something different is already at destination, it is only
+        replaced if replace is True; otherwise, False is returned.
+        """
+
+        if self._placed.get(destination) == source and \
+           os.path.exists(destination):
+            return True
+
+        if os.path.exists(destination):
+            if not self._same(source, destination):
+                if not replace:
+                    return False
+                os.unlink(destination)
+
+        if not os.path.exists(destination):
+            for name, method in list(self._methods):
+                try:
+                    method(source, destination)
+                except (IOError, OSError) as exception:
+                    self._logger.debug("Unable to %s %s to %s: %s",
+                                       name, source, destination, exception)
+                    if os.path.exists(destination):
+                        os.unlink(destination)
+                    if name == 'reflink' and \
+                       exception.errno in UNSUPPORTED:
+                        self._methods.remove((name, method))
+                else:
+                    self._logger.debug("Placed %s at %s by %s",
+                                       source, destination, name)
+                    break
+            else:
+                raise IOError("Unable to place %s at %s" %
+                              (source, destination))
+
+        if len(self._placed) >= MEMO_LIMIT:
+            self._placed = {}
+        self._placed[destination] = source
+
+        return True
+
+    def media(self, path, media):
+        """
+        Ahead of a call to media.addFile(path), puts the file at path
+        into the collection's media directory under its own filename,
+        so that Anki finds an identical file already there and does not
+        write out another copy.
+
+        Nothing happens if the filename would be altered by Anki or if
+        a different file already uses that filename; Anki then proceeds
+        as it normally would.
+        """
+
+        filename = os.path.basename(path)
+
+        try:
+            if unicode_normalize('NFC', unicode(filename)) != filename or \
+               media.stripIllegal(filename) != filename:
+                return
+            self.place(path, os.path.join(media.dir(), filename),
+                       replace=False)
+        except Exception as exception:  # catch all, pylint:disable=W0703
+            self._logger.debug("Leaving %s for Anki to copy: %s",
+                               path, exception)
+
+    @staticmethod
+    def _same(source, destination):
+        """Returns True if both paths refer to identical contents."""
+
+        try:
+            if os.path.samefile(source, destination):
+                return True
+        except (AttributeError, OSError):  # no samefile() on Windows
+            pass
+
+        if os.path.getsize(source) != os.path.getsize(destination):
+            return False
+
+        with open(source, 'rb') as source_file, \
+                open(destination, 'rb') as destination_file:
+            while True:
+                source_chunk = source_file.read(65536)
+                if source_chunk != destination_file.read(65536):
+                    return False
+                if not source_chunk:
+                    return True
+
+    @staticmethod
+    def _reflink(source, destination):
+        """Clones source to destination, sharing its data blocks."""
+
+        from fcntl import ioctl
+
+        with open(source, 'rb') as source_file, \
+                open(destination, 'wb') as destination_file:
+            ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
@@ -0,0 +1,927 @@
+# -*- coding: utf-8 -*-
+
+# AwesomeTTS text-to-speech add-on for Anki
+#
+# Copyright (C) 2014-2016  Anki AwesomeTTS Development Team
+# Copyright (C) 2014-2016  Dave Shifflett
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Event loop that runs the services' HTTP(S) requests on a single thread
+"""
+
+__all__ = ['Reactor']
+
+from collections import deque
+import errno
+from httplib import IncompleteRead
+from mimetools import Message
+import select
+import socket
+import ssl
+from StringIO import StringIO
+from threading import Condition, Lock, Thread
+from time import time
+from urllib2 import URLError
+from urlparse import urlsplit
+
+from .connections import Connections, IDEMPOTENT, IDLE_SECS, WAIT_SECS
+
+
+BUFFER_BYTES = 2**18  # most body bytes held for a reader before pausing
+RECV_BYTES = 2**16    # bytes asked of a socket at a time
+SELECT_SECS = 1       # longest the loop sleeps w/o checking for timeouts
+
+HEADERS_MAX = 2**16   # largest status line and header block accepted
+
+WOULD_BLOCK = [errno.EAGAIN, errno.EINPROGRESS, errno.EWOULDBLOCK,
+               getattr(errno, 'WSAEWOULDBLOCK', errno.EWOULDBLOCK)]
+SSL_WANT = {ssl.SSL_ERROR_WANT_READ: 'read',
+            ssl.SSL_ERROR_WANT_WRITE: 'write'}
+
+
+class Reactor(Connections):
+    """
+    Runs web requests on one network thread with non-blocking sockets
+    and select(), instead of on the thread that makes them, so that the
+    socket work (connecting, TLS handshakes, timeouts, and reading) for
+    every request happens in one place rather than inside each calling
+    thread's socket calls.
+
+    The calling thread still waits for its response, though, on a
+    condition until the response (or the next part of its body) has
+    arrived, so the number of requests in flight is still bounded by
+    the number of threads making them (i.e. the router's pool).
+
+    As a Connections subclass, it answers request() the same way, so
+    services run on it without any changes. It only takes over while
+    enabled() returns True, and leaves requests that need a proxy to
+    the thread-per-request pool that it inherits.
+
+    Like the pool, it keeps connections alive between requests to the
+    same host, opens at most per_host connections to a host at once
+    (queueing requests beyond that until one is free, for up to
+    WAIT_SECS), and retries a request on a new connection if a reused
+    one turns out to have been dropped, as long as it is safe to send
+    again (see Connections._send()).
+    """
+
+    __slots__ = [
+        '_enabled',    # callable returning whether the loop should be used
+        '_idle_loop',  # dict of keys to lists of (released, _Channel)
+        '_inbox',      # deque of _Exchanges submitted for the loop to start
+        '_lock',       # guards the inbox and the starting of the loop
+        '_loop',       # the network thread, once started
+        '_open_loop',  # dict of keys to counts of channels open, incl. idle
+        '_queued',     # dict of keys to deques of (queued, _Exchange)
+        '_waker',      # pair of sockets to wake the loop up from select()
+    ]
+
+    def __init__(self, logger, enabled, idle_secs=IDLE_SECS, **kwargs):
+        """
+        Initialize the reactor, which starts its network thread the
+        first time that it is used while enabled() returns True.
+        """
+
+        super(Reactor, self).__init__(logger, idle_secs=idle_secs, **kwargs)
+        self._enabled = enabled
+        self._idle_loop = {}
+        self._inbox = deque()
+        self._lock = Lock()
+        self._loop = None
+        self._open_loop = {}
+        self._queued = {}
+        self._waker = None
+
+    def _send(self, url, headers, data, method, timeout):
+        """
+        Hands a single request to the network thread, returning once
+        the response's status and headers have arrived.
+        """
+
+        if not self._enabled():
+            return super(Reactor, self)._send(url, headers, data, method,
+                                              timeout)
+
+        split = urlsplit(url)
+        scheme, host = split.scheme, split.netloc
+        if scheme not in ['http', 'https']:
+            raise URLError("unknown url type: %s" % scheme)
+        if not host:
+            raise URLError("no host given")
+
+        if self._proxy(scheme, host)[0]:
+            return super(Reactor, self)._send(url, headers, data, method,
+                                              timeout)
+
+        try:
+            addresses = socket.getaddrinfo(
+                split.hostname, split.port or (443 if scheme == 'https'
+                                               else 80),
+                0, socket.SOCK_STREAM,
+            )
+        except socket.error as error:
+            raise URLError(error)
+
+        selector = (split.path or '/') + \
+            ('?' + split.query if split.query else '')
+        lines = ['%s %s HTTP/1.1' % (method, selector), 'Host: %s' % host]
+        lines.extend('%s: %s' % item for item in headers.items()
+                     if item[0].lower() != 'host')
+        if data is not None or method == 'POST':
+            lines.append('Content-Length: %d' % len(data or ''))
+
+        exchange = _Exchange(
+            key=(scheme, host),
+            addresses=[address[4] for address in addresses],
+            hostname=split.hostname,
+            payload=str('\r\n'.join(lines) + '\r\n\r\n' + (data or '')),
+            head=method == 'HEAD',
+            idempotent=method in IDEMPOTENT,
+            timeout=timeout,
+            wake=self._wake,
+        )
+
+        with self._lock:
+            if not self._loop:
+                self._start()
+            self._inbox.append(exchange)
+        self._wake()
+
+        exchange.wait_for_headers()
+        return _Response(exchange, url)
+
+    def _start(self):
+        """Sets up the waker sockets and starts the network thread."""
+
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        sender = socket.create_connection(listener.getsockname())
+        receiver = listener.accept()[0]
+        listener.close()
+        receiver.setblocking(0)
+        sender.setblocking(0)
+        self._waker = (receiver, sender)
+
+        self._logger.debug("Starting network event loop")
+        self._loop = Thread(target=self._run)
+        self._loop.daemon = True
+        self._loop.start()
+
+    def _wake(self):
+        """Interrupts the network thread's select(), if it is running."""
+
+        if self._waker:
+            try:
+                self._waker[1].send('x')
+            except socket.error:
+                pass  # its buffer is full, so it is going to wake anyway
+
+    def _run(self):
+        """
+        Runs the event loop forever: starts submitted exchanges, moves
+        bytes for each channel whose socket is ready, enforces timeouts,
+        and keeps finished connections for reuse.
+        """
+
+        receiver = self._waker[0]
+        channels = set()
+
+        while True:
+            try:
+                self._turn(receiver, channels)
+            except Exception:  # catch all, pylint:disable=W0703
+                self._logger.error("Network event loop error; failing its "
+                                   "%d request(s)", len(channels),
+                                   exc_info=True)
+                for channel in channels:
+                    channel.reused = False  # i.e. no retrying
+                    channel.fail(socket.error("Network event loop error"))
+                    self._closed(channel)
+                channels.clear()
+
+    def _turn(self, receiver, channels):
+        """Runs a single turn of the event loop."""
+
+        with self._lock:
+            started = list(self._inbox)
+            self._inbox.clear()
+
+        now = time()
+        for exchange in started:
+            self._queued.setdefault(exchange.key, deque()). \
+                append((now, exchange))
+        self._assign(channels, now)
+
+        readers = [receiver]
+        writers = []
+        waiting = set()  # channels w/ a socket call pending, i.e. not paused
+        deadline = time() + SELECT_SECS
+        for channel in channels:
+            want = channel.wants()
+            if want == 'read':
+                readers.append(channel)
+            elif want == 'write':
+                writers.append(channel)
+            if want:
+                waiting.add(channel)
+                if channel.deadline:
+                    deadline = min(deadline, channel.deadline)
+
+        try:
+            readable, writable, failed = select.select(
+                readers, writers, writers,  # n.b. Windows flags failed
+                max(0, deadline - time()),  # connects as exceptional
+            )
+        except (select.error, socket.error, ValueError):
+            readable = writable = failed = []
+            for channel in waiting:  # find and fail the bad socket(s)
+                try:
+                    select.select([channel], [], [], 0)
+                except (select.error, socket.error, ValueError) as error:
+                    channel.fail(socket.error(error))
+
+        if receiver in readable:
+            try:
+                while receiver.recv(4096):
+                    pass
+            except socket.error:
+                pass
+
+        now = time()
+        for channel in list(channels):
+            try:
+                if channel in readable or channel in writable or \
+                        channel in failed:
+                    channel.step()
+                elif channel in waiting and channel.deadline and \
+                        now > channel.deadline:
+                    channel.fail(socket.timeout("timed out"))
+                else:
+                    channel.poll()
+            except Exception as error:  # catch all, pylint:disable=W0703
+                channel.fail(error)
+
+            if channel.state == 'retry':
+                self._logger.debug("Reused connection to %s was dropped; "
+                                   "retrying", channel.key[1])
+                exchange = channel.exchange
+                channels.discard(channel)
+                channel = _Channel(exchange.key, exchange.hostname)
+                try:
+                    channel.begin(exchange, False)
+                except Exception as error:  # catch all, pylint:disable=W0703
+                    channel.fail(error)
+                channels.add(channel)
+
+            elif channel.state == 'idle':
+                channels.discard(channel)
+                self._idle_loop.setdefault(channel.key, []). \
+                    append((now, channel))
+
+            elif channel.state == 'closed':
+                channels.discard(channel)
+                self._closed(channel)
+
+        for key, idle in self._idle_loop.items():
+            while idle and now - idle[0][0] > self._idle_secs:
+                channel = idle.pop(0)[1]
+                channel.close()
+                self._closed(channel)
+            if not idle:
+                del self._idle_loop[key]
+
+        self._assign(channels, now)  # i.e. onto channels freed this turn
+
+    def _assign(self, channels, now):
+        """
+        Starts queued exchanges on idle channels for their keys, or on
+        new channels while a key has fewer than per_host open, leaving
+        the rest queued. Exchanges that have been queued for longer than
+        WAIT_SECS are failed instead.
+        """
+
+        for key, queue in self._queued.items():
+            while queue:
+                queued, exchange = queue[0]
+
+                channel = self._checkout(key)
+                reused = bool(channel)
+                if not reused:
+                    if self._open_loop.get(key, 0) < self._per_host:
+                        self._open_loop[key] = self._open_loop.get(key, 0) + 1
+                        channel = _Channel(key, exchange.hostname)
+
+                    elif now - queued > WAIT_SECS:
+                        queue.popleft()
+                        exchange.finish(socket.timeout(
+                            "No connection to %s became available" % key[1]
+                        ))
+                        continue
+
+                    else:
+                        break
+
+                queue.popleft()
+                try:
+                    channel.begin(exchange, reused)
+                except Exception as error:  # catch all, pylint:disable=W0703
+                    channel.fail(error)
+                channels.add(channel)
+
+            if not queue:
+                del self._queued[key]
+
+    def _checkout(self, key):
+        """Returns the most recently used idle channel for a key."""
+
+        idle = self._idle_loop.get(key)
+        while idle:
+            channel = idle.pop()[1]
+            if channel.alive():
+                return channel
+            channel.close()
+            self._closed(channel)
+        return None
+
+    def _closed(self, channel):
+        """Stops counting a channel that has closed toward its key."""
+
+        count = self._open_loop.get(channel.key, 0) - 1
+        if count > 0:
+            self._open_loop[channel.key] = count
+        else:
+            self._open_loop.pop(channel.key, None)
+
+
+class _Exchange(object):
+    """
+    One request and its response, shared between the thread that made
+    the request and the network thread. The network thread fills in
+    the status, headers, and body chunks; the requesting thread waits
+    on the condition for them.
+    """
+
+    __slots__ = [
+        'addresses',   # list of socket addresses to try connecting to
+        'body',        # deque of body chunks not yet read
+        'buffered',    # count of bytes in body
+        'code',        # HTTP status code, once the headers are in
+        'condition',   # notified whenever any of the fields below change
+        'done',        # True once the whole body has arrived
+        'error',       # exception to raise in the requesting thread
+        'abandoned',   # True if the requesting thread closed early
+        'head',        # True if the request was a HEAD (i.e. no body)
+        'hostname',    # server name, for TLS
+        'idempotent',  # True if the request is safe to send again
+        'key',         # (scheme, host) of the server
+        'message',     # mimetools.Message of the response headers
+        'payload',     # the request, as bytes ready to send
+        'reason',      # HTTP status message
+        'timeout',     # seconds of silence before giving up, or None
+        'waiting',     # bytes a blocked reader is waiting for (or inf)
+        'wake',        # callable to wake the network thread
+    ]
+
+    def __init__(self, key, addresses, hostname, payload, head, idempotent,
+                 timeout, wake):
+        """Sets up a new, not yet started exchange."""
+
+        self.abandoned = False
+        self.addresses = addresses
+        self.body = deque()
+        self.buffered = 0
+        self.code = None
+        self.condition = Condition()
+        self.done = False
+        self.error = None
+        self.head = head
+        self.hostname = hostname
+        self.idempotent = idempotent
+        self.key = key
+        self.message = None
+        self.payload = payload
+        self.reason = None
+        self.timeout = timeout
+        self.waiting = 0
+        self.wake = wake
+
+    def wait_for_headers(self):
+        """
+        Waits for the response's status and headers, raising any error
+        that happened before they arrived as a URLError.
+        """
+
+        with self.condition:
+            while self.code is None and not self.error:
+                self.condition.wait()
+            if self.code is None:
+                raise (self.error if isinstance(self.error, URLError)
+                       else URLError(self.error))
+
+    def read(self, amount=None):
+        """
+        Returns up to amount bytes of the body (or all of what is left,
+        if amount is None), waiting for them to arrive as needed, and
+        returning '' at the end of the body.
+        """
+
+        with self.condition:
+            while not (self.done or self.error or (amount and
+                                                   self.buffered >= amount)):
+                if not self.waiting:
+                    self.waiting = amount or float('inf')
+                    if self.buffered >= BUFFER_BYTES:
+                        self.wake()  # so the loop stops pausing for us
+                self.condition.wait()
+            self.waiting = 0
+
+            if self.error and not self.done and \
+                    not (amount and self.buffered >= amount):
+                raise self.error
+
+            paused = self.buffered >= BUFFER_BYTES
+            parts = []
+            wanted = amount or self.buffered
+            while self.body and wanted > 0:
+                chunk = self.body.popleft()
+                if len(chunk) > wanted:
+                    self.body.appendleft(chunk[wanted:])
+                    chunk = chunk[:wanted]
+                parts.append(chunk)
+                wanted -= len(chunk)
+                self.buffered -= len(chunk)
+
+        if paused and self.buffered < BUFFER_BYTES:
+            self.wake()
+        return ''.join(parts)
+
+    def abandon(self):
+        """Tells the network thread that the rest is not wanted."""
+
+        with self.condition:
+            if self.done or self.error:
+                return
+            self.abandoned = True
+        self.wake()
+
+    def finish(self, error=None):
+        """Marks the exchange as complete (or as failed)."""
+
+        with self.condition:
+            if error:
+                self.error = error
+            else:
+                self.done = True
+            self.condition.notify_all()
+
+
+class _Channel(object):
+    """
+    A non-blocking connection to one server, driven by the network
+    thread through a small state machine: connecting, handshaking (for
+    HTTPS), sending, reading the headers, reading the body, and then
+    either idle (ready for reuse), retry, or closed.
+    """
+
+    __slots__ = [
+        'attempt',     # index into the exchange's addresses
+        'body_left',   # bytes (or chunk bytes) of the body still expected
+        'chunked',     # True if the body uses chunked transfer-encoding
+        'deadline',    # time at which the current exchange times out
+        'exchange',    # the _Exchange being worked on, if any
+        'hostname',    # server name, for TLS
+        'inbound',     # bytes received but not yet parsed
+        'key',         # (scheme, host) of the server
+        'outbound',    # bytes of the request not yet sent
+        'persistent',  # True if the server will keep the connection open
+        'received',    # True once any response bytes have arrived
+        'reused',      # True if this exchange is not the channel's first
+        'sock',        # the socket, or None before connecting
+        'state',       # where the channel is in its state machine
+        'want',        # 'read' or 'write', for the TLS layer
+    ]
+
+    def __init__(self, key, hostname):
+        """Sets up a channel that has yet to connect."""
+
+        self.attempt = 0
+        self.deadline = None
+        self.exchange = None
+        self.hostname = hostname
+        self.inbound = ''
+        self.key = key
+        self.sock = None
+        self.state = 'new'
+        self.want = None
+
+    def fileno(self):
+        """Returns the socket's file descriptor, for select()."""
+
+        return self.sock.fileno()
+
+    def begin(self, exchange, reused):
+        """Starts a new exchange, connecting first if needed."""
+
+        self.body_left = None
+        self.chunked = False
+        self.exchange = exchange
+        self.inbound = ''
+        self.outbound = exchange.payload
+        self.persistent = False
+        self.received = False
+        self.reused = reused
+        self._touch()
+
+        if self.sock:
+            self.state = 'sending'
+        else:
+            self._connect()
+
+    def wants(self):
+        """Returns whether the channel is waiting to read or write."""
+
+        if self.state in ['connecting', 'sending']:
+            return 'write'
+        if self.state == 'handshaking':
+            return self.want
+        if self.state in ['headers', 'body']:
+            if self.state == 'body' and \
+                    self.exchange.buffered >= BUFFER_BYTES and \
+                    self.exchange.buffered >= self.exchange.waiting:
+                return None  # paused until the reader catches up
+            return 'read'
+        return None
+
+    def poll(self):
+        """Checks for a reader that has given up on its response."""
+
+        if self.exchange and self.exchange.abandoned:
+            self.close()
+
+    def step(self):
+        """Makes whatever progress the ready socket allows."""
+
+        if self.exchange and self.exchange.abandoned:
+            self.close()
+            return
+
+        if self.state == 'connecting':
+            status = self.sock.getsockopt(socket.SOL_SOCKET,
+                                          socket.SO_ERROR)
+            if status:
+                self._next_address(socket.error(status,
+                                                "connection failed"))
+                return
+            self._connected()
+
+        elif self.state == 'handshaking':
+            self._handshake()
+
+        elif self.state == 'sending':
+            sent = self._io(lambda: self.sock.send(self.outbound))
+            if sent:
+                self.outbound = self.outbound[sent:]
+                self._touch()
+                if not self.outbound:
+                    self.state = 'headers'
+
+        elif self.state in ['headers', 'body']:
+            while self.state in ['headers', 'body']:
+                data = self._io(lambda: self.sock.recv(RECV_BYTES))
+                if data is None:
+                    break
+                if not data:
+                    self._closed_by_server()
+                    break
+
+                self.received = True
+                self._touch()
+                self.inbound += data
+                self._parse()
+
+                if not (isinstance(self.sock, ssl.SSLSocket) and
+                        self.sock.pending()):
+                    break
+
+    def fail(self, error):
+        """
+        Fails the current exchange and closes the channel, unless the
+        channel was reused and the exchange can be retried on a new one
+        instead: no response has arrived, and either the request is
+        idempotent or it was not yet sent in full.
+        """
+
+        if self.exchange and self.reused and not self.received and \
+                not isinstance(error, socket.timeout) and \
+                (self.exchange.idempotent or self.state == 'sending'):
+            self.reused = False
+            self._drop()
+            self.state = 'retry'
+            return
+
+        if self.exchange:
+            self.exchange.finish(error)
+        self.close()
+
+    def alive(self):
+        """Returns True if an idle channel has not been dropped."""
+
+        try:
+            readable = select.select([self], [], [], 0)[0]
+        except (select.error, socket.error, ValueError):
+            return False
+        return not readable  # an idle socket turning readable means EOF
+
+    def close(self):
+        """Closes the socket, and the channel for good."""
+
+        self._drop()
+        self.exchange = None
+        self.state = 'closed'
+
+    def _drop(self):
+        """Closes the socket, if any."""
+
+        if self.sock:
+            try:
+                self.sock.close()
+            except socket.error:
+                pass
+            self.sock = None
+
+    def _touch(self):
+        """Restarts the current exchange's timeout."""
+
+        self.deadline = time() + self.exchange.timeout \
+            if self.exchange and self.exchange.timeout else None
+
+    def _connect(self):
+        """Starts a non-blocking connect to the current address."""
+
+        address = self.exchange.addresses[self.attempt]
+        self.sock = socket.socket(socket.AF_INET6 if len(address) == 4
+                                  else socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setblocking(0)
+        status = self.sock.connect_ex(address)
+        if status and status not in WOULD_BLOCK:
+            self._next_address(socket.error(status, "connection failed"))
+        else:
+            self.state = 'connecting'
+
+    def _next_address(self, error):
+        """Tries the next address, if any, or fails with the error."""
+
+        self._drop()
+        self.attempt += 1
+        if self.attempt < len(self.exchange.addresses):
+            self._connect()
+        else:
+            self.fail(error)
+
+    def _connected(self):
+        """Upgrades a new connection to TLS for HTTPS, if needed."""
+
+        if self.key[0] != 'https':
+            self.state = 'sending'
+            return
+
+        if hasattr(ssl, 'create_default_context'):
+            self.sock = ssl.create_default_context().wrap_socket(
+                self.sock,
+                server_hostname=self.hostname,
+                do_handshake_on_connect=False,
+            )
+        else:  # Python before 2.7.9, which did not verify certificates
+            self.sock = ssl.wrap_socket(self.sock,
+                                        do_handshake_on_connect=False)
+        self.state = 'handshaking'
+        self.want = 'write'
+
+    def _handshake(self):
+        """Continues the TLS handshake."""
+
+        try:
+            self.sock.do_handshake()
+        except ssl.SSLError as error:
+            if error.args[0] not in SSL_WANT:
+                raise
+            self.want = SSL_WANT[error.args[0]]
+        else:
+            self.state = 'sending'
+
+    def _io(self, call):
+        """
+        Makes a socket call, returning None instead if the socket (or
+        its TLS layer) is not ready for it after all.
+        """
+
+        try:
+            return call()
+        except ssl.SSLError as error:
+            if error.args[0] in SSL_WANT:
+                return None
+            raise
+        except socket.error as error:
+            if error.args[0] in WOULD_BLOCK:
+                return None
+            raise
+
+    def _parse(self):
+        """Parses as much of the inbound bytes as possible."""
+
+        exchange = self.exchange
+
+        if self.state == 'headers':
+            end = self.inbound.find('\r\n\r\n')
+            if end < 0:
+                if len(self.inbound) > HEADERS_MAX:
+                    raise socket.error("Response headers are too long")
+                return
+
+            block, self.inbound = self.inbound[:end], self.inbound[end + 4:]
+            status, _, block = block.partition('\r\n')
+            parts = status.split(None, 2)
+            if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+                raise socket.error("Bad status line: %r" % status)
+            code = int(parts[1])
+
+            if 100 <= code < 200:  # e.g. 100 Continue; the real one follows
+                self._parse()
+                return
+
+            message = Message(StringIO(block + '\r\n'))
+            connection = (message.getheader('connection') or '').lower()
+            self.persistent = 'close' not in connection and \
+                (parts[0] != 'HTTP/1.0' or 'keep-alive' in connection)
+
+            if exchange.head or code in [204, 304]:
+                self.body_left = 0
+            elif 'chunked' in (message.getheader('transfer-encoding') or
+                               '').lower():
+                self.chunked = True
+                self.body_left = None
+            elif message.getheader('content-length'):
+                self.body_left = int(message.getheader('content-length'))
+            else:
+                self.body_left = None  # read until the server closes
+                self.persistent = False
+
+            with exchange.condition:
+                exchange.code = code
+                exchange.reason = parts[2] if len(parts) > 2 else ''
+                exchange.message = message
+                exchange.condition.notify_all()
+            self.state = 'body'
+
+        if self.state != 'body':
+            return
+
+        while True:
+            if self.chunked == 'trailer':  # ends with an empty line
+                end = self.inbound.find('\r\n')
+                if end < 0:
+                    return
+                line, self.inbound = self.inbound[:end], \
+                    self.inbound[end + 2:]
+                if not line:
+                    self._complete()
+                    return
+
+            elif self.chunked and self.body_left is None:  # chunk size
+                end = self.inbound.find('\r\n')
+                if end < 0:
+                    return
+                line, self.inbound = self.inbound[:end], \
+                    self.inbound[end + 2:]
+                self.body_left = int(line.split(';')[0].strip(), 16)
+                if not self.body_left:
+                    self.chunked = 'trailer'
+
+            elif self.chunked:  # chunk data, followed by a CRLF
+                if self.body_left:
+                    taken = self.inbound[:self.body_left]
+                    self.inbound = self.inbound[len(taken):]
+                    self.body_left -= len(taken)
+                    self._deliver(taken)
+                    if self.body_left:
+                        return
+                if len(self.inbound) < 2:
+                    return
+                self.inbound = self.inbound[2:]
+                self.body_left = None
+
+            elif self.body_left is None:  # until the server closes
+                taken, self.inbound = self.inbound, ''
+                self._deliver(taken)
+                return
+
+            else:
+                taken = self.inbound[:self.body_left]
+                self.inbound = self.inbound[len(taken):]
+                self.body_left -= len(taken)
+                self._deliver(taken)
+                if not self.body_left:
+                    self._complete()
+                return
+
+    def _deliver(self, chunk):
+        """Passes a piece of the body to the reader."""
+
+        if not chunk:
+            return
+        exchange = self.exchange
+        with exchange.condition:
+            exchange.body.append(chunk)
+            exchange.buffered += len(chunk)
+            exchange.condition.notify_all()
+
+    def _complete(self):
+        """Finishes the exchange, keeping the connection if possible."""
+
+        self.exchange.finish()
+        self.exchange = None
+        self.deadline = None
+        if self.persistent and not self.inbound:
+            self.state = 'idle'
+        else:
+            self.close()
+
+    def _closed_by_server(self):
+        """Handles the server closing the connection."""
+
+        if self.state == 'body' and self.body_left is None and \
+                not self.chunked:
+            self.persistent = False
+            self._complete()
+        elif self.state == 'headers' and not self.received:
+            self.fail(socket.error(errno.ECONNRESET,
+                                   "Connection closed by server"))
+        else:
+            self.fail(IncompleteRead(''))
+
+
+class _Response(object):
+    """
+    Gives the requesting thread a response from the event loop, with
+    the same interface as the pool's responses (see connections.py).
+    """
+
+    __slots__ = [
+        '_exchange',  # the _Exchange that the body arrives through
+        'headers',    # the response headers, like urllib2's responses
+        'reason',     # the status message given by the server
+        'url',        # URL that was requested (after any redirects)
+    ]
+
+    def __init__(self, exchange, url):
+        """Wraps an exchange whose headers have arrived."""
+
+        self._exchange = exchange
+        self.headers = exchange.message
+        self.reason = exchange.reason
+        self.url = url
+
+    def getcode(self):
+        """Returns the HTTP status code of the response."""
+
+        return self._exchange.code
+
+    def geturl(self):
+        """Returns the URL that was requested."""
+
+        return self.url
+
+    def info(self):
+        """Returns the response headers, as a mimetools.Message."""
+
+        return self._exchange.message
+
+    def read(self, amount=None):
+        """
+        Reads the given number of bytes, or the whole remaining body if
+        no amount is given.
+        """
+
+        return self._exchange.read(amount)
+
+    def close(self):
+        """
+        Finishes up with the response; if its body has not all arrived
+        yet, its connection is closed rather than reused.
+        """
+
+        self._exchange.abandon()
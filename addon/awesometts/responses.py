@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+# AwesomeTTS text-to-speech add-on for Anki
+#
+# Copyright (C) 2014-2016  Anki AwesomeTTS Development Team
+# Copyright (C) 2014-2016  Dave Shifflett
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Persistent cache of web responses that services scrape (e.g. HTML)
+"""
+
+__all__ = ['Responses']
+
+import sqlite3
+from threading import Lock
+from time import time
+
+from .cache import LOCK_SECS
+
+
+MAX_BYTES = 2**20    # largest response body that will be stored
+MAX_ENTRIES = 2000   # most responses kept; the least recently stored go
+STALE_SECS = 604800  # age at which an expired response is not worth keeping
+
+
+class Responses(object):
+    """
+    Keeps the bodies of web responses that services fetch on the way to
+    their audio (e.g. a dictionary's search and article pages, or a demo
+    page's answer with an MP3 URL in it), keyed by the request, so that
+    running a service again for the same input (e.g. with different
+    options, or on a retry) does not need to fetch them again.
+
+    Each response is stored with a time-to-live given by the service. A
+    response that has not expired is answered from the store outright.
+    An expired one is kept along with its ETag and Last-Modified values,
+    if the server gave any, so that the service can make a conditional
+    request and just renew() it if the server says it has not changed.
+
+    Responses are stored in an SQLite3 table, shared by every service
+    and worker thread; the lookups are counted so that the hit rate can
+    be logged.
+    """
+
+    __slots__ = [
+        '_connection',  # open SQLite3 connection, shared by worker threads
+        '_counts',      # dict of lookups that were hits, renewals, misses
+        '_db',          # bundle with path to database, table name
+        '_lock',        # guards the counts and the connection
+        '_logger',      # logger-like interface with debug(), info(), etc.
+    ]
+
+    def __init__(self, db, logger):
+        """
+        The database specification should be a bundle, with:
+
+            - path: full path to the database
+            - table: table name
+
+        Responses that expired more than STALE_SECS ago and any beyond
+        the newest MAX_ENTRIES are dropped as the table is opened.
+        """
+
+        self._counts = dict(hits=0, renewals=0, misses=0)
+        self._db = db
+        self._lock = Lock()
+        self._logger = logger
+
+        # n.b. the file is shared with the cache index (see Cache)
+        self._connection = sqlite3.connect(self._db.path,
+                                           check_same_thread=False,
+                                           timeout=LOCK_SECS)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS %s (key text PRIMARY KEY, '
+            'body blob, etag text, modified text, stored real, '
+            'expires real)' % self._db.table
+        )
+        self._connection.execute(
+            'DELETE FROM %s WHERE expires < ? OR key NOT IN '
+            '(SELECT key FROM %s ORDER BY stored DESC LIMIT ?)' %
+            (self._db.table, self._db.table),
+            (time() - STALE_SECS, MAX_ENTRIES),
+        )
+        self._connection.commit()
+
+        self._logger.debug("Opened response cache with %d entries",
+                           self._connection.execute(
+                               'SELECT COUNT(*) FROM %s' % self._db.table
+                           ).fetchone()[0])
+
+    def lookup(self, key):
+        """
+        Returns a dict with the body, etag, modified, and whether the
+        response is still fresh for the given key, or None if there is
+        no stored response for it.
+
+        A fresh response is counted as a hit right away. A stale one is
+        not counted until the caller reports what became of it (i.e. by
+        calling renew() or store()).
+        """
+
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT body, etag, modified, expires FROM %s WHERE key=?' %
+                self._db.table,
+                (key,),
+            ).fetchone()
+
+            if not row:
+                return None
+
+            fresh = row[3] > time()
+            if fresh:
+                self._counts['hits'] += 1
+
+        return dict(body=str(row[0]), etag=row[1], modified=row[2],
+                    fresh=fresh)
+
+    def renew(self, key, ttl):
+        """
+        Extends a stored response's lifetime by ttl seconds after the
+        server has said that it has not changed.
+        """
+
+        with self._lock:
+            self._counts['renewals'] += 1
+            self._connection.execute(
+                'UPDATE %s SET expires=? WHERE key=?' % self._db.table,
+                (time() + ttl, key),
+            )
+            self._connection.commit()
+
+    def store(self, key, body, ttl, etag=None, modified=None):
+        """
+        Stores a newly fetched response for ttl seconds, counting the
+        lookup that preceded it as a miss. Bodies larger than MAX_BYTES
+        are not stored.
+        """
+
+        with self._lock:
+            self._counts['misses'] += 1
+            if len(body) > MAX_BYTES:
+                return
+
+            now = time()
+            self._connection.execute(
+                'INSERT OR REPLACE INTO %s VALUES (?, ?, ?, ?, ?, ?)' %
+                self._db.table,
+                (key, buffer(body), etag, modified, now, now + ttl),
+            )
+            self._connection.commit()
+
+    def clear(self):
+        """Forgets all stored responses."""
+
+        with self._lock:
+            self._connection.execute('DELETE FROM %s' % self._db.table)
+            self._connection.commit()
+
+    def hit_rate(self):
+        """
+        Returns a short description of how many lookups this session
+        have been answered without downloading a response again.
+        """
+
+        with self._lock:
+            hits = self._counts['hits']
+            renewals = self._counts['renewals']
+            total = hits + renewals + self._counts['misses']
+
+        if not total:
+            return "no lookups yet"
+
+        return "%d%% hit rate (%d hit(s), %d revalidated, %d miss(es))" % (
+            100.0 * (hits + renewals) / total,
+            hits, renewals, total - hits - renewals,
+        )
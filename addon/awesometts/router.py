@@ -29,13 +29,15 @@ import os.path
 from random import shuffle
 import re
 from httplib import IncompleteRead
+from unicodedata import normalize as unicode_normalize
 from socket import error as SocketError
 from time import time
 from urllib2 import URLError
 
 from PyQt4 import QtCore, QtGui
 
-from .service import Trait as BaseTrait
+from .service import Fold as BaseFold, NotInDictionary, \
+    Trait as BaseTrait
 
 
 _SIGNAL = QtCore.SIGNAL('awesomeTtsThreadDone')
@@ -45,7 +47,18 @@ _PREFIXED = lambda prefix, lines: "\n".join(
     for line in (lines if isinstance(lines, list) else lines.split("\n"))
 )
 
+CANONICAL_VERSION = 1  # bump when folding rules or services' FOLDS change
+
+BATCH_CHUNK = 100  # requests examined per event loop turn in a batch
+BATCH_LIMIT = 4    # default number of cache misses a batch runs at once
+
 FAILURE_CACHE_SECS = 3600  # ignore/dump failures from cache after one hour
+FAILURE_DICTIONARY_SECS = 2592000  # ...or 30 days for NotInDictionary
+
+RE_TRAILING_PUNCTUATION = re.compile(
+    u'[\\s.,;:!?\u3001\u3002\uff01\uff0c\uff1a\uff1b\uff1f]+$',
+    re.UNICODE,
+)
 
 RE_MUSTACHE = re.compile(r'\{?\{\{(.+?)\}\}\}?')
 RE_UNSAFE = re.compile(r'[^\w\s()-]', re.UNICODE)
@@ -68,21 +81,26 @@ class Router(object):
 
     Trait = BaseTrait
 
-    class BusyError(RuntimeError):
-        """Raised for requests for files that are already underway."""
+    class CancelledError(RuntimeError):
+        """Passed to callbacks of background work that was called off."""
 
     __slots__ = [
-        '_busy',       # list of file paths that are in-progress
-        '_cache_dir',  # path for writing cached media files
+        '_background',  # dict of queued background file paths to task IDs
+        '_busy',       # dict of in-progress file paths to their waiters
+        '_cache',      # Cache instance indexing the cached media files
         '_config',     # user configuration (dict-like)
-        '_failures',   # lookup of file paths that raised exceptions
+        '_cores',      # number of workers in the services' Transcoder
+        '_failures',   # Failures instance remembering recent failures
         '_logger',     # logger-like interface with debug(), info(), etc.
+        '_metrics',    # Metrics instance keeping per-service statistics
+        '_placement',  # Placement instance for human-readable copies
         '_pool',       # instance of the _Pool class for managing threads
         '_services',   # bundle with dead services, aliases, avail, lookup
         '_temp_dir',   # path for writing human-readable filenames
     ]
 
-    def __init__(self, services, cache_dir, temp_dir, logger, config):
+    def __init__(self, services, cache, failures, metrics, placement,
+                 temp_dir, logger, config, transcoder):
         """
         The services should be a bundle with the following:
 
@@ -94,12 +112,27 @@ class Router(object):
             - kwargs (dict): to be passed to Service constructors
             - config (dict-like): user configuration lookup
 
-        The cache directory should be one where media files get stored
-        for a semi-permanent time.
+        The cache should be a Cache instance whose directory is one
+        where media files get stored for a semi-permanent time.
+
+        The failures should be a Failures instance, which remembers the
+        cache paths that recently failed to generate.
+
+        The metrics should be a Metrics instance, which is told about
+        every cache lookup and service run.
+
+        The placement should be a Placement instance, which is used to
+        put human-readable copies of cached files in the temp_dir.
 
         The logger object should have an interface like the one used by
         the standard library logging module, with debug(), info(), and
         so on, available.
+
+        The transcoder should be the Transcoder instance shared by the
+        services. Local services that transcode may run as many requests
+        at once as it has workers (or the configured local limit, if
+        higher), and the pool grows to make room for them, so that the
+        engines of a whole-deck batch keep every core busy.
         """
 
         services.aliases = {
@@ -118,12 +151,19 @@ class Router(object):
             for svc_id, svc_class in services.mappings
         }
 
-        self._busy = []
-        self._cache_dir = cache_dir
+        self._background = {}
+        self._busy = {}
+        self._cache = cache
         self._config = config
-        self._failures = {}
+        self._cores = transcoder.stats()['size']
+        self._failures = failures
         self._logger = logger
-        self._pool = _Pool(logger)
+        self._metrics = metrics
+        self._placement = placement
+        self._pool = _Pool(logger, size=lambda: max(
+            config['pool_total'],
+            self._cores + 1,  # i.e. a full local lane plus one more
+        ))
         self._services = services
         self._temp_dir = temp_dir
 
@@ -234,26 +274,67 @@ class Router(object):
         entries from the cache.
         """
 
-        now = time()
-        for path, (when, _) in self._failures.items():
-            if now - when > FAILURE_CACHE_SECS:
-                del self._failures[path]
+        return self._failures.count()
+
+    def get_pool_stats(self):
+        """
+        Returns the queue depth and worker counts of the thread pool,
+        along with running and queued task counts for each service.
+        """
+
+        return self._pool.stats()
+
+    def cancel_background(self):
+        """
+        Calls off all background runs that have not yet started; their
+        callers get a CancelledError.
+        """
+
+        self._pool.cancel_background(self.CancelledError(
+            "Background request was cancelled"
+        ))
+
+    def forget_missing(self, path):
+        """
+        Called when a caller could not open or play a path that it was
+        given. If the file is not there, it is dropped from the cache
+        index, so that the next request for it generates it again
+        rather than being answered with the same missing file. Returns
+        True if the file was missing.
+        """
+
+        if os.path.exists(path):
+            return False
 
-        return len(self._failures)
+        self._logger.warn("%s has gone missing; forgetting it", path)
+        self._cache.remove(path)
+        return True
 
-    def forget_failures(self):
-        """Delete the cache of remembered failures."""
+    def forget_failures(self, svc_ids=None):
+        """
+        Delete the remembered failures for the given list of service
+        IDs, or for all services if no list is given.
+        """
+
+        self._failures.forget(svc_ids)
+
+    def get_metrics(self, lifetime=False):
+        """
+        Returns the statistics of each service (cache hits and misses,
+        latencies, download sizes, errors) for this session, or for all
+        time if lifetime is True. See Metrics.report() for details.
+        """
 
-        self._failures = {}
+        return self._metrics.report(lifetime)
 
     def group(self, text, group, presets, callbacks,
-              want_human=False, note=None):
+              want_human=False, note=None, background=False):
         """
         Execute a group playback request using the passed group to be
         looked up using the passed presets.
 
-        The callbacks follow the same rules as in the regular bare call
-        method.
+        The callbacks and the background flag follow the same rules as
+        in the regular bare call method.
 
         If passed, want_human should be a template string that dictates
         how the caller wants the filename in the path to be formatted.
@@ -296,8 +377,8 @@ class Router(object):
                     callbacks['then']()
 
             def on_fail(exception):
-                """Go to next, unless playback already queued."""
-                if isinstance(exception, self.BusyError):
+                """Go to next, unless the request was called off."""
+                if isinstance(exception, self.CancelledError):
                     if 'done' in callbacks:
                         callbacks['done']()
                     callbacks['fail'](exception)
@@ -328,12 +409,13 @@ class Router(object):
                     svc_id = preset.pop('service')
                     self(svc_id=svc_id, text=text, options=preset,
                          callbacks=internal_callbacks,
-                         want_human=want_human, note=note)
+                         want_human=want_human, note=note,
+                         background=background)
 
             try_next()
 
     def __call__(self, svc_id, text, options, callbacks,
-                 want_human=False, note=None):
+                 want_human=False, note=None, background=False):
         """
         Given the service ID and associated options, pass the text into
         the service for processing.
@@ -374,6 +456,17 @@ class Router(object):
               be called, or an exception in the 'fail' handler would
               not recall the 'fail' handler again
 
+        If the same file is already being generated for another caller
+        (e.g. an automatic playback and a shortcut key press in quick
+        succession), this call waits on that run and gets its callbacks
+        when it finishes, rather than running the service again.
+
+        If background is True, the service run (if needed) only takes a
+        worker thread when one is not needed for other requests, and it
+        may be called off with cancel_background() until it starts, in
+        which case the fail callback gets a CancelledError. A regular
+        request that joins a queued background run promotes it.
+
         If passed, want_human should be a template string that dictates
         how the caller wants the filename in the path to be formatted.
         Additionally, note may be passed to provide mustache values for
@@ -385,48 +478,22 @@ class Router(object):
         try:
             self._logger.debug("Call for '%s' w/ %s", svc_id, options)
 
-            if not text:
-                raise ValueError("No speakable text is present")
-            svc_id, service, options = self._validate_service(svc_id, options)
-            text = service['instance'].modify(text)
-            if not text:
-                raise ValueError("Text not usable by " + service['class'].NAME)
-            path = self._validate_path(svc_id, text, options)
-            cache_hit = os.path.exists(path)
+            svc_id, service, text, options, path = \
+                self._prepare(svc_id, text, options)
+            human = self._path_humanizer(want_human, svc_id, text, options,
+                                         note)
+            hit_path = path not in self._busy and self._cache.hit(path) \
+                and self._open_hit(path, human)
+            cache_hit = bool(hit_path)
+            self._metrics.lookup(svc_id, cache_hit)
 
             self._logger.debug(
                 "Parsed call to '%s' w/ %s and \"%s\" at %s (cache %s)",
                 svc_id, options, text, path, "hit" if cache_hit else "miss",
             )
 
-            # If we didn't get a cache hit, we have to call the real service,
-            # so check to see if it has any extras defined, and if so, add
-            # them to the options lookup for the service to use.
-            #
-            # n.b.: Even though the extras do not factor into an audio clip's
-            # cache path, they MIGHT need to factor into the failure cache in
-            # the future... This could be done by generating a special `fpath`
-            # value during this loop, and use that with the `_failures` lookup
-            # instead of the vanilla `path` (but this is a non-issue today,
-            # because iSpeech is the only `extras` service, and it has caching
-            # turned off, being that it is a paid-for key service
-
-            if not cache_hit:
-                for extra in self.get_extras(svc_id):
-                    key = extra['key']
-                    try:
-                        options[key] = self._config['extras'][svc_id][key]
-                        options[key] = options[key].strip()
-                        if not options[key]:
-                            raise KeyError
-                    except KeyError:
-                        if extra['required']:
-                            raise KeyError(
-                                "%s required to access %s" %
-                                (extra['label'].rstrip(':'), svc_id)
-                            )
-                        else:
-                            options[key] = None
+            if not (cache_hit or path in self._busy):
+                self._prepare_extras(svc_id, options)
 
         except Exception as exception:  # catch all, pylint:disable=W0703
             if 'done' in callbacks:
@@ -437,141 +504,83 @@ class Router(object):
 
             return
 
-        if want_human:
-            def human(path):
-                """Converts path filename into a human-readable one."""
-
-                if not os.path.isdir(self._temp_dir):
-                    os.mkdir(self._temp_dir)
-
-                def substitute(match):
-                    """Perform variable substitution on filename."""
-
-                    key = match.group(1).strip()
-
-                    if key:
-                        lower = key.lower()
-
-                        if lower == 'service':
-                            return svc_id
-                        if lower == 'text':
-                            return text
-                        if lower == 'voice':
-                            return options['voice'].lower()
-
-                        try:
-                            return note[key]  # exact field match
-                        except:  # ignore error, pylint:disable=bare-except
-                            pass
-
-                        try:
-                            for other_key in note.keys():
-                                if other_key.strip().lower() == lower:
-                                    return note[other_key]  # fuzzy field match
-                        except:  # ignore error, pylint:disable=bare-except
-                            pass
-
-                    return ''  # invalid key / no such note field
-
-                filename = RE_MUSTACHE.sub(substitute, want_human)
-                filename = RE_UNSAFE.sub('', filename)
-                filename = RE_WHITESPACE.sub(' ', filename).strip()
-                if not filename or filename.lower() in WINDOWS_RESERVED:
-                    filename = u'AwesomeTTS Audio'
-                else:
-                    filename = filename[0:90]  # accommodate NTFS path limits
-                filename = 'ATTS ' + filename + '.mp3'
-
-                from shutil import copyfile
-                new_path = os.path.join(self._temp_dir, filename)
-                copyfile(path, new_path)
-
-                return new_path
-
-        else:
-            human = lambda path: path
+        failure = None if cache_hit else self._failure(path)
 
         if cache_hit:
             if 'done' in callbacks:
                 callbacks['done']()
-            callbacks['okay'](human(path))
+            callbacks['okay'](hit_path)
             if 'then' in callbacks:
                 callbacks['then']()
 
-        elif (path in self._failures and
-              time() - self._failures[path][0] < FAILURE_CACHE_SECS):
+        elif failure:
             if 'done' in callbacks:
                 callbacks['done']()
-            callbacks['fail'](self._failures[path][1])
+            callbacks['fail'](failure)
             if 'then' in callbacks:
                 callbacks['then']()
 
         else:
-            def on_error(exception):
-                """
-                For Internet-based services, cache errors. Certain
-                exceptions are not cached, as they are usually network
-                or connectivity errors.
-
-                Afterward, pass exception to the fail handler.
-                """
-
-                if BaseTrait.INTERNET in service['class'].TRAITS and \
-                   not isinstance(exception, IncompleteRead) and \
-                   not isinstance(exception, SocketError) and \
-                   not isinstance(exception, URLError):
-                    self._failures[path] = time(), exception
-                callbacks['fail'](exception)
-
-            service['instance'].net_reset()
-            self._busy.append(path)
-
-            completion_callback = lambda exception: (
-                self._busy.remove(path),
-
-                'done' in callbacks and callbacks['done'](),
-
-                'miss' in callbacks and callbacks['miss'](
-                    svc_id,
-                    service['instance'].net_count()
-                ),
-
-                on_error(exception) if exception
-                else callbacks['okay'](human(path)) if os.path.exists(path)
-                else on_error(RuntimeError(
-                    "The %s service did not successfully write out "
-                    "an MP3." % service['name']
-                )),
+            def on_complete(exception, net_count):
+                """Executes caller callbacks once the service has run."""
 
-                'then' in callbacks and callbacks['then'](),
-            )
+                if 'done' in callbacks:
+                    callbacks['done']()
+                if 'miss' in callbacks:
+                    callbacks['miss'](svc_id, net_count)
+                if exception:
+                    callbacks['fail'](exception)
+                else:
+                    callbacks['okay'](human(path))
+                if 'then' in callbacks:
+                    callbacks['then']()
 
-            def do_spawn():
-                """Call if ready to start a thread to run the service."""
-                self._pool.spawn(
-                    task=lambda: service['instance'].run(text, options, path),
-                    callback=completion_callback,
-                )
+            self._synthesize(svc_id, service, text, options, path,
+                             on_complete, background)
 
-            if hasattr(service['instance'], 'prerun'):
-                def prerun_ok(result):
-                    options['prerun'] = result
-                    do_spawn()
+    def batch(self, requests, callbacks, limit=BATCH_LIMIT):
+        """
+        Executes many requests at once, returning a handle with pause(),
+        resume(), and cancel() methods.
 
-                def prerun_error(exception):
-                    self._logger.error("Asynchronous exception in prerun: %s",
-                                       exception)
-                    completion_callback(exception)
+        Each request is a dict with 'svc_id', 'text', and 'options', and
+        optionally 'want_human' and 'note', which all follow the same
+        rules as they do for the regular bare call method.
 
-                try:
-                    service['instance'].prerun(text, options, path,
-                                               prerun_ok, prerun_error)
-                except Exception as exception:  # all, pylint:disable=W0703
-                    self._logger.error("Synchronous exception in prerun: %s",
-                                       exception)
-                    completion_callback(exception)
-            else:
-                do_spawn()
+        The callbacks parameter is a dict and contains the following:
+
+            - 'miss' (optional): called with a svc_id and download count
+              each time a cache miss occurred running the service
+            - 'okay' (required): called with the request dict and a path
+              to the media file
+            - 'fail' (required): called with the request dict and an
+              exception for validation errors or failed service calls
+            - 'then' (optional): called once after every request has
+              been answered (or the batch has been cancelled)
+
+        Cache keys are computed up front and requests that resolve to
+        the same cache path are only run through the service once, with
+        every one of them answered when that run finishes. Cache hits
+        are answered as they are found, in chunks between which the
+        event loop is allowed to run, while misses are run no more than
+        limit at a time.
+
+        Pausing the batch holds back any cache misses that have not yet
+        started, but does not stop cache hits from being answered.
+        Cancelling the batch drops any requests that have not yet been
+        answered; the 'then' callback still fires once the runs that
+        are already underway have finished.
+        """
+
+        assert 'miss' not in callbacks or callable(callbacks['miss'])
+        assert 'okay' in callbacks and callable(callbacks['okay'])
+        assert 'fail' in callbacks and callable(callbacks['fail'])
+        assert 'then' not in callbacks or callable(callbacks['then'])
+        assert limit > 0, "limit must be positive"
+
+        handle = _Batch(self, requests, callbacks, limit)
+        handle.start()
+        return handle
 
     def _call_assert_callbacks(self, callbacks):
         """Checks the callbacks argument for validity."""
@@ -582,6 +591,320 @@ class Router(object):
         assert 'fail' in callbacks and callable(callbacks['fail'])
         assert 'then' not in callbacks or callable(callbacks['then'])
 
+    def _prepare(self, svc_id, text, options):
+        """
+        Validates the given request, returning the normalized service
+        ID, service lookup dict, modified text, normalized options, and
+        cache path.
+
+        The cache path is derived from the text as folded by the
+        service's FOLDS (see _canonical()). Files that were cached under
+        the unfolded text before folding was introduced are still found
+        by way of the cache's alias index.
+
+        Raises an exception if the request cannot be satisfied.
+        """
+
+        if not text:
+            raise ValueError("No speakable text is present")
+        svc_id, service, options = self._validate_service(svc_id, options)
+        text = service['instance'].modify(text)
+        if not text:
+            raise ValueError("Text not usable by " + service['class'].NAME)
+
+        canonical = self._canonical(text, service['class'].FOLDS)
+        path = self._path_cache(svc_id, canonical, options)
+        if canonical != text:
+            path = self._cache.resolve(
+                path,
+                lambda: self._path_cache(svc_id, text, options),
+                CANONICAL_VERSION,
+            )
+
+        return svc_id, service, text, options, path
+
+    @staticmethod
+    def _canonical(text, folds):
+        """
+        Returns the text with the given folds applied, for hashing into
+        a cache path. The result is never folded down to nothing.
+        """
+
+        folded = text
+
+        if BaseFold.UNICODE in folds and isinstance(folded, unicode):
+            folded = unicode_normalize('NFC', folded)
+        if BaseFold.WHITESPACE in folds:
+            folded = ' '.join(folded.split())
+        if BaseFold.CASE in folds:
+            folded = folded.lower()
+        if BaseFold.PUNCTUATION in folds:
+            folded = RE_TRAILING_PUNCTUATION.sub('', folded)
+
+        return folded or text
+
+    def _prepare_extras(self, svc_id, options):
+        """
+        Because we have to call the real service, check to see if it has
+        any extras defined, and if so, add them to the options lookup for
+        the service to use.
+
+        n.b.: Even though the extras do not factor into an audio clip's
+        cache path, they MIGHT need to factor into the failure cache in
+        the future... This could be done by generating a special `fpath`
+        value during this loop, and use that with the `_failures` lookup
+        instead of the vanilla `path` (but this is a non-issue today,
+        because iSpeech is the only `extras` service, and it has caching
+        turned off, being that it is a paid-for key service
+        """
+
+        for extra in self.get_extras(svc_id):
+            key = extra['key']
+            try:
+                options[key] = self._config['extras'][svc_id][key]
+                options[key] = options[key].strip()
+                if not options[key]:
+                    raise KeyError
+            except KeyError:
+                if extra['required']:
+                    raise KeyError(
+                        "%s required to access %s" %
+                        (extra['label'].rstrip(':'), svc_id)
+                    )
+                else:
+                    options[key] = None
+
+    def _failure(self, path):
+        """
+        Returns the exception remembered for the given cache path, if it
+        failed recently, or None otherwise.
+        """
+
+        return self._failures.get(path)
+
+    def _synthesize(self, svc_id, service, text, options, path, callback,
+                    background=False):
+        """
+        Runs the service in a worker thread to produce the given cache
+        path. When finished, the callback is called from the main thread
+        with an exception (or None) and the number of downloads the run
+        required.
+
+        If the path is already being produced, the callback joins the
+        run that is underway instead of starting another one, and it
+        is called with a download count of zero, so that a single run
+        is not counted more than once. If the run was queued in the
+        background and this request is not, it is promoted.
+
+        If trimming or leveling is turned on in the configuration, the
+        service's MP3 is polished (see Service.util_polish()) on the same
+        worker thread, before it is added to the cache. If that fails,
+        the unpolished MP3 is removed, so that it is not later mistaken
+        for a polished one.
+
+        Successful runs are added to the cache index, and failures from
+        Internet-based services are remembered, except for those that
+        are usually network or connectivity errors. Either way, the run
+        is recorded in the metrics, with the service's measurements
+        collected from the thread(s) it ran on.
+        """
+
+        if path in self._busy:
+            self._logger.debug("Joining in-progress run for %s", path)
+            self._busy[path].append(callback)
+            if not background and path in self._background:
+                self._pool.promote(self._background.pop(path))
+            return
+
+        instance = service['instance']
+        measured = {}
+        started = time()
+
+        def tally(stats):
+            """Adds the service's measurements to those of this run."""
+
+            for name, amount in stats.items():
+                measured[name] = measured.get(name, 0) + amount
+
+        trim, loudness = self._polishing()
+
+        def task():
+            """Runs the service, measuring it from the worker thread."""
+
+            instance.stats_reset()
+            try:
+                instance.run(text, options, path)
+                if (trim or loudness) and os.path.exists(path):
+                    try:
+                        instance.util_polish(path, trim, loudness)
+                    except:  # drop unpolished MP3, pylint:disable=W0702
+                        instance.path_unlink(path)
+                        raise
+            finally:
+                tally(instance.stats())
+
+        def completion_callback(exception):
+            """Tidies up after the run and passes on its result."""
+
+            waiters = self._busy.pop(path)
+            self._background.pop(path, None)
+
+            if not (exception or os.path.exists(path)):
+                exception = RuntimeError(
+                    "The %s service did not successfully write out "
+                    "an MP3." % service['name']
+                )
+
+            if not isinstance(exception, self.CancelledError):
+                self._metrics.run(svc_id, time() - started, measured,
+                                  exception)
+
+            if not exception:
+                self._cache.add(path)
+
+            elif BaseTrait.INTERNET in service['class'].TRAITS and \
+                    not isinstance(exception, self.CancelledError) and \
+                    not isinstance(exception, IncompleteRead) and \
+                    not isinstance(exception, SocketError) and \
+                    not isinstance(exception, URLError):
+                self._failures.add(
+                    path, svc_id, text, exception,
+                    service['class'].FAILURE_TTL or
+                    (FAILURE_DICTIONARY_SECS
+                     if isinstance(exception, NotInDictionary)
+                     else FAILURE_CACHE_SECS),
+                )
+
+            net_count = measured.get('netops', 0)
+            for waiter in waiters:
+                waiter(exception, net_count)
+                net_count = 0
+
+        self._busy[path] = [callback]
+
+        def do_spawn():
+            """Call if ready to start a thread to run the service."""
+            if BaseTrait.INTERNET in service['traits']:
+                limit = self._config['pool_internet']
+            elif BaseTrait.TRANSCODING in service['traits']:
+                limit = max(self._config['pool_local'], self._cores)
+            else:
+                limit = self._config['pool_local']
+
+            task_id = self._pool.spawn(
+                task=task,
+                callback=completion_callback,
+                group=svc_id,
+                limit=limit,
+                background=background,
+            )
+            if background:
+                self._background[path] = task_id
+
+        if hasattr(instance, 'prerun'):
+            instance.stats_reset()
+
+            def prerun_ok(result):
+                tally(instance.stats())
+                options['prerun'] = result
+                do_spawn()
+
+            def prerun_error(exception):
+                self._logger.error("Asynchronous exception in prerun: %s",
+                                   exception)
+                tally(instance.stats())
+                completion_callback(exception)
+
+            try:
+                instance.prerun(text, options, path, prerun_ok, prerun_error)
+            except Exception as exception:  # all, pylint:disable=W0703
+                self._logger.error("Synchronous exception in prerun: %s",
+                                   exception)
+                tally(instance.stats())
+                completion_callback(exception)
+        else:
+            do_spawn()
+
+    def _open_hit(self, path, human):
+        """
+        Returns human(path) for a cache hit, or None if the file turns
+        out not to be there (i.e. it was deleted behind the cache index's
+        back), in which case it is forgotten and the request goes on as
+        a cache miss.
+
+        n.b. Only a human-readable copy opens the file here; callers
+        given the cache path itself report a missing file through
+        forget_missing() instead.
+        """
+
+        try:
+            return human(path)
+        except EnvironmentError:
+            if not self.forget_missing(path):
+                raise
+            return None
+
+    def _path_humanizer(self, want_human, svc_id, text, options, note):
+        """
+        Returns a callable that converts a cache path into the path the
+        caller wants, i.e. a copy with a human-readable filename if the
+        want_human template string is set, or the cache path itself.
+        """
+
+        if not want_human:
+            return lambda path: path
+
+        def human(path):
+            """Converts path filename into a human-readable one."""
+
+            if not os.path.isdir(self._temp_dir):
+                os.mkdir(self._temp_dir)
+
+            def substitute(match):
+                """Perform variable substitution on filename."""
+
+                key = match.group(1).strip()
+
+                if key:
+                    lower = key.lower()
+
+                    if lower == 'service':
+                        return svc_id
+                    if lower == 'text':
+                        return text
+                    if lower == 'voice':
+                        return options['voice'].lower()
+
+                    try:
+                        return note[key]  # exact field match
+                    except:  # ignore error, pylint:disable=bare-except
+                        pass
+
+                    try:
+                        for other_key in note.keys():
+                            if other_key.strip().lower() == lower:
+                                return note[other_key]  # fuzzy field match
+                    except:  # ignore error, pylint:disable=bare-except
+                        pass
+
+                return ''  # invalid key / no such note field
+
+            filename = RE_MUSTACHE.sub(substitute, want_human)
+            filename = RE_UNSAFE.sub('', filename)
+            filename = RE_WHITESPACE.sub(' ', filename).strip()
+            if not filename or filename.lower() in WINDOWS_RESERVED:
+                filename = u'AwesomeTTS Audio'
+            else:
+                filename = filename[0:90]  # accommodate NTFS path limits
+            filename = 'ATTS ' + filename + '.mp3'
+
+            new_path = os.path.join(self._temp_dir, filename)
+            self._placement.place(path, new_path)
+
+            return new_path
+
+        return human
+
     def _validate_service(self, svc_id, options):
         """
         Finds the given service ID, normalizes the text, and validates
@@ -680,22 +1003,6 @@ class Router(object):
 
         return problems
 
-    def _validate_path(self, svc_id, text, options):
-        """
-        Given the service ID, its associated options, and the desired
-        text, generate a cache path. If the file is already being
-        processed, raise a BusyError.
-        """
-
-        path = self._path_cache(svc_id, text, options)
-        if path in self._busy:
-            raise self.BusyError(
-                "The '%s' service is already busy processing %s." %
-                (svc_id, path)
-            )
-
-        return path
-
     def _fetch_options_and_extras(self, svc_id):
         """
         Identifies the service by its ID, checks to see if the options
@@ -832,11 +1139,22 @@ class Router(object):
                 service['name'], _PREFIXED("!!! ", format_exc().split('\n')),
             )
 
+    def _polishing(self):
+        """
+        Returns whether trimming and leveling are turned on, as a tuple.
+        """
+
+        return self._config['audio_trim'], self._config['audio_loudness']
+
     def _path_cache(self, svc_id, text, options):
         """
         Returns a consistent cache path given the svc_id, text, and
         options. This can be used to repeat the same request yet reuse
         the same path.
+
+        Clips that are trimmed or leveled get paths of their own, so
+        that turning either on or off regenerates them; when both are
+        off, the paths are the same as they always have been.
         """
 
         hash_input = '/'.join([
@@ -852,6 +1170,12 @@ class Router(object):
             )
         ])
 
+        trim, loudness = self._polishing()
+        if trim or loudness:
+            hash_input = '/'.join([hash_input,
+                                   'trim' if trim else '',
+                                   'loudness' if loudness else ''])
+
         from hashlib import sha1
 
         hex_digest = sha1(
@@ -861,7 +1185,7 @@ class Router(object):
 
         assert len(hex_digest) == 40, "unexpected output from hash library"
         return os.path.join(
-            self._cache_dir,
+            self._cache.directory,
             '.'.join([
                 '-'.join([
                     svc_id, hex_digest[:8], hex_digest[8:16],
@@ -872,52 +1196,390 @@ class Router(object):
         )
 
 
+class _Batch(object):
+    """
+    Tracks the progress of a bulk request started with Router.batch(),
+    grouping requests by their cache path and keeping a bounded number
+    of service runs going at once.
+    """
+
+    __slots__ = [
+        '_callbacks',  # dict of okay, fail, and optional miss/then
+        '_cancelled',  # True if the caller has given up on the batch
+        '_finished',   # True once the then callback has been called
+        '_groups',     # dict mapping cache paths to pending/running groups
+        '_index',      # position of the next request to be examined
+        '_limit',      # maximum number of service runs going at once
+        '_paused',     # True if queued groups should not be started yet
+        '_queue',      # list of groups waiting for their service run
+        '_requests',   # list of request dicts as passed by the caller
+        '_router',     # Router instance that created this batch
+        '_running',    # number of service runs currently underway
+    ]
+
+    def __init__(self, router, requests, callbacks, limit):
+        """
+        Initialize the batch; nothing is examined until start() is
+        called.
+        """
+
+        self._callbacks = callbacks
+        self._cancelled = False
+        self._finished = False
+        self._groups = {}
+        self._index = 0
+        self._limit = limit
+        self._paused = False
+        self._queue = []
+        self._requests = list(requests)
+        self._router = router
+        self._running = 0
+
+    def start(self):
+        """Begin examining requests on the next turn of the event loop."""
+
+        QtCore.QTimer.singleShot(0, self._examine)
+
+    def pause(self):
+        """Hold back any cache misses that have not yet been started."""
+
+        self._paused = True
+
+    def resume(self):
+        """Allow held back cache misses to start again."""
+
+        self._paused = False
+        self._pump()
+        self._check_finished()
+
+    def cancel(self):
+        """
+        Drop any requests that have not yet been answered. Service runs
+        that are already underway are allowed to finish, but their
+        results are not passed on.
+        """
+
+        self._cancelled = True
+        for group in self._queue:
+            del self._groups[group['path']]
+        self._queue = []
+        self._check_finished()
+
+    def _examine(self):
+        """
+        Examine the next chunk of requests, answering cache hits and
+        known failures right away and queueing up one group for each
+        distinct cache miss. If requests remain, the next chunk is
+        examined on a later turn of the event loop.
+        """
+
+        router = self._router
+        okay = self._callbacks['okay']
+        fail = self._callbacks['fail']
+        stop = min(self._index + BATCH_CHUNK, len(self._requests))
+
+        while self._index < stop and not self._cancelled:
+            request = self._requests[self._index]
+            self._index += 1
+            answer = None  # (callback, argument), once decided
+
+            try:
+                svc_id, service, text, options, path = router._prepare(
+                    request['svc_id'], request['text'],
+                    dict(request['options']),
+                )
+                human = router._path_humanizer(
+                    request.get('want_human'),
+                    svc_id, text, options, request.get('note'),
+                )
+
+                hit_path = path not in self._groups and \
+                    path not in router._busy and \
+                    router._cache.hit(path) and \
+                    router._open_hit(path, human)
+
+                if path in self._groups:
+                    self._groups[path]['members'].append((request, human))
+
+                elif hit_path:
+                    router._metrics.lookup(svc_id, True)
+                    answer = okay, hit_path
+
+                else:
+                    router._metrics.lookup(svc_id, False)
+                    failure = router._failure(path)
+                    if failure:
+                        answer = fail, failure
+
+                    else:
+                        # n.b. even if a run for the path is in flight,
+                        # as it may finish before this group is pumped
+                        router._prepare_extras(svc_id, options)
+
+                        group = self._groups[path] = dict(
+                            svc_id=svc_id,
+                            service=service,
+                            text=text,
+                            options=options,
+                            path=path,
+                            members=[(request, human)],
+                        )
+                        self._queue.append(group)
+
+            except Exception as exception:  # catch all, pylint:disable=W0703
+                answer = fail, exception
+
+            # n.b. outside of the try, so that a callback that raises is
+            # not then also reported to the fail callback
+            if answer:
+                callback, argument = answer
+                callback(request, argument)
+
+        self._pump()
+
+        if self._index < len(self._requests) and not self._cancelled:
+            QtCore.QTimer.singleShot(0, self._examine)
+        else:
+            self._check_finished()
+
+    def _pump(self):
+        """Start queued groups until the concurrency limit is reached."""
+
+        while self._queue and self._running < self._limit and \
+                not (self._paused or self._cancelled):
+            group = self._queue.pop(0)
+            self._running += 1
+            self._router._synthesize(
+                group['svc_id'], group['service'], group['text'],
+                group['options'], group['path'],
+                lambda exception, net_count, group=group:
+                self._on_complete(group, exception, net_count),
+            )
+
+    def _on_complete(self, group, exception, net_count):
+        """
+        Answer every request in the group with the result of its
+        service run, then keep the queue moving.
+        """
+
+        self._running -= 1
+        del self._groups[group['path']]
+
+        if not self._cancelled:
+            if 'miss' in self._callbacks:
+                self._callbacks['miss'](group['svc_id'], net_count)
+
+            for request, human in group['members']:
+                if self._cancelled:
+                    break
+                elif exception:
+                    self._callbacks['fail'](request, exception)
+                else:
+                    try:
+                        path = human(group['path'])
+                    except Exception as problem:  # all, pylint:disable=W0703
+                        self._callbacks['fail'](request, problem)
+                    else:
+                        self._callbacks['okay'](request, path)
+
+        self._pump()
+        self._check_finished()
+
+    def _check_finished(self):
+        """
+        Call the then callback, once, if every request has been
+        answered or the batch was cancelled and nothing is running.
+        """
+
+        if self._finished or self._running:
+            return
+        if not self._cancelled and (self._queue or
+                                    self._index < len(self._requests)):
+            return
+
+        self._finished = True
+        if 'then' in self._callbacks:
+            self._callbacks['then']()
+
+
 class _Pool(QtGui.QWidget):
     """
-    Managers a pool of worker threads to keep the UI responsive.
+    Manages a bounded pool of reusable worker threads to keep the UI
+    responsive without flooding services with simultaneous requests.
+
+    Tasks beyond the pool's global limit, or beyond the limit given for
+    their group (e.g. a service ID), wait in a first-in, first-out
+    queue until a worker and a slot for their group free up.
+
+    Background tasks wait behind all other tasks and never take the
+    last free worker (unless the pool only has one), so that they do
+    not hold up requests the user is waiting on.
     """
 
     __slots__ = [
-        '_current_id',  # the last/current worker ID in-use
+        '_active',      # dict of group names mapping to running task counts
+        '_current_id',  # the last/current task ID in-use
+        '_idle',        # list of finished workers available for reuse
         '_logger',      # for writing messages about threads
+        '_queue',       # list of task dicts waiting for a worker
+        '_size',        # callable returning the global worker limit
         '_threads',     # dict of IDs mapping workers and callbacks in Router
     ]
 
-    def __init__(self, logger, *args, **kwargs):
+    def __init__(self, logger, size, *args, **kwargs):
         """
-        Initialize my internal state (next ID and lookup pools for the
-        callbacks and workers).
+        Initialize my internal state (next ID, queue, and lookup pools
+        for the callbacks and workers).
+
+        The size should be a callable returning the maximum number of
+        workers that may run at once; it is consulted every time a task
+        is dispatched, so changes take effect without a restart.
         """
 
         super(_Pool, self).__init__(*args, **kwargs)
 
+        self._active = {}
         self._current_id = 0
+        self._idle = []
         self._logger = logger
+        self._queue = []
+        self._size = size
         self._threads = {}
 
-    def spawn(self, task, callback):
+    def spawn(self, task, callback, group=None, limit=None,
+              background=False):
         """
-        Create a worker thread for the given task. When the thread
-        completes, the callback will be called.
+        Queue the given task for a worker thread, returning its task ID.
+        When the task completes, the callback will be called.
+
+        If a group and limit are given, no more than limit tasks from
+        that group will be running at the same time.
         """
 
         self._current_id += 1
-        thread = self._threads[self._current_id] = {
-            # keeping a reference to worker prevents garbage collection
+        self._queue.append({
+            'background': background,
             'callback': callback,
-            'done': False,
-            'worker': _Worker(self._current_id, task),
-        }
-
-        self.connect(thread['worker'], _SIGNAL, self._on_worker_signal)
-        thread['worker'].finished.connect(self._on_worker_finished)
-        thread['worker'].start()
+            'group': group,
+            'id': self._current_id,
+            'limit': limit,
+            'task': task,
+        })
 
         self._logger.debug(
-            "Spawned thread [%d]; pool=%s",
-            self._current_id, self._threads,
+            "Queued %stask [%d] for %s; queue depth=%d",
+            "background " if background else "", self._current_id,
+            group or "pool", len(self._queue),
         )
 
+        self._dispatch()
+        return self._current_id
+
+    def promote(self, task_id):
+        """Turns the given queued background task into a regular one."""
+
+        for pending in self._queue:
+            if pending['id'] == task_id:
+                pending['background'] = False
+                self._dispatch()
+                return
+
+    def cancel_background(self, exception):
+        """
+        Drops background tasks that have not yet started, calling their
+        callbacks with the given exception.
+        """
+
+        cancelled = [pending for pending in self._queue
+                     if pending['background']]
+        if not cancelled:
+            return
+
+        self._queue = [pending for pending in self._queue
+                       if not pending['background']]
+        self._logger.debug("Cancelled %d background task(s)",
+                           len(cancelled))
+
+        for pending in cancelled:
+            pending['callback'](exception)
+
+    def stats(self):
+        """
+        Returns a dict with the current queue depth (and how much of it
+        is background work), number of active and idle workers, and
+        per-group counts of running and queued tasks (as 2-tuples).
+        """
+
+        groups = {group: [count, 0]
+                  for group, count in self._active.items()
+                  if count}
+        for pending in self._queue:
+            groups.setdefault(pending['group'], [0, 0])[1] += 1
+
+        return {
+            'queued': len(self._queue),
+            'background': sum(1 for pending in self._queue
+                              if pending['background']),
+            'active': len(self._threads),
+            'idle': len(self._idle),
+            'groups': {group: tuple(counts)
+                       for group, counts in groups.items()},
+        }
+
+    def _dispatch(self):
+        """
+        Start as many queued tasks as the global and per-group limits
+        currently allow, skipping over tasks whose group is saturated.
+        """
+
+        size = max(1, self._size())
+        background_size = max(1, size - 1)
+        index = 0
+
+        # regular tasks first, then background ones while there is room
+        self._queue.sort(key=lambda pending: pending['background'])
+
+        while index < len(self._queue) and len(self._threads) < size:
+            pending = self._queue[index]
+            group = pending['group']
+
+            if pending['background'] and \
+               len(self._threads) >= background_size:
+                break
+
+            if pending['limit'] and \
+               self._active.get(group, 0) >= pending['limit']:
+                index += 1
+                continue
+
+            del self._queue[index]
+            self._active[group] = self._active.get(group, 0) + 1
+
+            if self._idle:
+                worker = self._idle.pop()
+            else:
+                worker = _Worker()
+                self.connect(worker, _SIGNAL, self._on_worker_signal)
+                worker.finished.connect(self._on_worker_finished)
+
+            thread_id = pending['id']
+            self._threads[thread_id] = {
+                # keeping a reference to worker prevents garbage collection
+                'callback': pending['callback'],
+                'done': False,
+                'group': group,
+                'worker': worker,
+            }
+
+            worker.assign(thread_id, pending['task'])
+            worker.start()
+
+            self._logger.debug(
+                "Started task [%d] for %s; active=%d, queue depth=%d",
+                thread_id, group or "pool", len(self._threads),
+                len(self._queue),
+            )
+
     def _on_worker_signal(self, thread_id, exception=None, stack_trace=None):
         """
         When the worker signals it's done with its task, execute the
@@ -947,14 +1609,19 @@ class _Pool(QtGui.QWidget):
                 thread_id,
             )
 
-        self._threads[thread_id]['callback'](exception)
-        self._threads[thread_id]['done'] = True
+        thread = self._threads[thread_id]
+        self._active[thread['group']] -= 1
+        thread['done'] = True
+        thread['callback'](exception)
+
+        self._on_worker_finished()
 
     def _on_worker_finished(self):
         """
         When the worker is finished, which happens sometime briefly
-        after it's done with its task, delete it from the thread pool if
-        its callback has already executed.
+        after it's done with its task, return it to the idle list if
+        its callback has already executed, and then start any queued
+        tasks that can now run.
         """
 
         thread_ids = [
@@ -963,35 +1630,46 @@ class _Pool(QtGui.QWidget):
             if thread['done'] and thread['worker'].isFinished()
         ]
 
-        if not thread_ids:
-            return
-
         for thread_id in thread_ids:
-            del self._threads[thread_id]
+            self._idle.append(self._threads.pop(thread_id)['worker'])
 
-        self._logger.debug(
-            "Reaped thread%s %s; pool=%s",
-            "s" if len(thread_ids) != 1 else "", thread_ids, self._threads,
-        )
+        if thread_ids:
+            self._logger.debug(
+                "Released thread%s %s; active=%d, idle=%d",
+                "s" if len(thread_ids) != 1 else "", thread_ids,
+                len(self._threads), len(self._idle),
+            )
+
+        del self._idle[max(1, self._size()):]  # do not hoard workers
+        self._dispatch()
 
 
 class _Worker(QtCore.QThread):
     """
-    Generic worker for running processes in the background.
+    Generic, reusable worker for running processes in the background.
     """
 
     __slots__ = [
-        '_thread_id',  # my thread ID; used to communicate back to main thread
-        '_task',       # the task I will need to call when run
+        '_id',    # current task ID; used to communicate back to main thread
+        '_task',  # the task I will need to call when run
     ]
 
-    def __init__(self, thread_id, task):
+    def __init__(self):
         """
-        Save my worker ID and task.
+        Start out without an assigned task.
         """
 
         super(_Worker, self).__init__()
 
+        self._id = None
+        self._task = None
+
+    def assign(self, thread_id, task):
+        """
+        Save the task ID and task for the next run; only to be called
+        while the thread is not running.
+        """
+
         self._id = thread_id
         self._task = task
 
@@ -1001,8 +1679,10 @@ class _Worker(QtCore.QThread):
         the main thread via the callback.
         """
 
+        task, self._task = self._task, None
+
         try:
-            self._task()
+            task()
         except Exception as exception:  # catch all, pylint:disable=W0703
             from traceback import format_exc
             self.emit(_SIGNAL, self._id, exception, format_exc())
@@ -23,7 +23,7 @@
 Service classes for AwesomeTTS
 """
 
-from .common import Trait
+from .common import Fold, NotInDictionary, Trait
 
 from .acapela import Acapela
 from .baidu import Baidu
@@ -53,6 +53,8 @@ from .youdao import Youdao
 
 __all__ = [
     # common
+    'Fold',
+    'NotInDictionary',
     'Trait',
 
     # services
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+
+# AwesomeTTS text-to-speech add-on for Anki
+#
+# Copyright (C) 2014-2016  Anki AwesomeTTS Development Team
+# Copyright (C) 2014-2016  Dave Shifflett
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Clean-up of decoded audio for services
+
+Provides a polish() function that trims the silence from the start and
+end of clips and evens out their loudness, for many clips in one call,
+and a Batcher class that gathers up the clips of runs that are being
+polished at the same time into such calls.
+
+NumPy is used if it is installed, in which case each step is done for
+all of the clips in a call at once. Otherwise, the standard library's
+audioop module does the same work, one clip at a time.
+"""
+
+import audioop
+from math import sqrt
+from threading import Condition
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ['Batcher', 'polish']
+
+
+WIDTH = 2  # bytes per sample; clips are always 16-bit signed little-endian
+
+FULL_SCALE = 32768.0
+
+WINDOW_SECS = 0.01  # length of the windows that loudness is measured over
+MARGIN_SECS = 0.05  # silence kept before and after the audio when trimming
+
+SILENCE_DB = -50.0  # windows quieter than this (dBFS RMS) are silence
+TARGET_DB = -20.0   # RMS loudness of the non-silent windows after leveling
+MAX_GAIN_DB = 20.0  # most that a quiet clip will be turned up
+CEILING = 0.95      # fraction of full scale that peaks are kept under
+
+SILENCE = (FULL_SCALE * 10 ** (SILENCE_DB / 20)) ** 2  # as mean power
+TARGET = FULL_SCALE * 10 ** (TARGET_DB / 20)           # as RMS amplitude
+MAX_GAIN = 10 ** (MAX_GAIN_DB / 20)
+
+
+def polish(clips, trim=True, loudness=True):
+    """
+    Given a list of clips, each a (frames, channels, rate) tuple where
+    the frames are a string of 16-bit samples in one or two channels,
+    returns a list with the frames of each after trimming and leveling.
+
+    If trim is True, the silence at the start and end of each clip is
+    cut down to MARGIN_SECS. If loudness is True, each clip is turned
+    up or down so that its non-silent windows have an RMS loudness of
+    TARGET_DB, without letting its peaks go above the CEILING. A clip
+    that is silence all the way through is passed back untouched.
+    """
+
+    if numpy:
+        return _polish_numpy(clips, trim, loudness)
+
+    return [_polish_audioop(frames, channels, rate, trim, loudness)
+            for frames, channels, rate in clips]
+
+
+def _polish_numpy(clips, trim, loudness):
+    """
+    Does polish() with NumPy, measuring the windows and loudness of
+    every clip with single reduceat() calls over the clips' samples laid
+    end to end, then leveling and rounding them all in one array.
+    """
+
+    samples = [
+        numpy.frombuffer(frames, '<i2',
+                         len(frames) // (WIDTH * channels) * channels)
+        .reshape(-1, channels)
+        for frames, channels, _ in clips
+    ]
+    lengths = numpy.array([len(clip) for clip in samples])
+    sizes = numpy.array([max(1, int(rate * WINDOW_SECS))
+                         for _, _, rate in clips])
+    audible = lengths > 0
+
+    if not audible.any():
+        return [frames for frames, _, _ in clips]
+
+    # power of each frame (i.e. of its channels mixed down), end to end
+    power = numpy.square(numpy.concatenate([
+        clip.mean(axis=1, dtype=numpy.float32) if clip.shape[1] > 1
+        else clip[:, 0]
+        for clip in samples
+    ]).astype(numpy.float32))
+
+    starts = numpy.concatenate([[0], numpy.cumsum(lengths)[:-1]])
+    windows = (lengths + sizes - 1) // sizes  # per clip, last one may be short
+    window_starts = numpy.concatenate([
+        start + numpy.arange(count) * size
+        for start, count, size in zip(starts, windows, sizes)
+    ])
+    window_counts = numpy.diff(numpy.append(window_starts, len(power)))
+    window_energy = numpy.add.reduceat(power, window_starts)
+    loud = window_energy / window_counts > SILENCE
+
+    # per clip, over only its non-silent windows
+    offsets = numpy.concatenate([[0], numpy.cumsum(windows)[:-1]])
+    firsts = offsets[audible]
+    loud_energy = numpy.zeros(len(clips))
+    loud_frames = numpy.zeros(len(clips))
+    loud_energy[audible] = numpy.add.reduceat(window_energy * loud, firsts)
+    loud_frames[audible] = numpy.add.reduceat(window_counts * loud, firsts)
+    peaks = numpy.array([max(int(clip.max()), -int(clip.min())) if len(clip)
+                         else 0 for clip in samples])
+
+    gains = numpy.ones(len(clips))
+    if loudness:
+        has_loud = loud_frames > 0
+        rms = numpy.sqrt(loud_energy[has_loud] / loud_frames[has_loud])
+        gains[has_loud] = numpy.minimum(
+            numpy.minimum(TARGET / rms, MAX_GAIN),
+            CEILING * FULL_SCALE / numpy.maximum(peaks[has_loud], 1),
+        )
+
+    spans = []
+    for index, clip in enumerate(samples):
+        begin, end = 0, len(clip)
+        if trim and loud_frames[index]:
+            found = numpy.flatnonzero(
+                loud[offsets[index]:offsets[index] + windows[index]]
+            )
+            margin = int(clips[index][2] * MARGIN_SECS)
+            begin = max(0, found[0] * sizes[index] - margin)
+            end = min(end, (found[-1] + 1) * sizes[index] + margin)
+        spans.append((begin, end))
+
+    kept = [clip[start:stop].ravel() for clip, (start, stop)
+            in zip(samples, spans)]
+    counts = numpy.array([len(part) for part in kept])
+    joined = numpy.concatenate(kept)
+
+    if loudness:
+        leveled = joined.astype(numpy.float32)
+        for values, gain in zip(numpy.split(leveled,
+                                            numpy.cumsum(counts)[:-1]),
+                                gains):
+            values *= gain  # n.b. in place, on a view into leveled
+        numpy.rint(leveled, out=leveled)
+        numpy.clip(leveled, -FULL_SCALE, FULL_SCALE - 1, out=leveled)
+        joined = leveled.astype('<i2')
+
+    return [part.tobytes()
+            for part in numpy.split(joined, numpy.cumsum(counts)[:-1])]
+
+
+def _polish_audioop(frames, channels, rate, trim, loudness):
+    """Does polish() for one clip with audioop."""
+
+    frame_size = WIDTH * channels
+    frames = frames[:len(frames) // frame_size * frame_size]
+    if not frames:
+        return frames
+
+    mono = audioop.tomono(frames, WIDTH, 0.5, 0.5) if channels == 2 \
+        else frames
+    step = max(1, int(rate * WINDOW_SECS)) * WIDTH
+    loud = []
+    energy = count = 0
+
+    for start in range(0, len(mono), step):
+        window = mono[start:start + step]
+        window_rms = audioop.rms(window, WIDTH)
+        if window_rms ** 2 > SILENCE:
+            loud.append(start // WIDTH)
+            energy += window_rms ** 2 * (len(window) // WIDTH)
+            count += len(window) // WIDTH
+
+    if not loud:
+        return frames
+
+    if trim:
+        margin = int(rate * MARGIN_SECS)
+        begin = max(0, loud[0] - margin)
+        end = min(len(frames) // frame_size,
+                  loud[-1] + step // WIDTH + margin)
+        frames = frames[begin * frame_size:end * frame_size]
+
+    if loudness:
+        gain = min(TARGET / sqrt(float(energy) / count), MAX_GAIN,
+                   CEILING * FULL_SCALE / max(audioop.max(frames, WIDTH), 1))
+        frames = audioop.mul(frames, WIDTH, gain)
+
+    return frames
+
+
+class Batcher(object):
+    """
+    Gathers up the clips of runs that are being polished at the same
+    time (e.g. by the worker threads of a whole-deck batch) into shared
+    polish() calls.
+
+    A caller that finds no call underway makes one for every clip that
+    is waiting, including its own. Callers that arrive in the meantime
+    wait for it to finish, and then the next of them makes one call
+    for all of their clips together.
+    """
+
+    __slots__ = [
+        '_busy',       # True while a polish() call is underway
+        '_condition',  # guards the attributes and signals finished calls
+        '_waiting',    # list of dicts for clips that are not yet polished
+    ]
+
+    def __init__(self):
+        self._busy = False
+        self._condition = Condition()
+        self._waiting = []
+
+    def __call__(self, clip, trim=True, loudness=True):
+        """
+        Returns the polished frames of the clip (see polish()), or
+        raises the exception that polishing it raised.
+        """
+
+        entry = dict(clip=clip, settings=(trim, loudness))
+
+        with self._condition:
+            self._waiting.append(entry)
+
+            while 'frames' not in entry:
+                if self._busy:
+                    self._condition.wait()
+                    continue
+
+                self._busy = True
+                entries, self._waiting = self._waiting, []
+                self._condition.release()
+
+                try:
+                    _polish_entries(entries)
+                finally:
+                    self._condition.acquire()
+                    self._busy = False
+                    self._condition.notify_all()
+
+        if 'error' in entry:
+            raise entry['error']
+        return entry['frames']
+
+
+def _polish_entries(entries):
+    """
+    Polishes the entries of a Batcher with one polish() call for each
+    distinct setting, filling in either the frames or the error.
+    """
+
+    groups = {}
+    for entry in entries:
+        groups.setdefault(entry['settings'], []).append(entry)
+
+    for (trim, loudness), group in groups.items():
+        try:
+            results = polish([entry['clip'] for entry in group],
+                             trim, loudness)
+        except Exception as exception:  # catch all, pylint:disable=W0703
+            for entry in group:
+                entry['error'] = exception
+                entry['frames'] = None
+        else:
+            for entry, frames in zip(group, results):
+                entry['frames'] = frames
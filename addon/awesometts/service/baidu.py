@@ -50,6 +50,8 @@ class Baidu(Service):
 
     TRAITS = [Trait.INTERNET]
 
+    NET_PARALLEL = 3
+
     def desc(self):
         """Returns a short, static description."""
 
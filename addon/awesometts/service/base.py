@@ -26,10 +26,23 @@ TTS services for use with AwesomeTTS.
 """
 
 import abc
+from httplib import HTTPException
 import os
+from random import random
 import shutil
+from StringIO import StringIO
 import sys
+from socket import error as SocketError
 import subprocess
+from tempfile import SpooledTemporaryFile, TemporaryFile
+from threading import Condition, Event, Lock, Thread, local
+from time import sleep, time
+from urllib2 import HTTPError, URLError
+import wave
+import zlib
+
+from . import audio, mp3, pcm
+from .common import Fold, Trait
 
 __all__ = ['Service']
 
@@ -39,6 +52,29 @@ DEFAULT_TIMEOUT = 15
 
 PADDING = '\0' * 2**11
 
+NET_CHUNK = 2**16  # bytes read at a time from a web response
+NET_ENCODINGS = 'gzip, deflate'  # Accept-Encoding sent w/ web requests
+
+RETRY_BACKOFF = 0.5  # seconds before the first retry, doubled for each next
+RETRY_JITTER = 0.5   # fraction by which a retry delay is randomly varied
+RETRY_SECS = 10      # time into a run after which nothing is retried again
+
+BREAKER_FAILURES = 5  # consecutive network failures that open the breaker
+BREAKER_SECS = 60     # time an open breaker fails fast before a probe
+
+LIMIT_DECREASE = 0.5  # factor the request rate is cut by when congested
+LIMIT_INCREASE = 0.1  # requests/second the rate grows by for each success
+LIMIT_MIN = 0.05      # slowest request rate (i.e. one request every 20s)
+
+POLISHER = audio.Batcher()  # shared by every service's util_polish()
+
+STATS = [  # per-run measurements, collected by the router after each run
+    'netops',          # number of network operations
+    'net_secs',        # seconds spent waiting on the network
+    'net_bytes',       # bytes received from the network
+    'transcode_secs',  # seconds spent running the LAME transcoder
+]
+
 
 class Service(object):
     """
@@ -66,13 +102,22 @@ class Service(object):
     class TinyDownloadError(ValueError):
         """Raises when a download is too small."""
 
+    class CircuitOpenError(SocketError):
+        """Raises when a service is skipped after repeated failures."""
+
     __slots__ = [
-        '_netops',      # number of network ops required by the last run
-        '_lame_flags',  # callable to get flag string for LAME transcoder
-        '_logger',      # logging interface with debug(), info(), etc.
-        'normalize',    # callable for standardizing string values
-        '_temp_dir',    # for temporary scratch space
-        'ecosystem',    # get information about web API, user agent
+        '_breaker',      # dict of circuit breaker state, with its lock
+        '_connections',  # Connections pool shared by all services
+        '_lame_flags',   # callable to get flag string for LAME transcoder
+        '_limiter',      # dict of token bucket rate limiter state, w/ lock
+        '_logger',       # logging interface with debug(), info(), etc.
+        'normalize',     # callable for standardizing string values
+        '_responses',    # Responses cache shared by all services
+        '_sessions',     # dict of net_session() values, with its lock
+        '_temp_dir',     # for temporary scratch space
+        '_transcoder',   # Transcoder pool shared by all services, for LAME
+        'ecosystem',     # get information about web API, user agent
+        '_stats',        # thread-local STATS values for the current run
     ]
 
     # when getting CLI output, try using these decodings, in this order
@@ -132,7 +177,37 @@ class Service(object):
     # e.g. TRAITS = [Trait.INTERNET, Trait.TRANSCODING]
     TRAITS = None
 
-    def __init__(self, temp_dir, lame_flags, normalize, logger, ecosystem):
+    # differences in input text that do not change the output, which the
+    # router folds away before hashing the cache path; concrete classes
+    # may extend this, e.g. FOLDS = Service.FOLDS + [Fold.CASE], and the
+    # router's CANONICAL_VERSION must be bumped whenever a list changes
+    FOLDS = [Fold.UNICODE, Fold.WHITESPACE]
+
+    # seconds to remember a failed call for; None uses the router's default
+    # for the error (e.g. longer for NotInDictionary from dictionaries)
+    FAILURE_TTL = None
+
+    # most targets that one net_stream() call fetches at the same time; a
+    # service whose split text can be requested out of order may raise it
+    NET_PARALLEL = 1
+
+    # number of times a network operation that failed in a way that might
+    # be temporary (e.g. a timeout or a 5xx status) is tried again
+    NET_RETRIES = 2
+
+    # starting rate (requests/second), highest rate, and most requests that
+    # may be made back-to-back for the service's token bucket; only services
+    # with Trait.INTERNET are rate-limited (e.g. not paid-for APIs)
+    NET_RATE = 1.0
+    NET_RATE_MAX = 10.0
+    NET_BURST = 5
+
+    # seconds that a value kept by net_session() (e.g. cookies) is reused for
+    # before it is obtained again, even if it has not been refused
+    NET_SESSION_TTL = 1200
+
+    def __init__(self, temp_dir, lame_flags, normalize, logger, ecosystem,
+                 connections, responses, transcoder):
         """
         Attempt to initialize the service, raising a exception if the
         service cannot be used. If the service needs to make any calls
@@ -154,18 +229,41 @@ class Service(object):
         The logger object should have an interface like the one used by
         the standard library logging module, with debug(), info(), and
         so on, available.
+
+        The connections should be a Connections instance that is shared
+        by every service, through which all web requests are made.
+
+        The responses should be a Responses instance that is shared by
+        every service, holding web responses fetched with a cache_ttl.
+
+        The transcoder should be a Transcoder instance that is shared by
+        every service, on which all runs of LAME (and of any engine that
+        is piped into it) are made, so that no more of them run at once
+        than there are CPU cores to run them.
         """
 
         assert self.NAME, "Please specify a NAME for the service"
         assert isinstance(self.TRAITS, list), \
             "Please specify a TRAITS list for the service"
 
-        self._netops = None
+        self._breaker = dict(lock=Lock(), failures=0, opened=None,
+                             probing=False)
+        self._connections = connections
         self._lame_flags = lame_flags
+        self._limiter = dict(lock=Lock(),
+                             rate=(self.NET_RATE
+                                   if Trait.INTERNET in self.TRAITS
+                                   else None),
+                             tokens=self.NET_BURST, updated=time(),
+                             decreased=0)
         self._logger = logger
         self.normalize = normalize
+        self._responses = responses
+        self._sessions = dict(lock=Lock(), values={})
         self._temp_dir = temp_dir
+        self._transcoder = transcoder
         self.ecosystem = ecosystem
+        self._stats = local()
 
     @abc.abstractmethod
     def desc(self):
@@ -369,6 +467,9 @@ class Service(object):
         If add_padding is True, then some additional null padding will
         be added onto the resulting MP3. This can be helpful to ensure
         that the generated MP3 will not be clipped by `mplayer`.
+
+        LAME is run on the shared Transcoder, so if every core is busy
+        transcoding already, this waits its turn.
         """
 
         if not os.path.exists(input_path):
@@ -390,7 +491,8 @@ class Service(object):
         intermediate_path = self.path_temp('mp3')  # see note above
 
         try:
-            self.cli_call(
+            self._transcode(
+                self.cli_call,
                 self.CLI_LAME,
                 self._lame_flags().split(),
                 input_path,
@@ -417,12 +519,245 @@ class Service(object):
         if add_padding:
             self.util_pad(intermediate_path)
 
-        shutil.move(intermediate_path, output_path)  # see note above
+        self.path_commit(intermediate_path, output_path)  # see note above
+
+    def cli_transcode_pipe(self, source, output_path, require=None,
+                           add_padding=False, input_path=None):
+        """
+        Like cli_transcode(), but streams the audio into LAME's stdin
+        instead of having it read a file, and writes LAME's stdout into
+        a partial file next to the output path, so no intermediate MP3
+        is written to the temporary directory.
+
+        The source is either a command (i.e. a list of arguments) that
+        writes wave audio to its stdout, which is fed the file at the
+        input_path on its stdin if one is given, a string of wave audio
+        that the service already has in memory, or a file-like object
+        to read wave audio from (e.g. from util_joiner()). A command's
+        audio is collected in memory (spilling into the temporary
+        directory if it gets big) before LAME is started.
+
+        Because no paths are passed to LAME, the non-ASCII output_path
+        problem that cli_transcode() works around does not come up. The
+        size_in requirement is checked against the number of bytes that
+        were streamed to LAME, once it has finished.
+
+        Like with cli_transcode(), LAME runs on the shared Transcoder.
+        The source command runs beforehand on the calling thread, and
+        not in a Transcoder slot, so that a slow engine does not keep a
+        core's worth of encoding waiting on it; how many engines run at
+        once is up to the router (see Router), which lets local services
+        that transcode run one for each of the Transcoder's workers.
+        """
+
+        partial = self.path_partial(output_path)
+        captured = None
+
+        if not isinstance(source, basestring) and \
+                not hasattr(source, 'read'):
+            captured = source = self._cli_capture(source, input_path)
+
+        def encode():
+            """Runs LAME (and the source, if a command) into partial."""
+
+            with open(partial, 'wb') as output_stream:
+                try:
+                    lame = self._cli_exec(
+                        lambda args, **kwargs: subprocess.Popen(
+                            args,
+                            stdin=subprocess.PIPE,
+                            stdout=output_stream,
+                            **kwargs
+                        ),
+                        [self.CLI_LAME, self._lame_flags().split(), '-', '-'],
+                        "to transcode its stdin",
+                    )
+
+                except OSError as os_error:
+                    from errno import ENOENT
+                    if os_error.errno == ENOENT:
+                        raise OSError(
+                            ENOENT,
+                            "Unable to find lame to transcode the audio. "
+                            "It might not have been installed.",
+                        )
+                    else:
+                        raise
+
+                try:
+                    size_in = self._cli_feed(source, lame.stdin)
+
+                except:  # kill LAME, then re-raise, pylint:disable=W0702
+                    lame.kill()
+                    raise
+
+                finally:
+                    lame.stdin.close()
+                    returned = lame.wait()
+
+            return size_in, returned
+
+        try:
+            size_in, returned = self._transcode(encode)
+
+            if require and 'size_in' in require and \
+               size_in < require['size_in']:
+                raise ValueError(
+                    "Input to transcoder was %d-byte stream; wanted %d+ "
+                    "bytes (the service might not have liked your input "
+                    "text)" % (size_in, require['size_in'])
+                )
+
+            if returned or not os.path.getsize(partial):
+                raise RuntimeError(
+                    "Transcoding the audio stream failed. Are the flags you "
+                    "specified for LAME (%s) okay?" % self._lame_flags()
+                )
+
+            if add_padding:
+                self.util_pad(partial)
+
+            self.path_commit(partial, output_path)
+
+        finally:
+            if captured:
+                captured.close()
+            if os.path.exists(partial):
+                os.unlink(partial)
+
+    def _cli_feed(self, source, stream):
+        """
+        Writes the source for cli_transcode_pipe() (i.e. a string or a
+        file-like object, from where it is positioned) to the given
+        stream (i.e. LAME's stdin) and returns the number of bytes
+        written.
+
+        If LAME stops reading (e.g. because it did not like its flags),
+        the rest of the audio is discarded; cli_transcode_pipe() then
+        reports on LAME's exit status.
+        """
+
+        from errno import EINVAL, EPIPE
+
+        if isinstance(source, basestring):
+            try:
+                stream.write(source)
+            except IOError as io_error:
+                if io_error.errno not in [EINVAL, EPIPE]:
+                    raise
+            return len(source)
+
+        return self._cli_pump(source, stream)
+
+    def _cli_capture(self, command, input_path=None):
+        """
+        Runs the source command for cli_transcode_pipe(), feeding it the
+        file at the input_path (if given) on its stdin, and returns its
+        stdout in a spool, positioned at the start, that the caller must
+        close(). A CalledProcessError is raised if it exits with an
+        error, like cli_call() would.
+        """
+
+        spool = SpooledTemporaryFile(max_size=pcm.SPOOL_SIZE,
+                                     dir=self._temp_dir)
+
+        with open(input_path, 'rb') if input_path \
+                else open(os.devnull, 'rb') as input_stream:
+            engine = self._cli_exec(
+                lambda args, **kwargs: subprocess.Popen(
+                    args,
+                    stdin=input_stream,
+                    stdout=subprocess.PIPE,
+                    **kwargs
+                ),
+                command,
+                "to collect its stdout for lame",
+            )
+
+        try:
+            self._cli_pump(engine.stdout, spool)
+
+        except:  # stop the engine, then re-raise, pylint:disable=W0702
+            engine.kill()
+            spool.close()
+            raise
+
+        finally:
+            engine.stdout.close()
+            returned = engine.wait()
+
+        if returned:
+            spool.close()
+            raise subprocess.CalledProcessError(returned, command)
+
+        spool.seek(0)
+        return spool
+
+    @staticmethod
+    def _cli_pump(reader, stream):
+        """
+        Copies everything from the reader to the stream for _cli_feed()
+        or _cli_capture(), returning the number of bytes read. If the
+        stream is closed from the other end, the rest is read and
+        discarded.
+        """
+
+        from errno import EINVAL, EPIPE
+
+        size = 0
+        streaming = True
+
+        while True:
+            chunk = reader.read(NET_CHUNK)
+            if not chunk:
+                break
+            size += len(chunk)
+
+            if streaming:
+                try:
+                    stream.write(chunk)
+                except IOError as io_error:
+                    if io_error.errno not in [EINVAL, EPIPE]:
+                        raise
+                    streaming = False
+
+        return size
+
+    def _transcode(self, job, *args):
+        """
+        Runs job(*args) on the shared Transcoder, waiting for it to
+        finish, and adds the time that it spent running (but not the
+        time that it spent queued behind other jobs) to transcode_secs.
+        """
+
+        elapsed = []
+
+        def timed():
+            """Runs the job on the Transcoder's worker, timing it."""
+
+            started = time()
+            try:
+                return job(*args)
+            finally:
+                elapsed.append(time() - started)
+
+        try:
+            return self._transcoder(timed)
+        finally:
+            self._stat('transcode_secs', sum(elapsed))
 
     def _cli_exec(self, callee, args, purpose, redirect_stderr=False):
         """
         Handles the underlying system call, logging, and exceptions when
         a call to one of the cli_xxx() methods is made.
+
+        Every process is started with close_fds on POSIX (as are those
+        of cli_pipe() and cli_background()), as otherwise (in Python 2)
+        it would inherit the write end of any pipe that another thread
+        has open at the time, e.g. to a LAME that cli_transcode_pipe()
+        is feeding, which would then not see the end of its input until
+        that process had exited (i.e. never, for a background daemon).
+        Windows cannot do this while also redirecting stdin or stdout.
         """
 
         args = [
@@ -441,6 +776,7 @@ class Service(object):
             args,
             stderr=subprocess.STDOUT if redirect_stderr else None,
             startupinfo=self.CLI_SI,
+            close_fds=not self.IS_WINDOWS,
         )
 
     def cli_pipe(self, args, input_path, output_path, input_mode='r',
@@ -462,7 +798,9 @@ class Service(object):
         with open(input_path, input_mode) as input_stream, \
                 open(output_path, output_mode) as output_stream:
             subprocess.Popen(args, stdin=input_stream.fileno(),
-                             stdout=output_stream.fileno()).communicate()
+                             stdout=output_stream.fileno(),
+                             close_fds=not self.IS_WINDOWS,  # see _cli_exec()
+                             ).communicate()
 
     def cli_background(self, *args):
         """
@@ -477,7 +815,10 @@ class Service(object):
                            args[0],
                            args[1:] if len(args) > 1 else "no arguments")
 
-        service = subprocess.Popen(args)
+        service = subprocess.Popen(
+            args,
+            close_fds=not self.IS_WINDOWS,  # see _cli_exec()
+        )
 
         import atexit
         atexit.register(service.terminate)
@@ -486,17 +827,30 @@ class Service(object):
         """Returns the headers for a URL."""
 
         self._logger.debug("GET %s for headers", url)
-        self._netops += 1
 
-        from urllib2 import urlopen, Request
-        return urlopen(
-            Request(url=url, headers={'User-Agent': DEFAULT_UA}),
-            timeout=DEFAULT_TIMEOUT,
-        ).headers
+        def request():
+            """Makes the request, closing it right away."""
+
+            self._stat('netops', 1)
+            started = time()
+
+            try:
+                response = self._connections.request(
+                    url,
+                    headers={'User-Agent': DEFAULT_UA},
+                    timeout=DEFAULT_TIMEOUT,
+                )
+                response.close()
+                return response.headers
+            finally:
+                self._stat('net_secs', time() - started)
+
+        return self.net_limit(request)
 
     def net_stream(self, targets, require=None, method='GET',
                    awesome_ua=False, add_padding=False,
-                   custom_quoter=None, custom_headers=None):
+                   custom_quoter=None, custom_headers=None, parallel=None,
+                   cache_ttl=None):
         """
         Returns the raw payload string from the specified target(s).
         If multiple targets are specified, their resulting payloads are
@@ -510,17 +864,69 @@ class Service(object):
         If using multiple targets, these requirements apply to each
         response.
 
-        The underlying library here already understands how to search
-        the environment for proxy settings (e.g. HTTP_PROXY), so we do
-        not need to do anything extra for that.
+        Multiple targets are fetched up to NET_PARALLEL (or parallel, if
+        given) at a time, and their payloads are put back together in
+        order. As soon as one of them fails, its exception is raised and
+        the others are called off.
+
+        Requests go through the shared connection pool, so connections
+        to a host are kept alive between targets and between runs. Like
+        urllib2, the pool searches the environment for proxy settings
+        (e.g. HTTP_PROXY), so we do not need to do anything extra here.
 
         If add_padding is True, then some additional null padding will
         be added onto the stream returned. This is helpful for some web
         services that sometimes return MP3s that `mplayer` clips early.
+
+        If cache_ttl is given, each target's payload is kept in the
+        shared response cache for that many seconds and answered from
+        there in the meantime, and is revalidated with the server (if it
+        gave an ETag or Last-Modified) once it has expired. This is meant
+        for pages that a service scrapes on its way to the audio (e.g. a
+        dictionary entry), not for the audio itself, which the router
+        already caches, nor for answers that hand out short-lived audio
+        URLs (e.g. a demo form's), which a retry needs to fetch afresh.
+        """
+
+        output = StringIO()
+        self._net_transfer(output, targets, require, method, awesome_ua,
+                           add_padding, custom_quoter, custom_headers,
+                           parallel, cache_ttl)
+        return output.getvalue()
+
+    def net_download(self, path, *args, **kwargs):
+        """
+        Downloads a file to the given path from the specified target(s).
+        See net_stream() for information about available options.
+
+        Responses are written to disk as they arrive, so memory use does
+        not grow with the length of the audio, and the file only appears
+        at the given path once it has been completely downloaded and has
+        passed the requirements (see path_commit()).
+        """
+
+        partial = self.path_partial(path)
+
+        try:
+            with open(partial, 'w+b') as output:
+                self._net_transfer(output, *args, **kwargs)
+            self.path_commit(partial, path)
+
+        finally:
+            if os.path.exists(partial):
+                os.unlink(partial)
+
+    def _net_transfer(self, output, targets, require=None, method='GET',
+                      awesome_ua=False, add_padding=False,
+                      custom_quoter=None, custom_headers=None,
+                      parallel=None, cache_ttl=None):
+        """
+        Writes the payloads from the specified target(s) to the given
+        file-like output, in order. See net_stream() for the options.
         """
 
         assert method in ['GET', 'POST'], "method must be GET or POST"
-        from urllib2 import urlopen, Request, quote
+        from urllib2 import quote
 
         targets = targets if isinstance(targets, list) else [targets]
         targets = [
@@ -548,34 +954,138 @@ class Service(object):
         ]
 
         require = require or {}
+        headers = {'User-Agent': (self.ecosystem.agent
+                                  if awesome_ua else DEFAULT_UA)}
+        if custom_headers:
+            headers.update(custom_headers)
+
+        def fetcher(url, params, desc):
+            """Returns a fetch for one target, retried as needed."""
+
+            def fetch(output, stat, cancelled):
+                """Fetches the target, starting over on retries."""
+
+                start = output.tell()
+                received = {}
+
+                if cache_ttl:
+                    key = '\n'.join([method, url, params or '',
+                                      headers.get('Cookie', '')])
+                    cached = self._responses.lookup(key)
+                    if cached and cached['fresh']:
+                        self._logger.debug("Reusing cached %s for %s; %s",
+                                           url, desc,
+                                           self._responses.hit_rate())
+                        output.write(cached['body'])
+                        return len(cached['body'])
+                else:
+                    cached = None
+
+                request_headers = dict(headers)
+                if cached and cached['etag']:
+                    request_headers['If-None-Match'] = cached['etag']
+                if cached and cached['modified']:
+                    request_headers['If-Modified-Since'] = cached['modified']
+
+                def attempt():
+                    """Discards anything from a failed try and fetches."""
+                    output.seek(start)
+                    output.truncate()
+                    return self.net_limit(
+                        lambda: self._net_fetch(output, url, params, method,
+                                                request_headers, require,
+                                                desc, stat, cancelled,
+                                                received),
+                        cancelled,
+                    )
 
-        payloads = []
+                try:
+                    size = self.net_retry(attempt, desc, cancelled=cancelled)
+
+                except HTTPError as http_error:
+                    if not (cached and http_error.code == 304):
+                        raise
+
+                    self._responses.renew(key, cache_ttl)
+                    self._logger.debug("Server says cached %s for %s is "
+                                       "still good; %s", url, desc,
+                                       self._responses.hit_rate())
+                    output.seek(start)
+                    output.truncate()
+                    output.write(cached['body'])
+                    return len(cached['body'])
+
+                if cache_ttl and size is not None:
+                    output.seek(start)
+                    self._responses.store(key, output.read(), cache_ttl,
+                                          received.get('etag'),
+                                          received.get('last-modified'))
+                    self._logger.debug("Cached %s for %s for %d seconds; %s",
+                                       url, desc, cache_ttl,
+                                       self._responses.hit_rate())
+
+                return size
+
+            return fetch
+
+        fetches = [
+            fetcher(url, params,
+                    "web request" if len(targets) == 1
+                    else "web request (%d of %d)" % (number, len(targets)))
+            for number, (url, params) in enumerate(targets, 1)
+        ]
 
-        for number, (url, params) in enumerate(targets, 1):
-            desc = "web request" if len(targets) == 1 \
-                else "web request (%d of %d)" % (number, len(targets))
+        parallel = self.NET_PARALLEL if parallel is None else parallel
+        if parallel > 1 and len(fetches) > 1:
+            self._net_parallel(output, fetches, parallel)
+        else:
+            for fetch in fetches:
+                fetch(output, self._stat, None)
 
-            self._logger.debug("%s %s%s%s for %s", method, url,
-                               "?" if params else "", params or "", desc)
+        if add_padding:
+            output.write(PADDING)
 
-            headers = {'User-Agent': (self.ecosystem.agent
-                                      if awesome_ua else DEFAULT_UA)}
-            if custom_headers:
-                headers.update(custom_headers)
+    def _net_fetch(self, output, url, params, method, headers, require,
+                   desc, stat, cancelled, received=None):
+        """
+        Writes the payload for one target to the given output as it
+        arrives, passing measurements to stat, and returns its size.
+        If a received dict is given, it is updated with the response's
+        headers (w/ lowercased names).
+
+        The Content-Type is checked before anything is read. Unless the
+        caller has asked for something else, a gzip or deflate encoding
+        is offered to the server, and a compressed payload is decoded as
+        its chunks arrive. The size is counted on the decoded payload,
+        and a TinyDownloadError is raised if the response ends before
+        reaching the required size. If the cancelled event gets set
+        while reading, None is returned.
+        """
 
-            self._netops += 1
-            response = urlopen(
-                Request(
-                    url=('?'.join([url, params]) if params and method == 'GET'
-                         else url),
-                    headers=headers,
-                ),
-                data=params if params and method == 'POST' else None,
-                timeout=DEFAULT_TIMEOUT,
-            )
+        self._logger.debug("%s %s%s%s for %s", method, url,
+                           "?" if params else "", params or "", desc)
+
+        if 'Accept-Encoding' not in headers:
+            headers = dict(headers)
+            headers['Accept-Encoding'] = NET_ENCODINGS
+
+        stat('netops', 1)
+        started = time()
+        response = self._connections.request(
+            ('?'.join([url, params]) if params and method == 'GET'
+             else url),
+            headers=headers,
+            data=params if params and method == 'POST' else None,
+            method=method,
+            timeout=DEFAULT_TIMEOUT,
+        )
+        decode = self._net_decoder(response.info().getheader(
+            'content-encoding'))
+        size = wire_size = 0
 
-            if not response:
-                raise IOError("No response for %s" % desc)
+        try:
+            if received is not None:
+                received.update(response.info().items())
 
             if response.getcode() != 200:
                 value_error = ValueError(
@@ -583,44 +1093,155 @@ class Service(object):
                     (response.getcode(), desc)
                 )
                 try:
-                    value_error.payload = response.read()
-                    response.close()
+                    value_error.payload = decode(response.read()) + \
+                        decode(None)
                 except StandardError:
                     pass
                 raise value_error
 
-            if 'mime' in require and \
-                    require['mime'] != format(response.info().
-                                              gettype()).replace('/x-', '/'):
+            mime = format(response.info().gettype()).replace('/x-', '/')
+            if 'mime' in require and require['mime'] != mime:
                 raise ValueError(
                     "Request got %s Content-Type for %s; wanted %s" %
                     (response.info().gettype(), desc, require['mime'])
                 )
 
-            payload = response.read()
+            while True:
+                if cancelled and cancelled.is_set():
+                    return None
+                data = response.read(NET_CHUNK)
+                wire_size += len(data)
+                chunk = decode(data or None)  # None flushes at the end
+                if chunk:
+                    output.write(chunk)
+                    size += len(chunk)
+                if not data:
+                    break
+
+        finally:
             response.close()
+            stat('net_secs', time() - started)
+            stat('net_bytes', wire_size)
 
-            if 'size' in require and len(payload) < require['size']:
-                raise self.TinyDownloadError(
-                    "Request got %d-byte stream for %s; wanted %d+ bytes" %
-                    (len(payload), desc, require['size'])
-                )
+        if 'size' in require and size < require['size']:
+            raise self.TinyDownloadError(
+                "Request got %d-byte stream for %s; wanted %d+ bytes" %
+                (size, desc, require['size'])
+            )
 
-            payloads.append(payload)
+        return size
 
-        if add_padding:
-            payloads.append(PADDING)
-        return ''.join(payloads)
+    @staticmethod
+    def _net_decoder(encoding):
+        """
+        Returns a callable that decodes the successive chunks of a web
+        response sent with the given Content-Encoding, and that returns
+        whatever is left over when called with None at the end. Chunks
+        in an encoding other than gzip or deflate are passed through.
+        """
 
-    def net_download(self, path, *args, **kwargs):
+        encoding = (encoding or '').strip().lower()
+        if encoding in ['gzip', 'x-gzip']:
+            state = dict(decompressor=zlib.decompressobj(16 + zlib.MAX_WBITS))
+        elif encoding == 'deflate':
+            state = dict(decompressor=zlib.decompressobj())
+        else:
+            return lambda chunk: chunk or ''
+
+        state['started'] = False
+
+        def decode(chunk):
+            """Decompresses the chunk, or flushes if it is None."""
+
+            if chunk is None:
+                return state['decompressor'].flush()
+
+            try:
+                return state['decompressor'].decompress(chunk)
+
+            except zlib.error:
+                if state['started'] or encoding != 'deflate':
+                    raise
+
+                # some servers send deflate without the zlib header
+                state['decompressor'] = zlib.decompressobj(-zlib.MAX_WBITS)
+                return state['decompressor'].decompress(chunk)
+
+            finally:
+                state['started'] = True
+
+        return decode
+
+    def _net_parallel(self, output, fetches, parallel):
         """
-        Downloads a file to the given path from the specified target(s).
-        See net_stream() for information about available options.
+        Calls the given fetches from up to parallel helper threads, each
+        writing to its own temporary file, and then copies those files
+        to the output in order.
+
+        The first exception raised is re-raised right away; the helper
+        threads then stop starting new fetches and abandon the ones they
+        are reading.
         """
 
-        payload = self.net_stream(*args, **kwargs)
-        with open(path, 'wb') as response_output:
-            response_output.write(payload)
+        condition = Condition()
+        cancelled = Event()
+        measured = {}
+        parts = [TemporaryFile(dir=self._temp_dir) for _ in fetches]
+        state = dict(next=0, done=0, error=None)
+
+        def stat(name, amount):
+            """Collects measurements from the helper threads."""
+            with condition:
+                measured[name] = measured.get(name, 0) + amount
+
+        def work():
+            """Fetches targets until none are left or one fails."""
+
+            while True:
+                with condition:
+                    if state['error'] or state['next'] == len(fetches):
+                        return
+                    index = state['next']
+                    state['next'] += 1
+
+                try:
+                    fetches[index](parts[index], stat, cancelled)
+                except Exception:  # catch all, pylint:disable=W0703
+                    with condition:
+                        state['error'] = state['error'] or sys.exc_info()
+                        cancelled.set()
+                        condition.notify()
+                    return
+
+                with condition:
+                    state['done'] += 1
+                    condition.notify()
+
+        for _ in range(min(parallel, len(fetches))):
+            thread = Thread(target=work)
+            thread.daemon = True
+            thread.start()
+
+        with condition:
+            while not state['error'] and state['done'] < len(fetches):
+                condition.wait()
+            for name, amount in measured.items():
+                self._stat(name, amount)
+
+        try:
+            if state['error']:
+                raise state['error'][0], state['error'][1], state['error'][2]
+
+            for part in parts:
+                part.seek(0)
+                shutil.copyfileobj(part, output, NET_CHUNK)
+
+        finally:
+            if not state['error']:
+                for part in parts:
+                    part.close()
+            # n.b. on error, parts still being written are left for their
+            # helper thread to finish with; they vanish once unreferenced
 
     def net_dump(self, output_path, url):
         """
@@ -630,9 +1251,26 @@ class Service(object):
         Note that output_path must be a safe ASCII one (i.e. generated
         by path_temp()); this method does NOT have the non-ASCII home
         directory workaround like cli_transcode() does.
+
+        Because the dump can fail for reasons that do not give any more
+        detail (i.e. mplayer just does not write anything out), those
+        failures are retried along with network errors; see net_retry().
         """
 
-        self._netops += 1
+        self.net_retry(
+            lambda: self.net_limit(lambda: self._net_dump(output_path, url)),
+            "audio stream dump",
+            retryable=lambda exception: (
+                isinstance(exception, RuntimeError) or
+                self.net_retryable(exception)
+            ),
+        )
+
+    def _net_dump(self, output_path, url):
+        """Makes one attempt at dumping the audio for net_dump()."""
+
+        self._stat('netops', 1)
+        started = time()
 
         try:
             self.cli_call(
@@ -653,24 +1291,322 @@ class Service(object):
             else:
                 raise
 
+        finally:
+            self._stat('net_secs', time() - started)
+
         if not os.path.exists(output_path):
             raise RuntimeError("Dumping the audio stream w/ mplayer failed.")
 
+        self._stat('net_bytes', os.path.getsize(output_path))
+
+    def net_retry(self, operation, desc, retryable=None, cancelled=None):
+        """
+        Calls the given operation and returns its result, retrying it
+        up to NET_RETRIES times, with exponentially increasing delays
+        (varied randomly, so retries from several threads do not line
+        up), if it fails with an exception that retryable (by default,
+        net_retryable()) says might be temporary.
+
+        Such failures also count toward the service's circuit breaker.
+        Once BREAKER_FAILURES of them happen in a row, the breaker
+        opens, and for the next BREAKER_SECS, operations raise a
+        CircuitOpenError right away instead of waiting for timeouts
+        (e.g. so a batch job does not spend minutes on a service that
+        is down). After that, a single operation is let through as a
+        probe, while the others keep failing fast; if the probe
+        succeeds, the breaker closes, and if it fails, it opens again.
+
+        Nothing is retried once RETRY_SECS have passed since the start
+        of the current run (see stats_reset()), so that a clip that
+        keeps failing takes about as long as a single timeout would,
+        rather than one timeout for each attempt.
+
+        If the cancelled event is given and gets set, None is returned
+        instead of retrying.
+        """
+
+        retryable = retryable or self.net_retryable
+        breaker = self._breaker
+        run_started = getattr(self._stats, 'started', None) or time()
+
+        for attempt in range(self.NET_RETRIES + 1):
+            with breaker['lock']:
+                probe = breaker['failures'] >= BREAKER_FAILURES
+                if probe and time() - breaker['opened'] < BREAKER_SECS:
+                    raise self.CircuitOpenError(
+                        "%s is not responding; skipping it for %d more "
+                        "seconds" % (
+                            self.NAME,
+                            BREAKER_SECS - (time() - breaker['opened']),
+                        )
+                    )
+                if probe and breaker['probing']:
+                    raise self.CircuitOpenError(
+                        "%s is not responding; skipping it while checking "
+                        "whether it is back" % self.NAME
+                    )
+                if probe:
+                    breaker['probing'] = True
+
+            try:
+                result = operation()
+
+            except Exception as exception:  # catch all, pylint:disable=W0703
+                if not retryable(exception):
+                    if probe:
+                        with breaker['lock']:
+                            breaker['probing'] = False
+                    raise
+
+                with breaker['lock']:
+                    breaker['probing'] = False
+                    breaker['failures'] += 1
+                    tripped = breaker['failures'] >= BREAKER_FAILURES
+                    if tripped:
+                        breaker['opened'] = time()
+                        self._logger.warn("Circuit breaker for %s is open",
+                                          self.NAME)
+
+                delay = RETRY_BACKOFF * 2 ** attempt * \
+                    (1 + RETRY_JITTER * (2 * random() - 1))
+
+                if tripped or attempt == self.NET_RETRIES or \
+                        (cancelled and cancelled.is_set()) or \
+                        time() + delay - run_started > RETRY_SECS:
+                    raise
+
+                self._logger.info("Retrying %s in %.1f seconds after %s",
+                                  desc, delay, exception)
+                sleep(delay)
+
+                if cancelled and cancelled.is_set():
+                    return None
+
+            else:
+                with breaker['lock']:
+                    breaker['failures'] = 0
+                    breaker['probing'] = False
+                return result
+
+    @staticmethod
+    def net_retryable(exception):
+        """
+        Returns True if the given exception from a network operation
+        might go away if it is tried again (i.e. connection troubles,
+        timeouts, and server-side errors, the same sort of errors that
+        the router does not remember as failures), or False otherwise
+        (e.g. a 404, or a download that is too small).
+        """
+
+        if isinstance(exception, Service.CircuitOpenError):
+            return False
+
+        if isinstance(exception, HTTPError):
+            return exception.code >= 500 or exception.code in [408, 429]
+
+        return isinstance(exception, (HTTPException, SocketError, URLError))
+
+    def net_limit(self, operation, cancelled=None):
+        """
+        Calls the given network operation once the service's token
+        bucket allows for it, and returns its result.
+
+        Tokens are added to the bucket at the service's current rate, up
+        to NET_BURST of them, and each operation takes one, waiting on
+        the calling (worker) thread if there are none; the bucket is
+        shared by every caller of the service (e.g. batch generation,
+        the reviewer, and previews in the configuration screen), so the
+        service sees one steady stream of requests however many threads
+        are making them.
+
+        The rate adapts itself to the service (additive increase,
+        multiplicative decrease): every operation that goes through
+        without a sign of congestion raises it by LIMIT_INCREASE, up to
+        NET_RATE_MAX, and every one that fails with one (see
+        net_congested()) cuts it by LIMIT_DECREASE, down to LIMIT_MIN,
+        so that over time it hovers just under whatever the service
+        actually allows. Services without Trait.INTERNET are not limited.
+
+        If the cancelled event is given and gets set while waiting, None
+        is returned without calling the operation.
+        """
+
+        limiter = self._limiter
+        if limiter['rate'] is None:
+            return operation()
+
+        while True:
+            with limiter['lock']:
+                now = time()
+                limiter['tokens'] = min(
+                    self.NET_BURST,
+                    limiter['tokens'] +
+                    (now - limiter['updated']) * limiter['rate'],
+                )
+                limiter['updated'] = now
+
+                if limiter['tokens'] >= 1:
+                    limiter['tokens'] -= 1
+                    break
+
+                delay = (1 - limiter['tokens']) / limiter['rate']
+
+            sleep(delay)
+            if cancelled and cancelled.is_set():
+                return None
+
+        started = time()
+
+        try:
+            result = operation()
+
+        except Exception as exception:  # catch all, pylint:disable=W0703
+            if self.net_congested(exception):
+                with limiter['lock']:
+                    # operations already underway when the rate was last cut
+                    # were sent too fast for the same reason, so only cut it
+                    # once for them
+                    decrease = started >= limiter['decreased']
+                    if decrease:
+                        limiter['rate'] = max(LIMIT_MIN, limiter['rate'] *
+                                              LIMIT_DECREASE)
+                        limiter['tokens'] = min(0, limiter['tokens'])
+                        limiter['decreased'] = time()
+                        rate = limiter['rate']
+                if decrease:
+                    self._logger.info("Slowing %s down to %.2f "
+                                      "requests/second after %s",
+                                      self.NAME, rate, exception)
+            raise
+
+        with limiter['lock']:
+            limiter['rate'] = min(self.NET_RATE_MAX,
+                                  limiter['rate'] + LIMIT_INCREASE)
+        return result
+
+    @staticmethod
+    def net_congested(exception):
+        """
+        Returns True if the given exception from a network operation is
+        a sign that the service wants us to slow down (i.e. a 429 or 5xx
+        status, or a download that came back too small, which is how
+        some services turn away clients that request too much), or False
+        otherwise.
+        """
+
+        if isinstance(exception, HTTPError):
+            return exception.code >= 500 or exception.code == 429
+
+        return isinstance(exception, Service.TinyDownloadError)
+
+    def net_session(self, name, obtain, operation, stale=None):
+        """
+        Calls the given operation with a session value (e.g. cookies, or
+        a token scraped from a page) that is kept for the service under
+        the given name, and returns its result.
+
+        The value is got by calling obtain() the first time it is needed
+        and whenever it is more than NET_SESSION_TTL seconds old, and is
+        otherwise shared by every run of the service, so most runs skip
+        the extra request(s) for it.
+
+        If the operation fails with an exception that stale (by default,
+        net_stale()) says means the value is no longer accepted, and the
+        value was not just obtained, it is thrown away and the operation
+        is tried once more with a new one.
+        """
+
+        sessions = self._sessions
+        stale = stale or self.net_stale
+
+        while True:
+            with sessions['lock']:  # n.b. so only one run obtains a value
+                kept = sessions['values'].get(name)
+                if kept and time() - kept[1] < self.NET_SESSION_TTL:
+                    value, fresh = kept[0], False
+                else:
+                    self._logger.debug("Obtaining the session's %s for %s",
+                                       name, self.NAME)
+                    value, fresh = obtain(), True
+                    sessions['values'][name] = value, time()
+
+            try:
+                return operation(value)
+
+            except Exception as exception:  # catch all, pylint:disable=W0703
+                if fresh or not stale(exception):
+                    raise
+
+                with sessions['lock']:
+                    if sessions['values'].get(name, (None,))[0] == value:
+                        del sessions['values'][name]
+                self._logger.info("%s refused the session's %s (%s); "
+                                  "obtaining new ones", self.NAME, name,
+                                  exception)
+
+    @staticmethod
+    def net_stale(exception):
+        """
+        Returns True if the given exception from a network operation
+        looks like the server refusing an expired session value (i.e. a
+        401, 403, 419, or 440 status), or False otherwise.
+        """
+
+        return isinstance(exception, HTTPError) and \
+            exception.code in [401, 403, 419, 440]
+
+    def net_cookies(self, url):
+        """
+        Returns the cookies set by the given URL as a string ready to be
+        used in a Cookie header (e.g. for net_session()). Raises an
+        IOError if the URL does not set any.
+        """
+
+        headers = self.net_headers(url)
+        cookies = '; '.join(
+            cookie.split(';')[0].strip()
+            for cookie in headers.getheaders('Set-Cookie')
+        )
+
+        if not cookies:
+            raise IOError("%s did not give us a cookie" % self.NAME)
+        return cookies
+
     def net_count(self):
         """
-        Returns the number of downloads the last run required. Intended
-        for use by the router to query after a run.
+        Returns the number of downloads the current run has required so
+        far on this thread.
+        """
+
+        return self.stats()['netops']
+
+    def stats(self):
+        """
+        Returns a copy of the STATS values measured for the current run
+        on this thread. Because runs happen on worker threads, the
+        router calls this (and stats_reset()) from within the task so
+        that concurrent runs of a service do not mix their numbers.
         """
 
-        return self._netops
+        if not hasattr(self._stats, 'values'):
+            self.stats_reset()
+        return dict(self._stats.values)
 
-    def net_reset(self):
+    def stats_reset(self):
         """
-        Resets the download count back to zero. Intended for use by the
-        router before a run.
+        Zeroes the STATS values for a new run on this thread, and notes
+        when the run started (see net_retry()).
         """
 
-        self._netops = 0
+        self._stats.values = dict.fromkeys(STATS, 0)
+        self._stats.started = time()
+
+    def _stat(self, name, amount):
+        """Adds the given amount to one of this thread's STATS values."""
+
+        if not hasattr(self._stats, 'values'):
+            self.stats_reset()
+        self._stats.values[name] += amount
 
     def path_temp(self, extension):
         """
@@ -693,6 +1629,48 @@ class Service(object):
             ),
         )
 
+    def path_partial(self, path):
+        """
+        Returns a path next to the given one (i.e. on the same file
+        system) that a file may be written to before path_commit() puts
+        it at the given path.
+        """
+
+        from random import choice
+        from string import ascii_lowercase, digits
+
+        return '%s.%s.part' % (
+            path,
+            ''.join(choice(ascii_lowercase + digits) for i in range(8)),
+        )
+
+    def path_commit(self, source, destination):
+        """
+        Moves the finished file at source to destination in such a way
+        that there is never a partially-written file at destination.
+
+        If source is elsewhere (e.g. the temporary directory, which may
+        be on another file system), it is first moved to a partial path
+        next to destination, and then renamed into place from there.
+        """
+
+        partial = None
+        if os.path.dirname(os.path.abspath(source)) != \
+                os.path.dirname(os.path.abspath(destination)):
+            partial = self.path_partial(destination)
+            shutil.move(source, partial)
+            source = partial
+
+        try:
+            if self.IS_WINDOWS and os.path.exists(destination):
+                os.unlink(destination)  # Windows cannot rename over a file
+            os.rename(source, destination)
+
+        except OSError:
+            if partial:
+                self.path_unlink(partial)
+            raise
+
     def path_unlink(self, *args):
         """
         Attempts to remove the given file(s), ignoring any failures. May
@@ -770,15 +1748,48 @@ class Service(object):
 
     def util_merge(self, input_files, output_file):
         """
-        Given several input files, dumbly merge together into a single
-        output file.
+        Given several input MP3 files, merge together into a single
+        output file, which only appears once it is complete.
+
+        The files are joined frame by frame (see mp3.join()), so that
+        each one's tags, header frame, and padding do not end up in the
+        middle of the audio, and the output gets a header frame of its
+        own. If one of the files has no frames (i.e. it is not an MP3),
+        then the files are dumbly concatenated instead, as they were
+        before the frame-aware join existed.
         """
 
         self._logger.debug("Merging %s into %s", input_files, output_file)
-        with open(output_file, 'wb') as output_stream:
-            for input_file in input_files:
-                with open(input_file, 'rb') as input_stream:
-                    output_stream.write(input_stream.read())
+        partial = self.path_partial(output_file)
+
+        try:
+            with open(partial, 'wb') as output_stream:
+                try:
+                    mp3.join(input_files, output_stream)
+
+                except ValueError as error:
+                    self._logger.warn("Cannot merge by frame (%s); "
+                                      "concatenating instead", error)
+                    for input_file in input_files:
+                        with open(input_file, 'rb') as input_stream:
+                            shutil.copyfileobj(input_stream, output_stream,
+                                               NET_CHUNK)
+
+            self.path_commit(partial, output_file)
+
+        finally:
+            if os.path.exists(partial):
+                os.unlink(partial)
+
+    def util_joiner(self):
+        """
+        Returns a pcm.Joiner for collecting several pieces of wave audio
+        (e.g. one for each bit of util_split() text) so that they can be
+        transcoded together by a single cli_transcode_pipe() call. The
+        caller must close() it when finished.
+        """
+
+        return pcm.Joiner(self._temp_dir)
 
     def util_pad(self, path):
         """
@@ -789,6 +1800,74 @@ class Service(object):
         with open(path, 'ab') as output_stream:
             output_stream.write(PADDING)
 
+    def util_polish(self, path, trim=True, loudness=True):
+        """
+        Decodes the MP3 at the given path, trims the silence from its
+        start and end and/or levels its loudness (see audio.polish()),
+        then transcodes it back into place over the same path.
+
+        Clips that several runs are polishing at the same time (e.g.
+        during a whole-deck batch) are processed together in a single
+        call (see audio.Batcher).
+
+        Like with cli_transcode_pipe(), LAME reads the MP3 from its stdin
+        and writes the wave to its stdout, so no paths are passed to it
+        (see cli_transcode() for why non-ASCII ones are a problem) and
+        no wave is written to the temporary directory.
+        """
+
+        def decode():
+            """Runs LAME with the MP3 on its stdin, returning its stdout."""
+
+            with open(path, 'rb') as input_stream:
+                lame = self._cli_exec(
+                    lambda args, **kwargs: subprocess.Popen(
+                        args,
+                        stdin=input_stream,
+                        stdout=subprocess.PIPE,
+                        **kwargs
+                    ),
+                    [self.CLI_LAME, '--quiet', '--decode', '-', '-'],
+                    "to decode its stdin",
+                )
+
+            returned = lame.communicate()[0]
+            if lame.returncode:
+                raise subprocess.CalledProcessError(lame.returncode,
+                                                    self.CLI_LAME)
+            return returned
+
+        try:
+            decoded = self._transcode(decode)
+
+        except OSError as os_error:
+            from errno import ENOENT
+            if os_error.errno == ENOENT:
+                raise OSError(
+                    ENOENT,
+                    "Unable to find lame to decode the audio for trimming "
+                    "or leveling. It might not have been installed.",
+                )
+            else:
+                raise
+
+        channels, width, rate, frames = pcm.read(decoded, "Decoded audio")
+        if width != audio.WIDTH:
+            raise ValueError("Decoded audio has %d-byte samples" % width)
+
+        frames = POLISHER((frames, channels, rate), trim, loudness)
+
+        polished = StringIO()
+        encoded = wave.open(polished, 'wb')
+        encoded.setnchannels(channels)
+        encoded.setsampwidth(audio.WIDTH)
+        encoded.setframerate(rate)
+        encoded.writeframes(frames)
+        encoded.close()
+
+        polished.seek(0)
+        self.cli_transcode_pipe(polished, path)
+
     def util_split(self, text, limit):
         """
         Intelligently split a string into smaller bits based on the
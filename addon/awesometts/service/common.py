@@ -22,10 +22,28 @@
 Common classes for services
 
 Provides an enum-like Trait class for specifying the characteristics of
-a service.
+a service, an enum-like Fold class for specifying which differences
+in input text a service is indifferent to, and a NotInDictionary error
+for dictionary services to raise when they do not have the input.
 """
 
-__all__ = ['Trait']
+__all__ = ['Fold', 'NotInDictionary', 'Trait']
+
+
+class Fold(object):  # enum class, pylint:disable=R0903
+    """
+    Provides an enum-like namespace with codes that describe ways in
+    which input text can be folded without changing what a service
+    would produce, used by concrete Service classes' FOLDS lists.
+
+    The framework folds the text this way before hashing it for the
+    cache path, so that trivially different inputs share one file.
+    """
+
+    UNICODE = 1      # composed (NFC) and decomposed forms sound the same
+    WHITESPACE = 2   # runs of whitespace sound the same as a single space
+    CASE = 4         # uppercase and lowercase sound the same
+    PUNCTUATION = 8  # trailing punctuation (e.g. "word?" vs "word") is moot
 
 
 class Trait(object):  # enum class, pylint:disable=R0903
@@ -42,3 +60,13 @@ class Trait(object):  # enum class, pylint:disable=R0903
     INTERNET = 1     # files retrieved from Internet; use throttling
     TRANSCODING = 2  # LAME transcoder is used
     DICTIONARY = 4   # for services that have limited vocabularies
+
+
+class NotInDictionary(IOError):
+    """
+    Raised by a dictionary service when it does not have a recording
+    for the input text (e.g. the word is not in the dictionary), as
+    opposed to failing for some other reason. The framework remembers
+    these failures for much longer than others, since trying the same
+    input again will not change the outcome.
+    """
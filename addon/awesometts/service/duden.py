@@ -28,7 +28,7 @@ from re import compile as re
 from unicodedata import normalize as unicode_normalize
 
 from .base import Service
-from .common import Trait
+from .common import NotInDictionary, Trait
 
 __all__ = ['Duden']
 
@@ -45,6 +45,8 @@ RE_MP3 = re(r'(Betonung:|Bei der Schreibung) .*?'
 
 HTML_PARSER = HTMLParser()
 
+PAGE_TTL = 604800  # seconds to reuse search and article pages for (1 week)
+
 
 class Duden(Service):
     """
@@ -158,10 +160,12 @@ class Duden(Service):
         self._logger.debug('Duden: Searching on "%s"', text_search)
         try:
             search_html = self.net_stream((SEARCH_FORM, dict(s=text_search)),
-                                          require=dict(mime='text/html'))
+                                          require=dict(mime='text/html'),
+                                          cache_ttl=PAGE_TTL)
         except IOError as io_error:
             if getattr(io_error, 'code', None) == 404:
-                raise IOError("Duden does not recognize this input.")
+                raise NotInDictionary("Duden does not recognize this "
+                                      "input.")
             else:
                 raise
 
@@ -211,7 +215,7 @@ class Duden(Service):
                                    'match; skipping', article_url)
                 continue
 
-            article_html = self.net_stream(article_url)
+            article_html = self.net_stream(article_url, cache_ttl=PAGE_TTL)
 
             for mp3_match in RE_MP3.finditer(article_html):
                 guide = mp3_match.group(3)
@@ -243,4 +247,5 @@ class Duden(Service):
                                        'and does not match our input',
                                        mp3_url, guide, guide_normalized)
 
-        raise IOError("Duden does not have recorded audio for this word.")
+        raise NotInDictionary("Duden does not have recorded audio for this "
+                              "word.")
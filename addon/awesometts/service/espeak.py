@@ -321,19 +321,18 @@ class ESpeak(Service):
 
     def run(self, text, options, path):
         """
-        Checks for unicode workaround on Windows, writes a temporary
-        wave file, and then transcodes to MP3.
+        Checks for unicode workaround on Windows, and then streams the
+        wave audio from eSpeak's stdout into LAME to make the MP3.
         """
 
         input_file = self.path_workaround(text)
-        output_wav = self.path_temp('wav')
 
         voice = ('+'.join([options['voice'], options['variant']])
                  if options['variant'] and options['variant'] != "normal"
                  else options['voice'])
 
         try:
-            self.cli_call(
+            self.cli_transcode_pipe(
                 [
                     self._binary,
                     '-v', voice,
@@ -341,15 +340,11 @@ class ESpeak(Service):
                     '-g', int(options['gap'] * 100.0),
                     '-p', options['pitch'],
                     '-a', options['volume'],
-                    '-w', output_wav,
+                    '--stdout',
                 ] + (
                     ['-f', input_file] if input_file
                     else ['--', text]
-                )
-            )
-
-            self.cli_transcode(
-                output_wav,
+                ),
                 path,
                 require=dict(
                     size_in=4096,
@@ -358,4 +353,4 @@ class ESpeak(Service):
             )
 
         finally:
-            self.path_unlink(input_file, output_wav)
+            self.path_unlink(input_file)
@@ -124,24 +124,21 @@ class Festival(Service):
 
     def run(self, text, options, path):
         """
-        Write a temporary input text file, calls `text2wave` to write a
-        temporary wave file, and then transcodes that to MP3.
+        Write a temporary input text file, and then streams the wave
+        audio that `text2wave` writes to its stdout into LAME to make
+        the MP3.
         """
 
         input_file = self.path_input(text)
-        output_wav = self.path_temp('wav')
 
         try:
-            self.cli_call(
-                'text2wave',
-                '-o', output_wav,
-                '-eval', '(voice_%s)' % options['voice'],
-                '-scale', options['volume'] / 100.0,
-                input_file,
-            )
-
-            self.cli_transcode(
-                output_wav,
+            self.cli_transcode_pipe(
+                [
+                    'text2wave',
+                    '-eval', '(voice_%s)' % options['voice'],
+                    '-scale', options['volume'] / 100.0,
+                    input_file,
+                ],
                 path,
                 require=dict(
                     size_in=4096,
@@ -149,4 +146,4 @@ class Festival(Service):
             )
 
         finally:
-            self.path_unlink(input_file, output_wav)
+            self.path_unlink(input_file)
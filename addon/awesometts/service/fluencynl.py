@@ -82,6 +82,8 @@ class FluencyNl(Service):
 
     TRAITS = [Trait.INTERNET]
 
+    NET_PARALLEL = 3
+
     def desc(self):
         """Returns service name with a voice count."""
 
@@ -153,7 +153,7 @@ class Google(Service):
         if not self._frame:
             self._prerun_setup()
 
-        self._netops += 30
+        self._stat('netops', 30)
 
         state = {}  # using a dict to workaround lack of `nonlocal` keyword
 
@@ -25,7 +25,7 @@ Service implementation for Howjsay
 __all__ = ['Howjsay']
 
 from .base import Service
-from .common import Trait
+from .common import Fold, NotInDictionary, Trait
 
 
 class Howjsay(Service):
@@ -40,6 +40,8 @@ class Howjsay(Service):
 
     TRAITS = [Trait.INTERNET, Trait.DICTIONARY]
 
+    FOLDS = Service.FOLDS + [Fold.CASE, Fold.PUNCTUATION]
+
     def __init__(self, *args, **kwargs):
         super(Howjsay, self).__init__(*args, **kwargs)
 
@@ -103,7 +105,7 @@ class Howjsay(Service):
 
         except IOError as io_error:
             if hasattr(io_error, 'code') and io_error.code == 404:
-                raise IOError(
+                raise NotInDictionary(
                     "Howjsay does not have recorded audio for this phrase. "
                     "While most words have recordings, most phrases do not."
                     if text.count(' ')
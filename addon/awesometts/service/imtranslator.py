@@ -51,6 +51,9 @@ class ImTranslator(Service):
 
     _RE_SWF = re.compile(r'https?:[\w:/\.]+\.swf\?\w+=\w+', re.IGNORECASE)
 
+    class _SwfMissingError(SocketError):  # non-caching, like other retries
+        """Raises when the page does not have the audio's SWF URL."""
+
     def __init__(self, *args, **kwargs):
         if self.IS_MACOSX:
             raise EnvironmentError(
@@ -138,79 +141,56 @@ class ImTranslator(Service):
 
         Because ImTranslator sometimes raises various errors, both steps
         of this (i.e. downloading the page and dumping the audio) may be
-        retried up to three times.
+        retried (see net_retry()), including when the page comes back
+        without a link to the SWF.
         """
 
         output_wavs = []
-        output_mp3s = []
         require = dict(size_in=4096)
 
-        logger = self._logger
+        def fetch_swf(subtext):
+            """Returns the SWF URL from the page for the given text."""
+
+            result = self.net_stream(
+                ('http://imtranslator.net/translate-and-speak/'
+                 'sockets/tts.asp',
+                 dict(text=subtext, vc=options['voice'],
+                      speed=options['speed'], FA=1)),
+                require=dict(mime='text/html', size=256),
+                method='POST',
+            )
+
+            result = self._RE_SWF.search(result)
+            if not result or not result.group():
+                raise self._SwfMissingError("cannot find SWF path in "
+                                            "payload")
+            return result.group()
 
         try:
             for subtext in self.util_split(text, 400):
-                for i in range(1, 4):
-                    try:
-                        logger.info("ImTranslator net_stream: attempt %d", i)
-                        result = self.net_stream(
-                            ('http://imtranslator.net/translate-and-speak/'
-                             'sockets/tts.asp',
-                             dict(text=subtext, vc=options['voice'],
-                                  speed=options['speed'], FA=1)),
-                            require=dict(mime='text/html', size=256),
-                            method='POST',
-                        )
-
-                        result = self._RE_SWF.search(result)
-                        if not result or not result.group():
-                            raise EnvironmentError('500b', "cannot find SWF"
-                                                           "path in payload")
-                        result = result.group()
-                    except (EnvironmentError, IOError) as error:
-                        if hasattr(error, 'code') and error.code == 500:
-                            logger.warn("ImTranslator net_stream: got 500")
-                        elif hasattr(error, 'errno') and error.errno == '500b':
-                            logger.warn("ImTranslator net_stream: no SWF path")
-                        elif 'timed out' in format(error):
-                            logger.warn("ImTranslator net_stream: timeout")
-                        else:
-                            logger.error("ImTranslator net_stream: %s", error)
-                            raise
-                    else:
-                        logger.info("ImTranslator net_stream: success")
-                        break
-                else:
-                    logger.error("ImTranslator net_stream: exhausted")
-                    raise SocketError("unable to fetch page from ImTranslator "
-                                      "even after multiple attempts")
+                result = self.net_retry(
+                    lambda subtext=subtext: fetch_swf(subtext),
+                    "ImTranslator page",
+                    retryable=lambda error:
+                    isinstance(error, self._SwfMissingError),
+                )
 
                 output_wav = self.path_temp('wav')
                 output_wavs.append(output_wav)
-
-                for i in range(1, 4):
-                    try:
-                        logger.info("ImTranslator net_dump:   attempt %d", i)
-                        self.net_dump(output_wav, result)
-                    except RuntimeError:
-                        logger.warn("ImTranslator net_dump:   failure")
-                    else:
-                        logger.info("ImTranslator net_dump:   success")
-                        break
-                else:
-                    logger.error("ImTranslator net_dump:   exhausted")
-                    raise SocketError("unable to dump audio from ImTranslator "
-                                      "even after multiple attempts")
+                self.net_dump(output_wav, result)
 
             if len(output_wavs) > 1:
-                for output_wav in output_wavs:
-                    output_mp3 = self.path_temp('mp3')
-                    output_mp3s.append(output_mp3)
-                    self.cli_transcode(output_wav, output_mp3, require=require)
-
-                self.util_merge(output_mp3s, path)
+                joiner = self.util_joiner()
+                try:
+                    for output_wav in output_wavs:
+                        joiner.add_path(output_wav, require=require)
+                    self.cli_transcode_pipe(joiner.stream(), path,
+                                            require=require)
+                finally:
+                    joiner.close()
 
             else:
                 self.cli_transcode(output_wavs[0], path, require=require)
 
         finally:
-            self.path_unlink(output_wavs, output_mp3s)
+            self.path_unlink(output_wavs)
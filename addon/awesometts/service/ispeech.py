@@ -88,6 +88,8 @@ class ISpeech(Service):
     # to rate-limit it or trigger error caching behavior
     TRAITS = []
 
+    NET_PARALLEL = 3
+
     def desc(self):
         """Returns name with a voice count."""
 
@@ -157,5 +159,3 @@ class ISpeech(Service):
             except StandardError:
                 pass
             raise error
-
-        self.net_reset()  # no throttle; FIXME should be controlled by trait
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+
+# AwesomeTTS text-to-speech add-on for Anki
+#
+# Copyright (C) 2014-2016  Anki AwesomeTTS Development Team
+# Copyright (C) 2014-2016  Dave Shifflett
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+MPEG audio frame handling for services
+
+Provides a join() function that puts several MP3 files together frame
+by frame, for services that generate long text in pieces.
+"""
+
+from array import array
+import mmap
+import os
+import struct
+
+__all__ = ['join']
+
+
+VERSIONS = {0: 2.5, 2: 2, 3: 1}  # version bits to MPEG version
+LAYERS = {1: 3, 2: 2, 3: 1}      # layer bits to layer
+
+BITRATES = {  # kbps for bitrate indices 1 to 14, by MPEG version and layer
+    (1, 1): [32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416,
+             448],
+    (1, 2): [32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+SAMPLE_RATES = {1: [44100, 48000, 32000], 2: [22050, 24000, 16000],
+                2.5: [11025, 12000, 8000]}
+
+INFO_TAGS = ['Xing', 'Info']  # tags of a LAME/Xing header frame
+INFO_FLAGS = 0x7              # frame count, byte count, and TOC present
+INFO_SIZE = 4 + 4 + 4 + 4 + 100  # tag, flags, frames, bytes, and TOC
+
+VBRI_OFFSET = 36  # where a Fraunhofer VBRI header frame has its tag
+
+ID3V1_SIZE = 128
+APE_FOOTER_SIZE = 32
+
+
+def join(paths, output):
+    """
+    Writes the MPEG audio frames of each of the files at the given paths
+    to the given output, which must be a seekable file opened for
+    writing, and returns the number of frames written.
+
+    Anything that is not part of the audio is left out: ID3v1, ID3v2,
+    and APEv2 tags, the Xing/Info or VBRI header frame that an encoder
+    puts at the start of each file (which describes only that file),
+    and junk between or after frames (e.g. null padding). In their
+    place, if the audio is Layer III, a single Xing/Info header frame
+    is written at the start, with the frame and byte counts and a seek
+    table for the joined audio, so that players report its length and
+    seek within it correctly.
+
+    The files are memory-mapped and copied one run of frames at a time,
+    rather than being read into memory whole.
+
+    Raises a ValueError, having written nothing, if one of the files
+    has no MPEG audio frames in it at all (e.g. it is an error page).
+    """
+
+    runs = []
+    for path in paths:
+        with open(path, 'rb') as part:
+            part_runs = _runs(part)
+        if not part_runs:
+            raise ValueError("%s has no MPEG audio frames" % path)
+        runs.append((path, part_runs))
+
+    first = runs[0][1][0][2]  # i.e. the header of the very first frame
+    info_size = _info_size(first)
+    output.write('\0' * info_size)
+
+    offsets = array('L')
+    bitrates = set()
+    size = info_size
+
+    for path, part_runs in runs:
+        with open(path, 'rb') as part:
+            mapped = mmap.mmap(part.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for start, end, _, frames in part_runs:
+                    output.write(mapped[start:end])
+                    for offset, bitrate in frames:
+                        offsets.append(size + offset - start)
+                        bitrates.add(bitrate)
+                    size += end - start
+            finally:
+                mapped.close()
+
+    if info_size:
+        output.seek(0)
+        output.write(_info_frame(first, info_size, offsets, size,
+                                 'Xing' if len(bitrates) > 1 else 'Info'))
+        output.seek(0, 2)
+
+    return len(offsets)
+
+
+def _runs(part):
+    """
+    Returns a list of the runs of back-to-back audio frames in the given
+    open file, as (start, end, first header, frames) tuples, where the
+    frames are (offset, bitrate) tuples, or an empty list if the file is
+    empty or has no frames.
+    """
+
+    if not os.fstat(part.fileno()).st_size:
+        return []  # mmap cannot map an empty file
+
+    mapped = mmap.mmap(part.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return _scan(mapped, *_bounds(mapped))
+    finally:
+        mapped.close()
+
+
+def _bounds(buf):
+    """
+    Returns where the audio in the buffer begins and ends, i.e. after
+    any ID3v2 tags at the start and before any ID3v1 or APEv2 tags at
+    the end.
+    """
+
+    start, end = 0, len(buf)
+
+    while buf[start:start + 3] == 'ID3' and start + 10 <= end:
+        flags = ord(buf[start + 5])
+        size = 0
+        for byte in buf[start + 6:start + 10]:
+            size = size << 7 | ord(byte) & 0x7f  # "syncsafe" integer
+        start += 10 + size + (10 if flags & 0x10 else 0)  # w/ footer?
+
+    if end - ID3V1_SIZE >= start and \
+            buf[end - ID3V1_SIZE:end - ID3V1_SIZE + 3] == 'TAG':
+        end -= ID3V1_SIZE
+
+    if end - APE_FOOTER_SIZE >= start and \
+            buf[end - APE_FOOTER_SIZE:end - APE_FOOTER_SIZE + 8] == \
+            'APETAGEX':
+        size, flags = struct.unpack('<II', buf[end - 20:end - 12])
+        end -= size + (APE_FOOTER_SIZE if flags & 0x80000000 else 0)
+
+    return start, max(start, end)
+
+
+def _scan(buf, start, end):
+    """
+    Returns the runs of frames (see _runs()) between start and end in
+    the buffer, leaving out a header frame at the start and any junk.
+
+    A frame is only believed to follow junk if the frame after it also
+    looks right (or it ends right at the end), so stray bytes that look
+    like a frame header (e.g. inside of a tag) are not mistaken for one.
+    """
+
+    runs = []
+    position = start
+    expected = None  # key of the frame that the last one leads into
+    first = True
+
+    while position + 4 <= end:
+        header = _header(buf, position)
+        length = header['length'] if header else 0
+
+        if header and position + length <= end and (
+                header['key'] == expected if expected
+                else position + length == end or
+                _follows(buf, position + length, end, header['key'])
+        ):
+            if first and _is_info(buf, position, header):
+                expected = None  # next frame starts the first run
+            else:
+                frame = (position, header['bitrate'])
+                if expected:
+                    runs[-1][1] = position + length
+                    runs[-1][3].append(frame)
+                else:
+                    runs.append([position, position + length, header,
+                                 [frame]])
+                expected = header['key']
+            first = False
+            position += length
+
+        else:
+            expected = None
+            position = buf.find('\xff', position + 1, end)
+            if position < 0:
+                break
+
+    return [tuple(run) for run in runs]
+
+
+def _follows(buf, position, end, key):
+    """Returns True if a frame like key begins at the given position."""
+
+    if position + 4 > end:
+        return False
+    header = _header(buf, position)
+    return bool(header) and header['key'] == key
+
+
+def _header(buf, position):
+    """
+    Returns a dict describing the MPEG audio frame header at the given
+    position in the buffer, or None if there is not a valid one there.
+    """
+
+    byte0, byte1, byte2, byte3 = bytearray(buf[position:position + 4])
+
+    if byte0 != 0xff or byte1 & 0xe0 != 0xe0:
+        return None
+
+    version = VERSIONS.get(byte1 >> 3 & 3)
+    layer = LAYERS.get(byte1 >> 1 & 3)
+    bitrate_index = byte2 >> 4
+    rate_index = byte2 >> 2 & 3
+
+    if not version or not layer or bitrate_index in [0, 15] or \
+            rate_index == 3:
+        return None  # n.b. "free format" (bitrate index 0) is not handled
+
+    bitrate = BITRATES[min(version, 2), layer][bitrate_index - 1] * 1000
+    sample_rate = SAMPLE_RATES[version][rate_index]
+    padding = byte2 >> 1 & 1
+    mono = byte3 >> 6 == 3
+
+    if layer == 1:
+        length = (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 3 and version != 1:
+        length = 72 * bitrate // sample_rate + padding
+    else:
+        length = 144 * bitrate // sample_rate + padding
+
+    return dict(
+        bitrate=bitrate,
+        bytes=(byte1, byte3),
+        key=(version, layer, sample_rate, mono),
+        length=length,
+        side=(17 if mono else 32) if version == 1 else (9 if mono else 17),
+    )
+
+
+def _is_info(buf, position, header):
+    """
+    Returns True if the frame at the given position is an encoder's
+    Xing/Info or VBRI header frame rather than audio.
+    """
+
+    if header['key'][1] != 3:
+        return False
+
+    offset = position + 4 + header['side']
+    return buf[offset:offset + 4] in INFO_TAGS or \
+        buf[position + VBRI_OFFSET:position + VBRI_OFFSET + 4] == 'VBRI'
+
+
+def _info_size(header):
+    """
+    Returns the size of the smallest Xing/Info header frame like the
+    given header that can hold the INFO_SIZE bytes of information, or
+    zero if the audio is not Layer III (Xing headers are only defined
+    for Layer III).
+    """
+
+    version, layer, sample_rate, _ = header['key']
+    if layer != 3:
+        return 0
+
+    needed = 4 + header['side'] + INFO_SIZE
+    for bitrate in BITRATES[min(version, 2), 3]:
+        length = (144 if version == 1 else 72) * bitrate * 1000 // \
+            sample_rate
+        if length >= needed:
+            return length
+
+    return 0
+
+
+def _info_frame(header, length, offsets, size, tag):
+    """
+    Returns a Xing/Info header frame of the given length, in the same
+    MPEG version, sample rate, and channel mode as the given header, for
+    the joined audio with frames at the given offsets and size bytes in
+    total (including the header frame itself).
+    """
+
+    version, _, sample_rate, _ = header['key']
+    byte1, byte3 = header['bytes']
+
+    for index, bitrate in enumerate(BITRATES[min(version, 2), 3], 1):
+        if (144 if version == 1 else 72) * bitrate * 1000 // \
+                sample_rate == length:
+            break
+
+    toc = bytearray(
+        min(255, offsets[len(offsets) * percent // 100] * 256 // size)
+        for percent in range(100)
+    )
+
+    frame = ''.join([
+        chr(0xff),
+        chr(byte1 | 1),  # i.e. no CRC
+        chr(index << 4 | SAMPLE_RATES[version].index(sample_rate) << 2),
+        chr(byte3),
+        '\0' * header['side'],
+        tag,
+        struct.pack('>III', INFO_FLAGS, len(offsets), size),
+        str(toc),
+    ])
+
+    return frame + '\0' * (length - len(frame))
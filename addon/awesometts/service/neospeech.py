@@ -64,8 +64,7 @@ class NeoSpeech(Service):
     """
 
     __slots__ = [
-        '_lock',     # download URL is tied to cookie; force serial runs
-        '_cookies',  # used for all NeoSpeech requests in this Anki session
+        '_lock',  # download URL is tied to cookie; force serial runs
     ]
 
     NAME = "NeoSpeech"
@@ -74,7 +73,6 @@ class NeoSpeech(Service):
 
     def __init__(self, *args, **kwargs):
         self._lock = Lock()
-        self._cookies = None
         super(NeoSpeech, self).__init__(*args, **kwargs)
 
     def desc(self):
@@ -103,28 +101,39 @@ class NeoSpeech(Service):
         """Requests MP3 URLs and then downloads them."""
 
         with self._lock:
-            if not self._cookies:
-                headers = self.net_headers(BASE_URL)
-                self._cookies = ';'.join(
-                    cookie.split(';')[0]
-                    for cookie in headers['Set-Cookie'].split(',')
-                )
-                self._logger.debug("NeoSpeech cookies are %s", self._cookies)
-            headers = {'Cookie': self._cookies}
-
             voice_id = MAP[options['voice']]
 
             def fetch_piece(subtext, subpath):
                 """Fetch given phrase from the API to the given path."""
-                url = self.net_stream((DEMO_URL, dict(content=subtext,
-                                                      voiceId=voice_id)),
+
+                def fetch(cookies):
+                    """Makes the requests with the given cookies."""
+
+                    headers = {'Cookie': cookies}
+                    url = self.net_stream((DEMO_URL, dict(content=subtext,
+                                                          voiceId=voice_id)),
+                                          custom_headers=headers)
+                    url = json.loads(url)
+                    url = url['audioUrl']
+                    assert len(url) > 1 and url[0] == '/', \
+                        "expecting relative URL"
+
+                    self.net_download(subpath, BASE_URL + url,
+                                      require=REQUIRE_MP3,
                                       custom_headers=headers)
-                url = json.loads(url)
-                url = url['audioUrl']
-                assert len(url) > 1 and url[0] == '/', "expecting relative URL"
 
-                self.net_download(subpath, BASE_URL + url, require=REQUIRE_MP3,
-                                  custom_headers=headers)
+                self.net_session(
+                    'cookies',
+                    lambda: self.net_cookies(BASE_URL),
+                    fetch,
+
+                    # an expired cookie gets an answer w/o an audio URL or a
+                    # download that is not an MP3, rather than a 401 or 403
+                    stale=lambda exception: (
+                        isinstance(exception, (KeyError, ValueError)) or
+                        self.net_stale(exception)
+                    ),
+                )
 
             subtexts = self.util_split(text, 200)  # see `maxlength` on site
             if len(subtexts) == 1:
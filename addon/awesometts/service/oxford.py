@@ -28,7 +28,7 @@ __all__ = ['Oxford']
 import re
 
 from .base import Service
-from .common import Trait
+from .common import Fold, NotInDictionary, Trait
 
 from HTMLParser import HTMLParser
 
@@ -40,6 +40,8 @@ RE_WHITESPACE = re.compile(r'[-\0\s_]+', re.UNICODE)
 # important so that accented characters are not filtered out.
 RE_DISCARD = re.compile(r'[^-.\s\w]+', re.UNICODE)
 
+PAGE_TTL = 604800  # seconds to reuse a dictionary page for (i.e. 1 week)
+
 
 class OxfordLister(HTMLParser):
     """Accumulate all found MP3s into `sounds` member."""
@@ -65,6 +67,8 @@ class Oxford(Service):
 
     TRAITS = [Trait.INTERNET, Trait.DICTIONARY]
 
+    FOLDS = Service.FOLDS + [Fold.PUNCTUATION]
+
     def desc(self):
         """
         Returns a short, static description.
@@ -133,10 +137,10 @@ class Oxford(Service):
         )
 
         try:
-            html_payload = self.net_stream(dict_url)
+            html_payload = self.net_stream(dict_url, cache_ttl=PAGE_TTL)
         except IOError as io_error:
             if hasattr(io_error, 'code') and io_error.code == 404:
-                raise IOError(
+                raise NotInDictionary(
                     "The Oxford Dictionary does not recognize this phrase. "
                     "While most single words are recognized, many multi-word "
                     "phrases are not."
@@ -159,5 +163,5 @@ class Oxford(Service):
                 require=dict(mime='audio/mpeg', size=1024),
             )
         else:
-            raise IOError("The Oxford Dictionary recognized your input, "
-                          "but has no recorded audio for it.")
+            raise NotInDictionary("The Oxford Dictionary recognized your "
+                                  "input, but has no recorded audio for it.")
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+
+# AwesomeTTS text-to-speech add-on for Anki
+#
+# Copyright (C) 2014-2016  Anki AwesomeTTS Development Team
+# Copyright (C) 2014-2016  Dave Shifflett
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Wave audio handling for services
+
+Provides a Joiner class that collects the PCM audio of several wave
+files into one, for services that generate long text in pieces, so
+that the whole thing can be transcoded with one run of LAME.
+"""
+
+import mmap
+import os
+import struct
+from tempfile import SpooledTemporaryFile
+
+__all__ = ['Joiner', 'read']
+
+
+SPOOL_SIZE = 2**23  # bytes of joined audio kept in memory before spilling
+
+UNKNOWN_SIZE = 0xffffffff  # data size that a streaming encoder leaves
+
+
+class Joiner(object):
+    """
+    Collects the PCM audio of several wave files, which must all have
+    the same format, into a single wave file. The audio is kept in
+    memory until it gets big, then spills into the temporary directory.
+
+    Each piece's own header is left out, and each piece's audio is
+    trimmed to a whole number of samples, so the pieces meet exactly
+    at the sample level (i.e. without any gap or click between them).
+    """
+
+    __slots__ = [
+        '_format',   # the first piece's "fmt " chunk, which all must match
+        '_header',   # length of the header written ahead of the audio
+        '_size',     # bytes of audio collected so far
+        '_stream',   # SpooledTemporaryFile holding the joined wave file
+    ]
+
+    def __init__(self, temp_dir=None):
+        """
+        Sets up a spool for the joined wave file that, if it gets big,
+        spills into a file in the temp_dir.
+        """
+
+        self._format = None
+        self._header = 0
+        self._size = 0
+        self._stream = SpooledTemporaryFile(max_size=SPOOL_SIZE,
+                                            dir=temp_dir)
+
+    def add(self, wave, require=None):
+        """
+        Adds the audio from a string of wave audio (e.g. as it came back
+        from a web service). Raises a ValueError if it is not a wave, if
+        its format is different from the pieces before it, or if it is
+        smaller than the size_in of the require dict, if one is given
+        (like cli_transcode() checks a whole input, but for each piece,
+        so that a truncated piece does not slip into the middle).
+        """
+
+        self._add(wave, "wave audio", require)
+
+    def add_path(self, path, require=None):
+        """
+        Adds the audio from the wave file at the given path, which is
+        memory-mapped rather than read into memory whole. Raises a
+        ValueError like add() does.
+        """
+
+        with open(path, 'rb') as wave_file:
+            if not os.fstat(wave_file.fileno()).st_size:
+                raise ValueError("%s is empty" % path)
+
+            mapped = mmap.mmap(wave_file.fileno(), 0,
+                               access=mmap.ACCESS_READ)
+            try:
+                self._add(mapped, path, require)
+            finally:
+                mapped.close()
+
+    def _add(self, buf, name, require=None):
+        """Copies the audio in the buffer into the joined wave file."""
+
+        if require and 'size_in' in require and \
+                len(buf) < require['size_in']:
+            raise ValueError(
+                "Input to transcoder was %d-byte stream; wanted %d+ bytes "
+                "(the service might not have liked your input text)" % (
+                    len(buf),
+                    require['size_in'],
+                )
+            )
+
+        fmt, start, end = _chunks(buf, name)
+
+        if self._format is None:
+            self._format = fmt
+            self._header = 4 + 4 + 4 + 4 + 4 + len(fmt) + len(fmt) % 2 + \
+                4 + 4
+            self._stream.write('\0' * self._header)
+        elif fmt != self._format:
+            raise ValueError("%s has a different format than the wave "
+                             "audio before it" % name)
+
+        block = struct.unpack('<H', fmt[12:14])[0] or 1
+        end -= (end - start) % block  # i.e. whole samples for all channels
+
+        self._stream.write(buf[start:end])
+        self._size += end - start
+
+    def stream(self):
+        """
+        Fills in the header of the joined wave file and returns it as a
+        file-like object, positioned at the start, e.g. to be passed to
+        cli_transcode_pipe(). Raises a ValueError if nothing was added.
+        """
+
+        if self._format is None:
+            raise ValueError("no wave audio was added")
+
+        fmt = self._format
+        self._stream.seek(0)
+        self._stream.write(''.join([
+            'RIFF',
+            struct.pack('<I', self._header - 8 + self._size),
+            'WAVE',
+            'fmt ',
+            struct.pack('<I', len(fmt)),
+            fmt,
+            '\0' * (len(fmt) % 2),
+            'data',
+            struct.pack('<I', self._size),
+        ]))
+        self._stream.seek(0)
+
+        return self._stream
+
+    def close(self):
+        """Discards the joined wave file."""
+
+        self._stream.close()
+
+
+def read(buf, name="Wave audio"):
+    """
+    Returns the number of channels, bytes per sample, sample rate, and
+    audio (trimmed to a whole number of frames) of the wave in the
+    buffer, e.g. as written by lame --decode to a pipe, which cannot go
+    back to fill in the size of the data (see _chunks()).
+    """
+
+    fmt, start, end = _chunks(buf, name)
+    channels, rate = struct.unpack('<HI', fmt[2:8])
+    width = (struct.unpack('<H', fmt[14:16])[0] + 7) // 8
+    end -= (end - start) % (channels * width or 1)
+
+    return channels, width, rate, buf[start:end]
+
+
+def _chunks(buf, name):
+    """
+    Returns the contents of the "fmt " chunk of the wave in the buffer
+    and where its "data" chunk's audio begins and ends.
+
+    If the data chunk's size is unknown or runs past the end of the
+    buffer (e.g. mplayer or a web service streamed the wave without
+    going back to fill in the size), the audio is taken to run to the
+    end of the buffer.
+    """
+
+    if buf[0:4] != 'RIFF' or buf[8:12] != 'WAVE':
+        raise ValueError("%s is not a RIFF wave" % name)
+
+    fmt = None
+    position = 12
+    length = len(buf)
+
+    while position + 8 <= length:
+        chunk = buf[position:position + 4]
+        size = struct.unpack('<I', buf[position + 4:position + 8])[0]
+        position += 8
+
+        if chunk == 'fmt ':
+            fmt = buf[position:position + size]
+
+        elif chunk == 'data':
+            if fmt is None or len(fmt) < 16:
+                raise ValueError("%s has no usable format chunk before "
+                                 "its data" % name)
+            if size == UNKNOWN_SIZE or position + size > length:
+                size = length - position
+            return fmt, position, position + size
+
+        position += size + size % 2  # chunks are aligned on even bytes
+
+    raise ValueError("%s has no data chunk" % name)
@@ -39,6 +39,8 @@ class SpanishDict(Service):
 
     TRAITS = [Trait.INTERNET]
 
+    NET_PARALLEL = 3
+
     def desc(self):
         """
         Returns a short, static description.
@@ -119,17 +119,14 @@ class VoiceText(Service):
 
     def run(self, text, options, path):
         """
-        Downloads from VoiceText to a wave file, then transcodes that
-        into an MP3 via lame.
+        Downloads wave audio from VoiceText, then streams that into
+        lame to make an MP3, without writing the wave to disk.
 
         If the input text is longer than 100 characters, it will be
-        split across multiple requests, transcoded, then merged back
-        together into a single MP3.
+        split across multiple requests, and the audio from each will be
+        joined back together (see util_joiner()) and transcoded once.
         """
 
-        wav_paths = []
-        mp3_paths = []
-
         parameters = dict(
             speaker=options['voice'],
             format='wav',
@@ -149,27 +146,29 @@ class VoiceText(Service):
                 )
             parameters['emotion'] = options['emotion']
 
+        api_endpoint = self.ecosystem.web + '/api/voicetext'
+        subtexts = self.util_split(text, 100)
+
+        def fetch(subtext):
+            """Returns the wave audio from VoiceText for the subtext."""
+
+            parameters['text'] = subtext
+            return self.net_stream((api_endpoint, parameters),
+                                   require=dict(mime='audio/wave',
+                                                size=2048),
+                                   awesome_ua=True)
+
+        if len(subtexts) == 1:
+            self.cli_transcode_pipe(fetch(subtexts[0]), path)
+            return
+
+        joiner = self.util_joiner()
+
         try:
-            api_endpoint = self.ecosystem.web + '/api/voicetext'
-
-            for subtext in self.util_split(text, 100):
-                wav_path = self.path_temp('wav')
-                wav_paths.append(wav_path)
-                parameters['text'] = subtext
-                self.net_download(wav_path,
-                                  (api_endpoint, parameters),
-                                  require=dict(mime='audio/wave', size=2048),
-                                  awesome_ua=True)
-
-            if len(wav_paths) > 1:
-                for wav_path in wav_paths:
-                    mp3_path = self.path_temp('mp3')
-                    mp3_paths.append(mp3_path)
-                    self.cli_transcode(wav_path, mp3_path)
-                self.util_merge(mp3_paths, path)
-
-            else:
-                self.cli_transcode(wav_paths[0], path)
+            for subtext in subtexts:
+                joiner.add(fetch(subtext))
+
+            self.cli_transcode_pipe(joiner.stream(), path)
 
         finally:
-            self.path_unlink(wav_paths, mp3_paths)
+            joiner.close()
@@ -40,6 +40,8 @@ class Yandex(Service):
 
     TRAITS = [Trait.INTERNET]
 
+    NET_PARALLEL = 3
+
     _VOICE_CODES = {
         # n.b. The aliases code below assumes that no languages have any
         # variants and is therefore safe to always alias to the full
@@ -44,6 +44,8 @@ class Youdao(Service):
 
     TRAITS = [Trait.INTERNET]
 
+    NET_PARALLEL = 3
+
     def desc(self):
         """Returns a static description."""
 
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+
+# AwesomeTTS text-to-speech add-on for Anki
+#
+# Copyright (C) 2014-2016  Anki AwesomeTTS Development Team
+# Copyright (C) 2014-2016  Dave Shifflett
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Pool of worker threads for transcoding jobs that services submit
+"""
+
+__all__ = ['Transcoder']
+
+from collections import deque
+from threading import Condition, Event, Thread
+from time import time
+
+
+RATE_SECS = 10  # period over which the recent job throughput is measured
+
+
+class Transcoder(object):
+    """
+    Runs the transcoding jobs of every service (i.e. LAME, encoding
+    an engine's audio or decoding an MP3 to be polished) on a fixed
+    number of worker threads, one for each CPU core by default.
+
+    However many of the router's worker threads want to transcode at
+    the same time (e.g. during mass generation), no more encoders than
+    that run at once, and the rest of the jobs wait their turn in a
+    first-in, first-out queue, so that the cores are kept busy without
+    the machine (and Anki's interface) being swamped.
+
+    The jobs spend nearly all of their time waiting on child processes,
+    outside of Python's interpreter lock, so the encoders really do run
+    in parallel across the cores.
+    """
+
+    __slots__ = [
+        '_condition',  # guards everything below and signals queued jobs
+        '_idle',       # number of worker threads waiting for a job
+        '_logger',     # logger-like interface with debug(), info(), etc.
+        '_queue',      # deque of jobs waiting for a worker thread
+        '_recent',     # deque of times that jobs finished in RATE_SECS
+        '_size',       # most worker threads (i.e. jobs running at once)
+        '_totals',     # dict of job, failure, and time totals
+        '_workers',    # number of worker threads started so far
+    ]
+
+    def __init__(self, logger, size=None):
+        """
+        Sets up the pool, with the given number of worker threads or
+        one for each CPU core. The worker threads are started as they
+        are first needed.
+        """
+
+        if not size:
+            try:
+                from multiprocessing import cpu_count
+                size = cpu_count()
+            except (ImportError, NotImplementedError):
+                size = 1
+
+        self._condition = Condition()
+        self._idle = 0
+        self._logger = logger
+        self._queue = deque()
+        self._recent = deque()
+        self._size = size
+        self._totals = dict(jobs=0, failures=0, busy_secs=0.0,
+                            wait_secs=0.0)
+        self._workers = 0
+
+    def __call__(self, job, *args, **kwargs):
+        """
+        Runs the job on the pool (see submit()), waiting for it to
+        finish, and returns its result or raises its exception.
+        """
+
+        return self.submit(job, *args, **kwargs).result()
+
+    def submit(self, job, *args, **kwargs):
+        """
+        Queues up job(*args, **kwargs) to be run by one of the worker
+        threads, returning a Future for its result.
+        """
+
+        future = Future()
+
+        with self._condition:
+            self._queue.append((future, job, args, kwargs, time()))
+
+            if self._idle:
+                self._condition.notify()
+
+            elif self._workers < self._size:
+                self._workers += 1
+                thread = Thread(target=self._work,
+                                name='transcoder%d' % self._workers)
+                thread.daemon = True
+                thread.start()
+                self._logger.debug("Started transcoder worker #%d of %d",
+                                   self._workers, self._size)
+
+        return future
+
+    def stats(self):
+        """
+        Returns a dict with the pool's size, how many jobs are running
+        and queued right now, totals for the jobs finished and failed
+        and the seconds they spent running and waiting in the queue, and
+        the throughput in jobs per second over the last RATE_SECS.
+        """
+
+        with self._condition:
+            self._prune(time())
+
+            return dict(
+                self._totals,
+                size=self._size,
+                running=self._workers - self._idle,
+                queued=len(self._queue),
+                rate=len(self._recent) / float(RATE_SECS),
+            )
+
+    def _prune(self, now):
+        """Forgets finish times from before the last RATE_SECS."""
+
+        while self._recent and self._recent[0] < now - RATE_SECS:
+            self._recent.popleft()
+
+    def _work(self):
+        """Runs queued jobs, one after another, for as long as needed."""
+
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._idle += 1
+                    self._condition.wait()
+                    self._idle -= 1
+                future, job, args, kwargs, queued = self._queue.popleft()
+
+            started = time()
+            try:
+                outcome = dict(result=job(*args, **kwargs))
+            except Exception:  # catch all, pylint:disable=W0703
+                from sys import exc_info
+                outcome = dict(exc_info=exc_info())
+            finished = time()
+
+            with self._condition:
+                self._totals['jobs'] += 1
+                if 'exc_info' in outcome:
+                    self._totals['failures'] += 1
+                self._totals['busy_secs'] += finished - started
+                self._totals['wait_secs'] += started - queued
+                self._recent.append(finished)
+                self._prune(finished)
+
+            future.finish(**outcome)  # n.b. after the totals, for stats()
+            del outcome  # i.e. do not hold onto a traceback while idle
+
+
+class Future(object):
+    """
+    Stands in for the result of a job submitted to a Transcoder until
+    the job has finished.
+    """
+
+    __slots__ = [
+        '_event',     # Event that is set once the job has finished
+        '_exc_info',  # exception from the job, if it raised one
+        '_result',    # return value from the job, if it returned one
+    ]
+
+    def __init__(self):
+        self._event = Event()
+        self._exc_info = None
+        self._result = None
+
+    def done(self):
+        """Returns True if the job has finished."""
+
+        return self._event.is_set()
+
+    def result(self):
+        """
+        Waits for the job to finish, then returns what it returned or
+        re-raises (with its original traceback) what it raised.
+        """
+
+        self._event.wait()
+        if self._exc_info:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def finish(self, result=None, exc_info=None):
+        """Called from the Transcoder when the job has finished."""
+
+        self._result = result
+        self._exc_info = exc_info
+        self._event.set()
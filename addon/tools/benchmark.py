@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+
+# AwesomeTTS text-to-speech add-on for Anki
+#
+# Copyright (C) 2014-2016  Anki AwesomeTTS Development Team
+# Copyright (C) 2014-2016  Dave Shifflett
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Throughput benchmark for the web services, replayed from fixtures
+
+Runs each service's recorded inputs over and over against the StandIn
+server, from several threads at once, and reports clips per second,
+latency percentiles, and bytes received, so that a change to the
+networking code can be measured on a machine with no network:
+
+    $ python2 tools/benchmark.py                  (every fixture)
+    $ python2 tools/benchmark.py oxford yandex -c 8 -n 100
+    $ python2 tools/benchmark.py --latency 0.2 --errors 0.05 --reactor
+
+Services whose modules cannot be imported outside of Anki are skipped
+(e.g. Duden needs the BeautifulSoup that ships with Anki, so put Anki's
+source on the PYTHONPATH to include it), as are services that need a
+missing binary (e.g. lame) to finish a clip. Unless the --limited flag
+is given, the services' rate limiters are opened up so that it is the
+networking code being measured, not the limiter's delays.
+
+With --record, each service is instead run once for each of its inputs
+against the live site, and if they all succeed, its fixture's exchanges
+are replaced with what came back. A new fixture can be started as a
+file with just its "runs" (see replay.py for the format). The ISpeech
+fixture's API key is a placeholder; put a real one in to record it.
+
+The exit status is 1 if any clip failed without failures having been
+injected (i.e. a regression), or 0 otherwise.
+"""
+
+from argparse import ArgumentParser
+from distutils.spawn import find_executable
+from importlib import import_module
+import logging
+import os
+from Queue import Empty, Queue
+import shutil
+import sys
+from tempfile import mkdtemp
+from threading import Lock, Thread
+from time import time
+
+from replay import (FIXTURES, Recorder, StandIn, load_addon, load_fixture,
+                    replaying, save_fixture)
+
+
+AGENT = 'AwesomeTTS/benchmark'
+WEB = 'https://ankiatts.appspot.com'  # same as in awesometts/__init__.py
+
+LAME_FLAGS = '--quiet -q 2'  # default from the add-on's configuration
+
+OPEN_RATE = 1e6  # rate and burst that the limiters get w/o --limited
+
+PERCENTILES = [50, 90, 99]
+
+
+def main():
+    """Parses the command line and runs the benchmark or recording."""
+
+    parser = ArgumentParser(description="Benchmarks the web services "
+                                        "offline from recorded fixtures.")
+    parser.add_argument('services', nargs='*', metavar='SERVICE',
+                        help="fixture names (e.g. oxford); default is all")
+    parser.add_argument('-n', '--clips', type=int, default=20,
+                        help="clips to generate per service (default: 20)")
+    parser.add_argument('-c', '--concurrency', type=int, default=4,
+                        help="clips generated at once (default: 4)")
+    parser.add_argument('--latency', type=float, default=0,
+                        help="seconds the stand-in waits before answering")
+    parser.add_argument('--jitter', type=float, default=0,
+                        help="most extra seconds it randomly waits on top")
+    parser.add_argument('--errors', type=float, default=0,
+                        help="fraction of requests answered with a 503")
+    parser.add_argument('--resets', type=float, default=0,
+                        help="fraction of requests answered by a reset")
+    parser.add_argument('--gzip', action='store_true',
+                        help="gzip text responses for clients that accept it")
+    parser.add_argument('--reactor', action='store_true',
+                        help="use the single network thread (Reactor)")
+    parser.add_argument('-t', '--transcoders', type=int, default=0,
+                        help="LAME runs at once (default: one per core)")
+    parser.add_argument('--limited', action='store_true',
+                        help="keep the services' own rate limits")
+    parser.add_argument('--record', action='store_true',
+                        help="re-record the fixtures from the live sites")
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help="log the add-on's debug messages")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(relativeCreated)8d %(threadName)-10s %(message)s',
+        level=logging.DEBUG if args.verbose else logging.WARNING,
+    )
+    logger = logging.getLogger('awesometts')
+
+    load_addon()
+    from awesometts.bundle import Bundle
+    from awesometts.connections import Connections
+    from awesometts.reactor import Reactor
+    from awesometts.responses import Responses
+    from awesometts.service.common import Trait
+    from awesometts.transcoder import Transcoder
+
+    names = args.services or sorted(
+        filename[:-len('.json')]
+        for filename in os.listdir(FIXTURES)
+        if filename.endswith('.json')
+    )
+    fixtures = {name: load_fixture(name) for name in names}
+    temp_dir = mkdtemp(prefix='awesometts-benchmark-')
+    transcoder = Transcoder(logger=logger, size=args.transcoders)
+
+    if args.record:
+        connections = Connections(logger=logger)
+        stand_in = None
+    else:
+        os.environ['no_proxy'] = ','.join(
+            filter(None, [os.environ.get('no_proxy'), '127.0.0.1'])
+        )
+        stand_in = StandIn(fixtures.values(), latency=args.latency,
+                           jitter=args.jitter, errors=args.errors,
+                           resets=args.resets, gzip=args.gzip)
+        stand_in.start()
+        if args.reactor:
+            connections = replaying(Reactor, stand_in.address)(
+                logger=logger,
+                enabled=lambda: True,
+            )
+        else:
+            connections = replaying(Connections, stand_in.address)(
+                logger=logger,
+            )
+
+    def build(name, connections):
+        """Returns an instance of the fixture's service."""
+
+        module = import_module('awesometts.service.' + name)
+        service_class = getattr(module, module.__all__[0])
+        if not (args.limited or args.record):
+            service_class = type(service_class.__name__, (service_class,),
+                                 dict(__slots__=[], NET_BURST=OPEN_RATE,
+                                      NET_RATE=OPEN_RATE,
+                                      NET_RATE_MAX=OPEN_RATE))
+
+        return service_class(
+            temp_dir=temp_dir,
+            lame_flags=lambda: LAME_FLAGS,
+            normalize=normalize,
+            logger=logger,
+            ecosystem=Bundle(web=WEB, agent=AGENT),
+            connections=connections,
+            responses=Responses(
+                db=Bundle(path=os.path.join(temp_dir, 'responses.db'),
+                          table=name),
+                logger=logger,
+            ),
+            transcoder=transcoder,
+        )
+
+    regressed = False
+    if not args.record:
+        print_row("service", "clips", "ok", "clips/s",
+                  *["p%d ms" % percentile for percentile in PERCENTILES] +
+                  ["KiB", "netops"])
+
+    try:
+        for name in names:
+            fixture = fixtures[name]
+            if fixture.get('skip'):
+                print "%-12s skipped: %s" % (name, fixture['skip'])
+                continue
+
+            try:
+                if args.record:
+                    recorder = Recorder(connections)
+                    service = build(name, recorder)
+                else:
+                    service = build(name, connections)
+            except ImportError as import_error:
+                print "%-12s skipped: %s" % (name, import_error)
+                continue
+
+            if Trait.TRANSCODING in service.TRAITS and \
+                    not find_executable(service.CLI_LAME):
+                print "%-12s skipped: %s is not installed" % (
+                    name, service.CLI_LAME)
+                continue
+
+            if args.record:
+                failures = record(service, fixture, temp_dir)
+                if failures:
+                    print "%-12s not recorded; kept the old fixture" % name
+                else:
+                    fixture['exchanges'] = recorder.exchanges
+                    save_fixture(name, fixture)
+                    print "%-12s recorded %d exchange(s)" % (
+                        name, len(recorder.exchanges))
+
+            else:
+                result = measure(service, fixture['runs'], args.clips,
+                                 args.concurrency, temp_dir)
+                failures = result['failures']
+                print_row(name, args.clips, result['ok'],
+                          "%.1f" % result['rate'],
+                          *["%.0f" % (latency * 1000)
+                            for latency in result['latencies']] +
+                          ["%.1f" % (result['bytes'] / 1024.0),
+                           result['netops']])
+
+            for message, count in sorted(failures.items()):
+                print "%12s %dx %s" % ("", count, message)
+            if failures and not (args.errors or args.resets):
+                regressed = True
+
+    finally:
+        if stand_in:
+            stand_in.stop()
+            print
+            print "stand-in: %s" % ", ".join(
+                "%d %s" % (count, name)
+                for name, count in sorted(stand_in.counts.items())
+            )
+        stats = transcoder.stats()
+        if stats['jobs']:
+            print "transcoder: %d job(s) on %d worker(s), %d failed, " \
+                "%.1fs busy, %.1fs queued, %.1f job(s)/s lately" % (
+                    stats['jobs'], stats['size'], stats['failures'],
+                    stats['busy_secs'], stats['wait_secs'], stats['rate'])
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return 1 if regressed else 0
+
+
+def measure(service, runs, clips, concurrency, temp_dir):
+    """
+    Generates the given number of clips from the service's runs, from
+    the given number of threads at once, and returns a dict with the
+    clips per second, latency percentiles, bytes and operations used,
+    number of clips that came out, and failures (by message).
+    """
+
+    queue = Queue()
+    for number in range(clips):
+        queue.put(number)
+
+    lock = Lock()
+    totals = dict(bytes=0, netops=0, ok=0)
+    latencies = []
+    failures = {}
+
+    def work():
+        """Generates clips until there are none left."""
+
+        while True:
+            try:
+                number = queue.get_nowait()
+            except Empty:
+                return
+
+            run = runs[number % len(runs)]
+            path = os.path.join(temp_dir, 'clip%d.mp3' % number)
+            service.stats_reset()
+            started = time()
+
+            try:
+                service.run(service.modify(run['text']),
+                            run_options(service, run), path)
+                failure = None if os.path.getsize(path) else "empty clip"
+            except Exception as exception:  # catch all, pylint:disable=W0703
+                failure = "%s: %s" % (type(exception).__name__, exception)
+
+            elapsed = time() - started
+            stats = service.stats()
+
+            with lock:
+                latencies.append(elapsed)
+                totals['bytes'] += stats['net_bytes']
+                totals['netops'] += stats['netops']
+                if failure:
+                    failures[failure] = failures.get(failure, 0) + 1
+                else:
+                    totals['ok'] += 1
+
+    threads = [Thread(target=work, name='clips%d' % number)
+               for number in range(concurrency)]
+    started = time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time() - started
+
+    latencies.sort()
+    return dict(
+        totals,
+        rate=clips / elapsed,
+        latencies=[latencies[min(len(latencies) - 1,
+                                 len(latencies) * percentile // 100)]
+                   for percentile in PERCENTILES],
+        failures=failures,
+    )
+
+
+def record(service, fixture, temp_dir):
+    """
+    Runs the service once for each of the fixture's runs, returning its
+    failures (by message); a fixture is only rewritten if there are none.
+    """
+
+    failures = {}
+
+    for number, run in enumerate(fixture['runs']):
+        try:
+            service.run(service.modify(run['text']),
+                        run_options(service, run),
+                        os.path.join(temp_dir, 'record%d.mp3' % number))
+        except Exception as exception:  # catch all, pylint:disable=W0703
+            failure = "%s: %s" % (type(exception).__name__, exception)
+            failures[failure] = failures.get(failure, 0) + 1
+
+    return failures
+
+
+def run_options(service, run):
+    """
+    Returns the options for a run the way that the router would pass
+    them: transformed, and with defaults for any that were not given.
+    """
+
+    given = run.get('options', {})
+    options = {}
+
+    for option in service.options() + getattr(service, 'extras', list)():
+        key = option['key']
+        if key in given:
+            transform = option.get('transform', lambda value: value)
+            options[key] = transform(given[key])
+        elif 'default' in option:
+            options[key] = option['default']
+        else:
+            raise KeyError("the fixture has no %s option" % key)
+
+    return options
+
+
+def normalize(value):
+    """Same as awesometts.conversion.normalized_ascii(), without Qt."""
+
+    if isinstance(value, unicode):
+        value = value.encode('ascii', 'ignore')
+    elif not isinstance(value, basestring):
+        value = str(value)
+
+    return ''.join(char.lower() for char in value if char.isalnum())
+
+
+def print_row(name, *values):
+    """Prints a row of the results table."""
+
+    print "%-12s" % name + "".join("%9s" % (value,) for value in values)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
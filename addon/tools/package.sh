@@ -56,6 +56,7 @@ oldPwd=$PWD
 cd "$(dirname "$0")/.."
 
 echo 'Packing zip file...'
-zip -9R "$target" awesometts/LICENSE.txt awesometts/\*.mp3 \*.py \*.js
+zip -9R "$target" awesometts/LICENSE.txt awesometts/\*.mp3 \*.py \*.js \
+    -x tools/\*
 
 cd "$oldPwd"
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+# AwesomeTTS text-to-speech add-on for Anki
+#
+# Copyright (C) 2014-2016  Anki AwesomeTTS Development Team
+# Copyright (C) 2014-2016  Dave Shifflett
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Cross-check of the NumPy and audioop paths of audio.polish()
+
+Polishes the same set of synthetic clips (tones of different loudness
+between stretches of silence, in mono and stereo, at several sample
+rates, along with clips that are all silence or empty) both ways, for
+every combination of trimming and leveling, and reports any clip whose
+two results differ by more than rounding:
+
+    $ python2 tools/polish_check.py
+
+NumPy must be importable (e.g. on the PYTHONPATH) for there to be
+anything to compare. The exit status is 1 if any clip differs, 2 if
+NumPy is missing, or 0 otherwise.
+"""
+
+from array import array
+from importlib import import_module
+from math import pi, sin
+import sys
+
+from replay import load_addon
+
+
+RATES = [8000, 16000, 22050, 44100]
+
+# most that a sample may differ by: one for rounding, plus a small share
+# of its size, as audioop.rms() rounds each window's RMS to a whole number,
+# which throws off the audioop path's gain by up to about 0.01 dB
+TOLERANCE = 1
+GAIN_TOLERANCE = 0.001
+
+
+def clips():
+    """Returns a list of (description, (frames, channels, rate))."""
+
+    result = []
+
+    for rate in RATES:
+        for channels in [1, 2]:
+            for amplitude in [30, 300, 3000, 30000]:
+                for lead, tone, tail in [(0.5, 1, 0.5), (0, 0.5, 0),
+                                         (0.123, 0.2, 0.987)]:
+                    samples = array('h')
+                    for seconds, level in [(lead, 0), (tone, amplitude),
+                                           (tail, 0)]:
+                        for index in range(int(rate * seconds)):
+                            value = int(level * sin(2 * pi * 440 *
+                                                    index / rate))
+                            samples.extend([value] * channels)
+                    if sys.byteorder == 'big':
+                        samples.byteswap()
+                    result.append((
+                        "%d Hz, %d channel(s), amplitude %d, %.3fs/%.3fs/"
+                        "%.3fs" % (rate, channels, amplitude, lead, tone,
+                                   tail),
+                        (samples.tostring(), channels, rate),
+                    ))
+
+        result.append(("%d Hz, all silence" % rate,
+                       ('\0\0' * rate, 1, rate)))
+        result.append(("%d Hz, empty" % rate, ('', 1, rate)))
+
+    return result
+
+
+def compare(left, right):
+    """
+    Returns None if the two strings of 16-bit samples are the same
+    length and no pair of samples differs by more than the tolerance,
+    or a description of how they differ otherwise.
+    """
+
+    if len(left) != len(right):
+        return "lengths differ: %d vs. %d bytes" % (len(left), len(right))
+
+    for index, (a, b) in enumerate(zip(array('h', left), array('h', right))):
+        if abs(a - b) > TOLERANCE + GAIN_TOLERANCE * max(abs(a), abs(b)):
+            return "sample #%d differs: %d vs. %d" % (index, a, b)
+    return None
+
+
+def main():
+    """Polishes the clips both ways and reports any differences."""
+
+    load_addon()
+    audio = import_module('awesometts.service.audio')
+
+    if not audio.numpy:
+        print "NumPy is not installed, so there is nothing to compare."
+        return 2
+
+    cases = clips()
+    failures = 0
+
+    for trim in [True, False]:
+        for loudness in [True, False]:
+            numpy_results = audio._polish_numpy(  # pylint:disable=W0212
+                [clip for _, clip in cases], trim, loudness,
+            )
+
+            for (desc, clip), numpy_frames in zip(cases, numpy_results):
+                audioop_frames = audio._polish_audioop(  # see W0212 above
+                    clip[0], clip[1], clip[2], trim, loudness,
+                )
+                problem = compare(numpy_frames, audioop_frames)
+                if problem:
+                    failures += 1
+                    print "trim=%s loudness=%s, %s: %s" % (
+                        trim, loudness, desc, problem)
+
+    print "%d clip(s) compared %d ways, %d difference(s)" % (
+        len(cases), 4, failures)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
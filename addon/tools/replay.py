@@ -0,0 +1,468 @@
+# -*- coding: utf-8 -*-
+
+# AwesomeTTS text-to-speech add-on for Anki
+#
+# Copyright (C) 2014-2016  Anki AwesomeTTS Development Team
+# Copyright (C) 2014-2016  Dave Shifflett
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Recording and replaying the web traffic of services, without Anki
+
+A fixture is a JSON file in tools/fixtures/, named after the service's
+module (e.g. oxford.json), that looks like this:
+
+    {
+        "note": "where the responses came from (optional)",
+        "skip": "why the service cannot be replayed (optional)",
+        "runs": [
+            {"text": "hello", "options": {"voice": "en-GB"}}
+        ],
+        "exchanges": [
+            {
+                "method": "GET",
+                "url": "http://www.example.com/hello",
+                "data": null,
+                "status": 200,
+                "headers": ["Content-Type: text/html"],
+                "body": "<html>..."
+            }
+        ]
+    }
+
+The runs are the inputs that the service is called with. Each exchange
+is a request that was made along the way and the response that came
+back; a response body is given as "body" (text), "body_base64" (e.g.
+audio, or a compressed payload w/ its Content-Encoding header), or
+"body_file" (a file next to the fixture, so that fixtures can share
+sample audio).
+
+The StandIn server answers for every host in the fixtures at once, and
+replaying() makes a Connections (or Reactor) class that sends every
+request to it instead of to the real host, so services can be run with
+no changes and no network. Recorder wraps a live Connections pool to
+write new fixtures.
+"""
+
+from base64 import b64decode, b64encode
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+import imp
+import json
+import os
+from random import random
+import socket
+from SocketServer import ThreadingMixIn
+from StringIO import StringIO
+import struct
+import sys
+from threading import Lock, Thread
+from time import sleep
+from urllib2 import HTTPError
+from urlparse import urlsplit
+import zlib
+
+__all__ = ['FIXTURES', 'Recorder', 'StandIn', 'is_text', 'load_addon',
+           'load_fixture', 'replaying', 'save_fixture']
+
+
+ADDON = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ADDON, 'tools', 'fixtures')
+
+HOP_BY_HOP = ['connection', 'content-length', 'keep-alive',
+              'transfer-encoding']  # response headers not kept in fixtures
+TEXT_TYPES = ['application/javascript', 'application/json', 'text/']
+
+
+def load_addon():
+    """
+    Makes the add-on's modules importable without running the package
+    initialization in awesometts/__init__.py and service/__init__.py,
+    which need Anki and every service's dependencies. Returns the
+    awesometts.service package, from which a single service's module
+    can then be imported (e.g. with import_module()).
+    """
+
+    for name, path in [('awesometts', ['awesometts']),
+                       ('awesometts.service', ['awesometts', 'service'])]:
+        if name not in sys.modules:
+            package = imp.new_module(name)
+            package.__path__ = [os.path.join(ADDON, *path)]
+            sys.modules[name] = package
+
+    return sys.modules['awesometts.service']
+
+
+def load_fixture(name):
+    """
+    Returns the fixture for the given service module name, with each
+    exchange's headers split into [name, value] pairs and its body
+    decoded into a 'payload' string.
+    """
+
+    with open(os.path.join(FIXTURES, name + '.json')) as fixture_file:
+        fixture = json.load(fixture_file)
+
+    for exchange in fixture.setdefault('exchanges', []):
+        exchange['headers'] = [[part.strip() for part in header.split(':', 1)]
+                               for header in exchange['headers']]
+
+        if 'body_file' in exchange:
+            with open(os.path.join(FIXTURES, exchange['body_file']),
+                      'rb') as body_file:
+                exchange['payload'] = body_file.read()
+        elif 'body_base64' in exchange:
+            exchange['payload'] = b64decode(exchange['body_base64'])
+        else:
+            exchange['payload'] = exchange.get('body', u'').encode('utf-8')
+
+    return fixture
+
+
+def save_fixture(name, fixture):
+    """
+    Writes the fixture for the given service module name, storing each
+    exchange's 'payload' as text if it is an uncompressed text type, or
+    as base64 otherwise (unless the exchange has a body_file).
+    """
+
+    exchanges = []
+    for exchange in fixture['exchanges']:
+        exchange = dict(exchange)
+        payload = exchange.pop('payload')
+
+        if 'body_file' not in exchange:
+            try:
+                if not is_text(exchange['headers']):
+                    raise UnicodeError
+                exchange['body'] = payload.decode('utf-8')
+            except UnicodeError:
+                exchange['body_base64'] = b64encode(payload)
+
+        exchange['headers'] = ['%s: %s' % tuple(header)
+                               for header in exchange['headers']]
+        exchanges.append(exchange)
+
+    with open(os.path.join(FIXTURES, name + '.json'), 'w') as fixture_file:
+        json.dump(dict(fixture, exchanges=exchanges), fixture_file,
+                  indent=4, sort_keys=True, separators=(',', ': '))
+        fixture_file.write('\n')
+
+
+def is_text(headers):
+    """
+    Returns True if the given list of response headers is for a text
+    payload (e.g. HTML or JSON) that has not been compressed.
+    """
+
+    headers = {key.lower(): value for key, value in headers}
+    return 'content-encoding' not in headers and any(
+        headers.get('content-type', '').startswith(text_type)
+        for text_type in TEXT_TYPES
+    )
+
+
+def replaying(base, address):
+    """
+    Returns a subclass of the given Connections class (e.g. Connections
+    or Reactor) that sends every request to the stand-in server at the
+    given address instead, by moving the scheme and host of the real URL
+    into the path (e.g. http://127.0.0.1:8080/https/www.example.com/).
+    """
+
+    def _send(self, url, headers, data, method, timeout):
+        """Rewrites the URL to the stand-in's before sending it."""
+
+        scheme, host, path, query, _ = urlsplit(url)
+        return super(replayer, self)._send(
+            'http://%s/%s/%s%s%s' % (address, scheme, host, path or '/',
+                                     '?' + query if query else ''),
+            headers, data, method, timeout,
+        )
+
+    replayer = type('Replaying' + base.__name__, (base,),
+                    dict(__slots__=[], _send=_send))
+    return replayer
+
+
+class StandIn(ThreadingMixIn, HTTPServer):
+    """
+    Answers requests rewritten by a replaying() class with the recorded
+    responses from the given fixtures, on a free port on the loopback
+    interface, from a thread per connection (with keep-alive).
+
+    A request is matched to the recorded exchange with the same method,
+    URL, and data if there is one, then to one with the same URL, then
+    to one with the same scheme, host, and path (e.g. if a query string
+    has a timestamp in it); anything else gets a 404.
+
+    To see how services cope, each response can be held back for latency
+    seconds (plus up to jitter more), a fraction of requests can be
+    answered with a 503 (errors) or by resetting the connection (resets),
+    and text responses can be gzipped for clients that accept it.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, fixtures, latency=0, jitter=0, errors=0, resets=0,
+                 gzip=False):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), _Handler)
+
+        self.errors = errors
+        self.gzip = gzip
+        self.jitter = jitter
+        self.latency = latency
+        self.resets = resets
+
+        self.counts = dict(answered=0, errors=0, resets=0, unmatched=0)
+        self.lock = Lock()
+        self.paths = {}
+        for fixture in fixtures:
+            for exchange in fixture['exchanges']:
+                scheme, host, path, _, _ = urlsplit(exchange['url'])
+                self.paths.setdefault((scheme, host, path or '/'),
+                                      []).append(exchange)
+
+        self._thread = None
+
+    @property
+    def address(self):
+        """Returns the host:port that the server is listening on."""
+
+        return '%s:%d' % self.server_address
+
+    def start(self):
+        """Starts serving from a background thread."""
+
+        self._thread = Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops serving and closes the listening socket."""
+
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request, client_address):
+        """Ignores clients going away (e.g. closing a response early)."""
+
+        if not isinstance(sys.exc_info()[1], socket.error):
+            HTTPServer.handle_error(self, request, client_address)
+
+    def count(self, name):
+        """Adds one to the given count."""
+
+        with self.lock:
+            self.counts[name] += 1
+
+    def match(self, method, url, data):
+        """Returns the best recorded exchange for the request, or None."""
+
+        scheme, host, path, _, _ = urlsplit(url)
+        exchanges = self.paths.get((scheme, host, path or '/'), [])
+
+        for same in [lambda exchange: (exchange['method'] == method and
+                                       exchange['url'] == url and
+                                       exchange.get('data') == data),
+                     lambda exchange: exchange['url'] == url,
+                     lambda exchange: True]:
+            for exchange in exchanges:
+                if same(exchange):
+                    return exchange
+
+        return None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Answers one connection's requests for the StandIn server."""
+
+    protocol_version = 'HTTP/1.1'  # i.e. keep-alive
+
+    # send each response in one go, without waiting on Nagle's algorithm,
+    # so that the stand-in does not add delays of its own to the results
+    disable_nagle_algorithm = True
+    wbufsize = -1
+
+    def do_GET(self):  # name from BaseHTTPRequestHandler, pylint:disable=C0103
+        """Answers a GET request."""
+
+        self._answer()
+
+    do_HEAD = do_POST = do_GET
+
+    def _answer(self):
+        """Finds the recorded exchange for the request and replays it."""
+
+        server = self.server
+        length = int(self.headers.getheader('content-length') or 0)
+        data = self.rfile.read(length) if length else None
+
+        scheme, _, rest = self.path.lstrip('/').partition('/')
+        host, _, path = rest.partition('/')
+        url = '%s://%s/%s' % (scheme, host, path)
+
+        if server.latency or server.jitter:
+            sleep(server.latency + server.jitter * random())
+
+        if random() < server.resets:
+            server.count('resets')
+            self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
+                                       struct.pack('ii', 1, 0))
+            self.close_connection = 1
+            return
+
+        if random() < server.errors:
+            server.count('errors')
+            self._reply(503, [('Content-Type', 'text/plain')],
+                        "injected failure")
+            return
+
+        exchange = server.match(self.command, url, data)
+        if not exchange:
+            server.count('unmatched')
+            self._reply(404, [('Content-Type', 'text/plain')],
+                        "no recorded response for %s %s" %
+                        (self.command, url))
+            return
+
+        server.count('answered')
+        headers = exchange['headers']
+        payload = exchange['payload']
+
+        if server.gzip and payload and is_text(headers) and \
+                'gzip' in (self.headers.getheader('accept-encoding') or ''):
+            compressor = zlib.compressobj(6, zlib.DEFLATED,
+                                          16 + zlib.MAX_WBITS)
+            payload = compressor.compress(payload) + compressor.flush()
+            headers = headers + [['Content-Encoding', 'gzip']]
+
+        self._reply(exchange['status'], headers, payload)
+
+    def _reply(self, status, headers, payload):
+        """Sends the response, w/ a Content-Length so it can be kept."""
+
+        self.send_response(status)
+        for key, value in headers:
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(payload)
+
+    def log_message(self, *args):  # pylint:disable=W0221
+        """Keeps the server quiet; the benchmark reports on requests."""
+
+
+class Recorder(object):
+    """
+    Wraps a live Connections pool, passing requests on to it and noting
+    each one and its response (once its body has been read) for a new
+    fixture. Redirects are followed by the pool, so an exchange holds
+    the response from where the request ended up.
+    """
+
+    __slots__ = [
+        '_connections',  # the live Connections pool
+        'exchanges',     # list of exchanges recorded so far
+        '_lock',         # guards the exchanges
+    ]
+
+    def __init__(self, connections):
+        self._connections = connections
+        self._lock = Lock()
+        self.exchanges = []
+
+    def request(self, url, headers=None, data=None, method=None,
+                timeout=None):
+        """Makes the request on the live pool, recording it."""
+
+        method = method or ('POST' if data is not None else 'GET')
+
+        try:
+            response = self._connections.request(url, headers, data, method,
+                                                 timeout)
+
+        except HTTPError as http_error:
+            payload = http_error.read()
+            self.record(method, url, data, http_error.code,
+                        http_error.info(), payload)
+            raise HTTPError(http_error.url, http_error.code, http_error.msg,
+                            http_error.info(), StringIO(payload))
+
+        return _Recording(self, (method, url, data), response)
+
+    def record(self, method, url, data, status, info, payload):
+        """Notes an exchange, given the response's mimetools.Message."""
+
+        headers = []
+        for line in info.headers:
+            if line[:1].isspace() and headers:  # continuation line
+                headers[-1][1] += ' ' + line.strip()
+            elif ':' in line:
+                key, value = line.split(':', 1)
+                if key.strip().lower() not in HOP_BY_HOP:
+                    headers.append([key.strip(), value.strip()])
+
+        with self._lock:
+            self.exchanges.append(dict(method=method, url=url, data=data,
+                                       status=status, headers=headers,
+                                       payload=payload))
+
+
+class _Recording(object):
+    """
+    Wraps a response from the live pool, keeping a copy of its body to
+    be recorded once it has been read to its end or closed.
+    """
+
+    __slots__ = [
+        '_body',      # StringIO with the body read so far
+        '_recorder',  # the Recorder, until the exchange has been recorded
+        '_request',   # tuple of the method, URL, and data
+        '_response',  # the response from the live pool
+    ]
+
+    def __init__(self, recorder, request, response):
+        self._body = StringIO()
+        self._recorder = recorder
+        self._request = request
+        self._response = response
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def read(self, amount=None):
+        """Reads from the response, recording it at its end."""
+
+        payload = self._response.read(amount)
+        self._body.write(payload)
+        if not amount or not payload:
+            self._finish()
+        return payload
+
+    def close(self):
+        """Closes the response, recording what was read of it."""
+
+        self._finish()
+        self._response.close()
+
+    def _finish(self):
+        """Records the exchange, at most once."""
+
+        recorder, self._recorder = self._recorder, None
+        if recorder:
+            recorder.record(*self._request + (self._response.getcode(),
+                                              self._response.info(),
+                                              self._body.getvalue()))